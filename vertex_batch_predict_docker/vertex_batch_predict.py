@@ -1,6 +1,19 @@
 import argparse
+from datetime import datetime
+import os
+import tempfile
 
-from google.cloud import aiplatform
+import gcs_utils
+import incremental_predictions
+import job_poller
+import local_predictions
+import online_predictions
+import prediction_compaction
+import prediction_shards
+import rate_limiter
+import resource_index
+import telemetry
+import vertex_clients
 
 
 def parse_arguments(parser):
@@ -73,16 +86,25 @@ def parse_arguments(parser):
     )
     parser.add_argument(
         "--starting_replica_count",
-        help="Number of worker replicas to start with.",
+        help="Number of worker replicas to start with, per job if sharded.",
         type=int,
         default=1
     )
     parser.add_argument(
         "--max_replica_count",
-        help="Max number of worker replicas to scale to.",
+        help="Max number of worker replicas to scale to, per job if sharded.",
         type=int,
         default=1
     )
+    prediction_shards.add_shard_arguments(parser)
+    incremental_predictions.add_incremental_arguments(parser)
+    online_predictions.add_online_arguments(parser)
+    local_predictions.add_local_prediction_arguments(parser)
+    prediction_compaction.add_compaction_arguments(parser)
+    job_poller.add_polling_arguments(parser)
+    resource_index.add_index_arguments(parser)
+    rate_limiter.add_rate_limit_arguments(parser)
+    telemetry.add_telemetry_arguments(parser)
 
 
 def parse_command_line_arguments():
@@ -103,49 +125,774 @@ def parse_command_line_arguments():
     return arguments
 
 
-def batch_predict_from_deployed_model(arguments):
-    # Initialize.
-    aiplatform.init(
-        project=arguments["project"], location=arguments["region"]
+def build_batch_prediction_job(arguments, model_name, source_uris=None):
+    """Builds batch prediction job resource from arguments.
+
+    Args:
+        arguments: dict, command line arguments.
+        model_name: str, resource name of model.
+        source_uris: list, GCS URIs of input files, None uses gcs_source.
+
+    Returns:
+        Dictionary of batch prediction job resource.
+    """
+    return {
+        "display_name": arguments["job_display_name"],
+        "model": model_name,
+        "input_config": {
+            "instances_format": arguments["instances_format"],
+            "gcs_source": {"uris": source_uris or [arguments["gcs_source"]]}
+        },
+        "output_config": {
+            "predictions_format": arguments["predictions_format"],
+            "gcs_destination": {
+                "output_uri_prefix": arguments["gcs_destination_prefix"]
+            }
+        },
+        "dedicated_resources": {
+            "machine_spec": {"machine_type": arguments["machine_type"]},
+            "starting_replica_count": arguments["starting_replica_count"],
+            "max_replica_count": arguments["max_replica_count"]
+        }
+    }
+
+
+async def submit_and_wait_for_shards(arguments, shard_jobs):
+    """Submits shard jobs concurrently then waits on all of them from one loop.
+
+    Args:
+        arguments: dict, command line arguments.
+        shard_jobs: list, tuples of region and batch prediction job resource.
+
+    Returns:
+        List of dictionaries of per shard job name, state, error and output
+        directory.
+    """
+    # Imported here since asyncio is slow to import and single jobs skip it.
+    import asyncio
+
+    clients = {
+        region: vertex_clients.get_client("job_service", region, use_async=True)
+        for region in set(region for region, _ in shard_jobs)
+    }
+    semaphore = asyncio.Semaphore(arguments["max_concurrent_submissions"])
+
+    async def submit(region, batch_prediction_job):
+        async with semaphore:
+            response = await clients[region].create_batch_prediction_job(
+                parent=vertex_clients.get_parent(dict(arguments, region=region)),
+                batch_prediction_job=batch_prediction_job
+            )
+        print("Created batch prediction job {}".format(response.name))
+        return response.name
+
+    def get_client(job_name):
+        # Job names look like projects/p/locations/region/batchPredictionJobs/id.
+        return clients[job_name.split("/")[3]]
+
+    submissions = await asyncio.gather(
+        *[submit(region, job) for region, job in shard_jobs],
+        return_exceptions=True
+    )
+    watch_results = await job_poller.wait_for_jobs_async(
+        get_job=lambda name: get_client(name).get_batch_prediction_job(name=name),
+        job_names=[
+            job_name for job_name in submissions if isinstance(job_name, str)
+        ],
+        polling_config=job_poller.get_polling_config(arguments),
+        cancel_job=lambda name: get_client(name).cancel_batch_prediction_job(name=name),
+        max_concurrent_polls=arguments["max_concurrent_submissions"]
     )
 
-    # Get model ID.
-    model_id = arguments["model_id"]
-    if not model_id:
-        model_display_name = arguments["model_display_name"]
-        model_name_match = aiplatform.Model.list(
-            filter="display_name={}".format(model_display_name)
-        )
-        if not model_name_match:
-            print(
-                "Model with name {} does NOT exist!".format(
-                    model_display_name
+    results = []
+    for submission in submissions:
+        if not isinstance(submission, str):
+            results.append(
+                {
+                    "job_name": None,
+                    "state": None,
+                    "error": str(submission),
+                    "output_dir": None
+                }
+            )
+            continue
+        watch_result = watch_results[submission]
+        job = watch_result["job"]
+        results.append(
+            {
+                "job_name": submission,
+                "state": job_poller.get_state_name(job.state) if job else None,
+                "error": (
+                    str(watch_result["error"]) if watch_result["error"]
+                    else job.error.message or None
+                ),
+                "output_dir": (
+                    job.output_info.gcs_output_directory if job else None
+                )
+            }
+        )
+    return results
+
+
+def batch_predict_shards(arguments, model_client=None):
+    """Splits input over concurrent batch prediction jobs and merges outputs.
+
+    Input files are balanced over `shard_count` jobs, splitting large JSONL
+    and CSV files at line boundaries, and the jobs are spread over the shard
+    regions. Once all of them finish, their outputs are merged into
+    `gcs_destination_prefix` next to a manifest of every shard.
+
+    Args:
+        arguments: dict, command line arguments.
+        model_client: instance of `ModelServiceClient` of region to reuse,
+            if any.
+
+    Returns:
+        Dictionary of batch prediction result in "shards" mode, with the
+        manifest under "manifest_uri", or None if model does not exist in a
+        region.
+    """
+    assert arguments["instances_format"] != "bigquery" and arguments["predictions_format"] != "bigquery", \
+    "Sharded batch prediction reads and writes GCS files, not BigQuery."
+    regions = prediction_shards.get_regions(arguments)
+    assert len(regions) == 1 or not arguments["model_id"], \
+    "Model IDs are regional, use model_display_name to shard over regions."
+
+    # Find model in every region first, so nothing is copied for nothing.
+    model_names = {}
+    for region in regions:
+        region_arguments = dict(arguments, region=region)
+        parent = vertex_clients.get_parent(region_arguments)
+        model_id = resource_index.get_model_id(
+            region_arguments,
+            model_client if model_client is not None and region == arguments["region"]
+            else vertex_clients.get_client("model_service", region),
+            parent
+        )
+        if not model_id:
+            return
+        model_names[region] = "{}/models/{}".format(parent, model_id)
+
+    destination_prefix = arguments["gcs_destination_prefix"].rstrip("/")
+    staging_prefix = "{}/_shards".format(destination_prefix)
+    shards = prediction_shards.plan_shards(
+        prediction_shards.list_input_files(arguments["gcs_source"]),
+        arguments["instances_format"],
+        arguments["shard_count"],
+        arguments["shard_split_bytes"]
+    )
+    prediction_shards.stage_pieces(
+        shards,
+        "{}/inputs".format(staging_prefix),
+        arguments["instances_format"],
+        arguments["max_concurrent_submissions"]
+    )
+    print(
+        "Split input into {} shards of {} bytes.".format(
+            len(shards), [shard["size"] for shard in shards]
+        )
+    )
+
+    shard_jobs = []
+    for index, shard in enumerate(shards):
+        region = regions[index % len(regions)]
+        shard_arguments = dict(
+            arguments,
+            job_display_name="{}-shard-{:05d}".format(
+                arguments["job_display_name"], index
+            ),
+            gcs_destination_prefix="{}/shard-{:05d}".format(
+                staging_prefix, index
+            )
+        )
+        shard_jobs.append(
+            (
+                region,
+                build_batch_prediction_job(
+                    shard_arguments,
+                    model_names[region],
+                    sorted(set(piece["staged_uri"] for piece in shard["pieces"]))
                 )
             )
+        )
+
+    import asyncio
+
+    shard_results = asyncio.run(
+        submit_and_wait_for_shards(arguments, shard_jobs)
+    )
+    completed_state = job_poller.get_state_name(job_poller.completed_state)
+    for index, (shard, (region, _), shard_result) in enumerate(
+        zip(shards, shard_jobs, shard_results)
+    ):
+        shard_result.update(
+            {
+                "shard": index,
+                "region": region,
+                "size": shard["size"],
+                "inputs": shard["pieces"]
+            }
+        )
+        print(
+            "Shard {} job {} in {} state = {}".format(
+                index, shard_result["job_name"], region, shard_result["state"]
+            )
+        )
+    completed_results = [
+        shard_result for shard_result in shard_results
+        if shard_result["state"] == completed_state
+    ]
+    for shard_result, output_uris in zip(
+        completed_results,
+        prediction_shards.merge_outputs(
+            completed_results,
+            destination_prefix,
+            arguments["max_concurrent_submissions"]
+        )
+    ):
+        shard_result["output_uris"] = output_uris
+    manifest_uri = prediction_shards.write_manifest(
+        destination_prefix, arguments, shard_results
+    )
+    print("Wrote manifest {}".format(manifest_uri))
+
+    assert len(completed_results) == len(shard_results), \
+    "{} of {} shard jobs did not complete successfully, see {}.".format(
+        len(shard_results) - len(completed_results),
+        len(shard_results),
+        manifest_uri
+    )
+    # Staged pieces and raw shard outputs are only kept to debug failures.
+    prediction_shards.delete_files(
+        gcs_utils.list_uris("{}/**".format(staging_prefix)),
+        arguments["max_concurrent_submissions"]
+    )
+    return {
+        "mode": "shards",
+        "job_names": [shard_result["job_name"] for shard_result in shard_results],
+        "output_uris": [
+            uri for shard_result in shard_results
+            for uri in shard_result["output_uris"]
+        ],
+        "manifest_uri": manifest_uri
+    }
+
+
+def batch_predict_incremental(arguments, model_client=None, job_client=None):
+    """Scores only new or changed instances and stitches in earlier predictions.
+
+    Input instances are streamed and hashed by content. Those missing from
+    the sorted hashes of earlier runs go into a delta input file, which is
+    batch predicted, as shards if configured. Earlier predictions of
+    instances still in the input are combined with the delta's into
+    complete predictions in `gcs_destination_prefix`. Files an earlier
+    run copied there and this one didn't are deleted, nothing else is.
+
+    Args:
+        arguments: dict, command line arguments.
+        model_client: instance of `ModelServiceClient` to reuse, if any.
+        job_client: instance of `JobServiceClient` to reuse, if any.
+
+    Returns:
+        Dictionary of batch prediction result in "incremental" mode, with
+        the state file under "state_uri", or None if model does not exist.
+    """
+    assert arguments["instances_format"] == "jsonl" and arguments["predictions_format"] == "jsonl", \
+    "Incremental batch prediction needs JSONL instances and predictions."
+    if model_client is None:
+        model_client = vertex_clients.get_client(
+            "model_service", arguments["region"]
+        )
+    parent = vertex_clients.get_parent(arguments)
+    model_id = resource_index.get_model_id(arguments, model_client, parent)
+    if not model_id:
+        return
+    model_name = "{}/models/{}".format(parent, model_id)
+
+    state_uri = arguments["incremental_state_uri"].rstrip("/")
+    state = incremental_predictions.read_state(state_uri)
+    # Only files earlier runs wrote are ever replaced in the destination.
+    previous_destination_uris = (
+        state.get("destination_uris", []) if state else []
+    )
+    if state and arguments["incremental_full_refresh"]:
+        print("Rescoring every instance, as asked to.")
+        state = None
+    elif state and state["model_name"] != model_name:
+        print(
+            "Rescoring every instance, model changed from {} to {}.".format(
+                state["model_name"], model_name
+            )
+        )
+        state = None
+
+    run_uri = "{}/runs/{}".format(
+        state_uri, datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    )
+    delta_uri = "{}/delta/instances.jsonl".format(run_uri)
+    scored_hashes = (
+        state["hashes"] if state
+        else incremental_predictions.hash_array([])
+    )
+    input_hashes, delta_count = incremental_predictions.write_delta(
+        [
+            uri for uri, _ in prediction_shards.list_input_files(
+                arguments["gcs_source"]
+            )
+        ],
+        scored_hashes,
+        delta_uri,
+        arguments["incremental_batch_rows"]
+    )
+    print(
+        "{} of {} distinct instances are new or changed.".format(
+            delta_count, len(input_hashes)
+        )
+    )
+
+    delta_result = None
+    delta_prediction_uris = []
+    if delta_count:
+        delta_prefix = "{}/delta_predictions".format(run_uri)
+        delta_arguments = dict(
+            arguments,
+            gcs_source=delta_uri,
+            gcs_destination_prefix=delta_prefix,
+            incremental_state_uri=""
+        )
+        if len(prediction_shards.get_regions(arguments)) == 1:
+            delta_arguments["model_id"] = model_id
+        delta_result = batch_predict_from_deployed_model(
+            delta_arguments, model_client, job_client
+        )
+        assert delta_result, "Model to batch predict with does NOT exist."
+        delta_prediction_uris = get_prediction_uris(delta_result)
+
+    prediction_uris, hashes = incremental_predictions.stitch_predictions(
+        state["prediction_uris"] if state else [],
+        input_hashes,
+        delta_prediction_uris,
+        "{}/predictions".format(run_uri),
+        arguments["incremental_batch_rows"]
+    )
+    print(
+        "Stitched predictions of {} instances, {} unscored.".format(
+            len(hashes), len(input_hashes) - len(hashes)
+        )
+    )
+
+    # Replace complete predictions in the destination.
+    destination_prefix = arguments["gcs_destination_prefix"].rstrip("/")
+    destination_uris = []
+    for uri in prediction_uris:
+        destination_uris.append(
+            "{}/{}".format(destination_prefix, os.path.basename(uri))
+        )
+        gcs_utils.copy(uri, destination_uris[-1])
+    prediction_shards.delete_files(
+        [
+            uri for uri in previous_destination_uris
+            if uri.startswith(destination_prefix + "/")
+            and uri not in destination_uris
+        ],
+        arguments["max_concurrent_submissions"]
+    )
+
+    new_state_uri = incremental_predictions.write_state(
+        state_uri,
+        run_uri,
+        model_name,
+        prediction_uris,
+        destination_uris,
+        hashes,
+        delta_count
+    )
+    # Earlier runs aren't needed once the state points at this one.
+    prediction_shards.delete_files(
+        [
+            uri for uri in gcs_utils.list_uris("{}/runs/**".format(state_uri))
+            if not uri.startswith(run_uri + "/")
+        ] + gcs_utils.list_uris("{}/delta/**".format(run_uri))
+        + gcs_utils.list_uris("{}/delta_predictions/**".format(run_uri)),
+        arguments["max_concurrent_submissions"]
+    )
+    return {
+        "mode": "incremental",
+        "job_names": delta_result["job_names"] if delta_result else [],
+        "output_uris": destination_uris,
+        "state_uri": new_state_uri,
+        "delta_count": delta_count
+    }
+
+
+def get_online_endpoint_name(arguments, model_name, endpoint_client, parent):
+    """Gets endpoint that serves all its traffic with the model, if any.
+
+    Args:
+        arguments: dict, command line arguments.
+        model_name: str, resource name of model.
+        endpoint_client: instance of `EndpointServiceClient`.
+        parent: str, parent resource name of endpoint.
+
+    Returns:
+        Resource name of endpoint or None if it doesn't exist or also serves
+        other models.
+    """
+    endpoint_name = None
+    if arguments["online_endpoint_id"]:
+        endpoint_name = "{}/endpoints/{}".format(
+            parent, arguments["online_endpoint_id"]
+        )
+    elif arguments["online_endpoint_display_name"]:
+        endpoint_name = resource_index.find_resource_name(
+            arguments,
+            "endpoints",
+            endpoint_client,
+            parent,
+            arguments["online_endpoint_display_name"]
+        )
+    if not endpoint_name:
+        print("No endpoint to predict online with.")
+        return None
+
+    endpoint = endpoint_client.get_endpoint(name=endpoint_name)
+    model_deployed_model_ids = set(
+        deployed_model.id for deployed_model in endpoint.deployed_models
+        if deployed_model.model == model_name
+    )
+    # Predictions are routed by traffic split, so other models must get none.
+    serving_ids = set(
+        deployed_model_id
+        for deployed_model_id, percentage in endpoint.traffic_split.items()
+        if percentage
+    )
+    if not serving_ids or not serving_ids <= model_deployed_model_ids:
+        print(
+            "Endpoint {} doesn't serve all traffic with model {}.".format(
+                endpoint_name, model_name
+            )
+        )
+        return None
+    return endpoint_name
+
+
+def batch_predict_online(arguments, model_client=None, endpoint_client=None):
+    """Predicts small inputs with an online endpoint instead of a batch job.
+
+    Batch jobs spend minutes provisioning workers, so inputs of at most
+    `online_max_instances` instances are sent to an endpoint the model is
+    already deployed to, in concurrent batched requests. Predictions keep
+    input order and are written in the layout of a batch job.
+
+    Args:
+        arguments: dict, command line arguments.
+        model_client: instance of `ModelServiceClient` to reuse, if any.
+        endpoint_client: instance of `EndpointServiceClient` to reuse, if
+            any.
+
+    Returns:
+        Dictionary of batch prediction result in "online" mode, with the
+        output directory under "output_dir", or None if input isn't eligible
+        and a batch job should be used instead.
+    """
+    if arguments["instances_format"] not in online_predictions.online_instances_formats or arguments["predictions_format"] not in online_predictions.online_predictions_formats:
+        print("Only JSONL and CSV can be predicted online, using a batch job.")
+        return None
+    if arguments["predictions_format"] == "csv" and arguments["instances_format"] != "csv":
+        print("CSV predictions need CSV instances to predict online, using a batch job.")
+        return None
+    small_input = online_predictions.read_small_input(
+        [
+            uri for uri, _ in prediction_shards.list_input_files(
+                arguments["gcs_source"]
+            )
+        ],
+        arguments["instances_format"],
+        arguments["online_max_instances"]
+    )
+    if small_input is None:
+        print(
+            "Input has more than {} instances, using a batch job.".format(
+                arguments["online_max_instances"]
+            )
+        )
+        return None
+    instances, header = small_input
+
+    if model_client is None:
+        model_client = vertex_clients.get_client(
+            "model_service", arguments["region"]
+        )
+    if endpoint_client is None:
+        endpoint_client = vertex_clients.get_client(
+            "endpoint_service", arguments["region"]
+        )
+    parent = vertex_clients.get_parent(arguments)
+    model_id = resource_index.get_model_id(arguments, model_client, parent)
+    if not model_id:
+        return None
+    endpoint_name = get_online_endpoint_name(
+        arguments,
+        "{}/models/{}".format(parent, model_id),
+        endpoint_client,
+        parent
+    )
+    if not endpoint_name:
+        return None
+
+    print(
+        "Predicting {} instances online with endpoint {}.".format(
+            len(instances), endpoint_name
+        )
+    )
+    import asyncio
+
+    async def predict():
+        client = vertex_clients.get_client(
+            "prediction_service", arguments["region"], use_async=True
+        )
+        return await online_predictions.predict_instances(
+            client, endpoint_name, instances, arguments
+        )
+
+    results = asyncio.run(predict())
+    output_dir = "{}/prediction-{}-{}".format(
+        arguments["gcs_destination_prefix"].rstrip("/"),
+        arguments["model_display_name"] or model_id,
+        datetime.utcnow().strftime("%Y_%m_%dT%H_%M_%S_%f")
+    )
+    prediction_count, error_count = online_predictions.write_outputs(
+        output_dir, arguments["predictions_format"], header, results
+    )
+    print(
+        "Wrote {} predictions and {} errors to {}".format(
+            prediction_count, error_count, output_dir
+        )
+    )
+    assert prediction_count or not results, \
+    "Every online prediction failed, see {}.".format(output_dir)
+    return {
+        "mode": "online",
+        "job_names": [],
+        "output_uris": list_output_uris(output_dir),
+        "output_dir": output_dir
+    }
+
+
+def batch_predict_local(arguments, model_client=None):
+    """Predicts with the model artifact loaded in this process.
+
+    For sklearn and xgboost models, batch jobs spend most of their time
+    provisioning workers. Instead, input is streamed in chunks of
+    `local_chunk_rows` instances, predicted with vectorized calls across a
+    pool of worker processes and written in the layout of a batch job.
+
+    Args:
+        arguments: dict, command line arguments.
+        model_client: instance of `ModelServiceClient` to reuse, if any.
+
+    Returns:
+        Dictionary of batch prediction result in "local" mode, with the
+        output directory under "output_dir", or None if model does not
+        exist.
+    """
+    assert arguments["instances_format"] in online_predictions.online_instances_formats and arguments["predictions_format"] in online_predictions.online_predictions_formats, \
+    "Only JSONL and CSV can be predicted locally."
+    assert arguments["predictions_format"] == "jsonl" or arguments["instances_format"] == "csv", \
+    "CSV predictions need CSV instances to predict locally."
+
+    model_id = arguments["model_id"]
+    artifact_uri = arguments["local_artifact_uri"]
+    if not artifact_uri:
+        if model_client is None:
+            model_client = vertex_clients.get_client(
+                "model_service", arguments["region"]
+            )
+        parent = vertex_clients.get_parent(arguments)
+        model_id = resource_index.get_model_id(arguments, model_client, parent)
+        if not model_id:
             return
-        else:
-            model_id = model_name_match[0].name.split("/")[-1]
-    print("Model ID = {}".format(model_id))
-
-    # Fetch Model object.
-    model = aiplatform.Model(model_name=model_id)
-
-    # Call batch_predict method of Model.
-    batch_prediction_job = model.batch_predict(
-        instances_format=arguments["instances_format"],
-        predictions_format=arguments["predictions_format"],
-        job_display_name=arguments["job_display_name"],
-        gcs_source=arguments["gcs_source"],
-        gcs_destination_prefix=arguments["gcs_destination_prefix"],
-        model_parameters=None,
-        machine_type=arguments["machine_type"],
-        starting_replica_count=arguments["starting_replica_count"],
-        max_replica_count=arguments["max_replica_count"],
-        sync=True
+        artifact_uri = model_client.get_model(
+            name="{}/models/{}".format(parent, model_id)
+        ).artifact_uri
+        assert artifact_uri, "Model {} has no artifact_uri.".format(model_id)
+
+    output_dir = "{}/prediction-{}-{}".format(
+        arguments["gcs_destination_prefix"].rstrip("/"),
+        arguments["model_display_name"] or model_id or "local",
+        datetime.utcnow().strftime("%Y_%m_%dT%H_%M_%S_%f")
+    )
+    with tempfile.TemporaryDirectory() as local_dir:
+        model_path = local_predictions.download_artifact(
+            artifact_uri, local_dir
+        )
+        print("Predicting locally with {}.".format(model_path))
+        prediction_count, error_count = local_predictions.predict_files(
+            arguments,
+            model_path,
+            [
+                uri for uri, _ in prediction_shards.list_input_files(
+                    arguments["gcs_source"]
+                )
+            ],
+            output_dir
+        )
+    print(
+        "Wrote {} predictions and {} errors to {}".format(
+            prediction_count, error_count, output_dir
+        )
+    )
+    assert prediction_count or not error_count, \
+    "Every local prediction failed, see {}.".format(output_dir)
+    return {
+        "mode": "local",
+        "job_names": [],
+        "output_uris": list_output_uris(output_dir),
+        "output_dir": output_dir
+    }
+
+
+def batch_predict_from_deployed_model(arguments, model_client=None, job_client=None):
+    """Runs batch prediction job of model and waits for it.
+
+    Args:
+        arguments: dict, command line arguments.
+        model_client: instance of `ModelServiceClient` to reuse, if any.
+        job_client: instance of `JobServiceClient` to reuse, if any.
+
+    Returns:
+        Dictionary of batch prediction result or None if model does not
+        exist. Whatever the mode, "mode" is one of "job", "shards",
+        "incremental", "online" or "local", "job_names" lists the resource
+        names of batch prediction jobs run, if any, and "output_uris" lists
+        the prediction and error files written. Modes add the manifest,
+        state or output directory they wrote.
+    """
+    if arguments["incremental_state_uri"]:
+        return batch_predict_incremental(arguments, model_client, job_client)
+    if arguments["prediction_backend"] == "local":
+        return batch_predict_local(arguments, model_client)
+    if arguments["online_max_instances"] > 0:
+        result = batch_predict_online(arguments, model_client)
+        if result:
+            return result
+    if arguments["shard_count"] > 1:
+        return batch_predict_shards(arguments, model_client)
+
+    # Initialize.
+    if model_client is None:
+        model_client = vertex_clients.get_client(
+            "model_service", arguments["region"]
+        )
+    parent = vertex_clients.get_parent(arguments)
+
+    # Get model ID.
+    model_id = resource_index.get_model_id(arguments, model_client, parent)
+    if not model_id:
+        return
+
+    # Create batch prediction job of model.
+    if job_client is None:
+        job_client = vertex_clients.get_client(
+            "job_service", arguments["region"]
+        )
+    response = job_client.create_batch_prediction_job(
+        parent=parent,
+        batch_prediction_job=build_batch_prediction_job(
+            arguments, "{}/models/{}".format(parent, model_id)
+        )
+    )
+    print("Created batch prediction job {}".format(response.name))
+
+    # Wait for job to terminate.
+    batch_prediction_job, timeline = job_poller.wait_for_job(
+        get_job=lambda name: job_client.get_batch_prediction_job(name=name),
+        job_name=response.name,
+        polling_config=job_poller.get_polling_config(arguments),
+        cancel_job=lambda name: job_client.cancel_batch_prediction_job(name=name)
     )
     print("Batch prediction job = {}".format(batch_prediction_job))
+    print("Job timeline = {}".format(timeline))
+    assert batch_prediction_job.state == job_poller.completed_state, \
+    "Job did not complete successfully."
+
+    # Jobs writing to BigQuery have no output directory.
+    output_dir = batch_prediction_job.output_info.gcs_output_directory
+    return {
+        "mode": "job",
+        "job_names": [response.name],
+        "output_uris": list_output_uris(output_dir) if output_dir else [],
+        "output_dir": output_dir
+    }
+
+
+def list_output_uris(output_dir):
+    """Lists files of an output directory of batch prediction.
+
+    Args:
+        output_dir: str, local or GCS output directory.
+
+    Returns:
+        Sorted list of URIs of files.
+    """
+    return sorted(gcs_utils.list_uris("{}/*".format(output_dir.rstrip("/"))))
+
+
+def get_prediction_uris(result):
+    """Gets prediction files written by batch prediction.
+
+    Args:
+        result: dict, result of `batch_predict_from_deployed_model`.
+
+    Returns:
+        Sorted list of URIs of prediction files.
+    """
+    return sorted(
+        uri for uri in result["output_uris"]
+        if prediction_compaction.is_prediction_file(uri)
+    )
+
+
+def compact_predictions(arguments, result):
+    """Compacts predictions of batch prediction into a few sorted files.
+
+    Args:
+        arguments: dict, command line arguments.
+        result: dict, result of `batch_predict_from_deployed_model`.
+
+    Returns:
+        List of URIs of compacted files.
+    """
+    input_uris = [
+        uri for uri, _ in prediction_shards.list_input_files(
+            arguments["gcs_source"]
+        )
+    ]
+    prediction_compaction.check_output_uri(
+        arguments["compact_output_uri"], input_uris
+    )
+    header = None
+    if arguments["instances_format"] == "csv":
+        header = prediction_compaction.read_csv_header(input_uris[0])
+    output_uris, _ = prediction_compaction.compact_predictions(
+        arguments, get_prediction_uris(result), header
+    )
+    return output_uris
+
+
+def run(arguments):
+    """Runs batch prediction job.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    rate_limiter.configure(arguments)
+    telemetry.configure(arguments, "vertex_batch_predict")
+    result = batch_predict_from_deployed_model(arguments)
+    if result and arguments["compact_output_uri"]:
+        compact_predictions(arguments, result)
 
 
 if __name__ == "__main__":
     arguments = parse_command_line_arguments()
-    batch_predict_from_deployed_model(arguments)
+    run(arguments)
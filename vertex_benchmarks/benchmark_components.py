@@ -0,0 +1,425 @@
+import argparse
+import contextlib
+import glob
+import importlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Components and shared modules live in sibling directories of the repo.
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [
+    path
+    for path in sorted(glob.glob(os.path.join(repo_dir, "vertex_*")))
+    if os.path.isdir(path)
+]
+
+import fake_vertex  # noqa: E402
+import gcs_utils  # noqa: E402
+import job_poller  # noqa: E402
+import vertex_clients  # noqa: E402
+
+
+project = "benchmark-project"
+region = "us-central1"
+model_display_name = "benchmark_model"
+training_image_uri = "us-docker.pkg.dev/vertex-ai/training/tf-cpu.2-8:latest"
+
+# Component module and arguments of each component scenario. Components
+# that need a model get one uploaded before measuring.
+component_scenarios = {
+    "train": {
+        "module": "vertex_train",
+        "argv": [
+            "--ml_framework=tensorflow",
+            "--job_display_name=benchmark_train",
+            "--pre_built_training_container_uri={}".format(training_image_uri),
+            "--model_package_gcs_path=gs://bucket/trainer.tar.gz",
+            "--python_module=trainer.task",
+            "--trainer_args={\"epochs\": 1}"
+        ],
+        "needs_model": False
+    },
+    "hptune": {
+        "module": "vertex_hptuning",
+        "argv": [
+            "--ml_framework=tensorflow",
+            "--job_display_name=benchmark_hptune",
+            "--pre_built_training_container_uri={}".format(training_image_uri),
+            "--model_package_gcs_path=gs://bucket/trainer.tar.gz",
+            "--python_module=trainer.task",
+            "--trainer_args={\"epochs\": 1}",
+            "--metric_id=loss",
+            "--parameters={}".format(
+                json.dumps(
+                    [
+                        {
+                            "parameter_id": "learning_rate",
+                            "double_value_spec": {
+                                "min_value": 0.0001, "max_value": 0.1
+                            },
+                            "scale_type": "UNIT_LOG_SCALE"
+                        }
+                    ]
+                )
+            ),
+            "--max_trial_count=10",
+            "--parallel_trial_count=2"
+        ],
+        "needs_model": False
+    },
+    "upload": {
+        "module": "vertex_upload_model",
+        "argv": [
+            "--ml_framework=tensorflow",
+            "--model_display_name=benchmark_upload",
+            "--artifact_uri=gs://bucket/model"
+        ],
+        "needs_model": False
+    },
+    "deploy": {
+        "module": "vertex_deploy",
+        "argv": [
+            "--endpoint_display_name=benchmark_endpoint",
+            "--model_display_name={}".format(model_display_name),
+            "--deployed_model_display_name=benchmark_deployed"
+        ],
+        "needs_model": True
+    },
+    "batch_predict": {
+        "module": "vertex_batch_predict",
+        "argv": [
+            "--model_display_name={}".format(model_display_name),
+            "--job_display_name=benchmark_batch_predict",
+            "--gcs_source=gs://bucket/instances.jsonl",
+            # Local, so listing the job's outputs needs no GCS client.
+            "--gcs_destination_prefix={}".format(
+                os.path.join(tempfile.gettempdir(), "benchmark_predictions")
+            )
+        ],
+        "needs_model": True
+    },
+    "export": {
+        "module": "vertex_export_model",
+        "argv": [
+            "--model_display_name={}".format(model_display_name),
+            "--destination_path=gs://bucket/export"
+        ],
+        "needs_model": True
+    },
+    "pipeline": {
+        "module": "vertex_pipeline",
+        "argv": [
+            "--stages=train,upload,deploy",
+            "--train_args={}".format(
+                json.dumps(
+                    {
+                        "ml_framework": "tensorflow",
+                        "job_display_name": "benchmark_pipeline",
+                        "pre_built_training_container_uri": training_image_uri,
+                        "model_package_gcs_path": "gs://bucket/trainer.tar.gz",
+                        "python_module": "trainer.task",
+                        "trainer_args": {"epochs": 1}
+                    }
+                )
+            ),
+            "--upload_args={}".format(
+                json.dumps(
+                    {
+                        "model_display_name": "benchmark_pipeline",
+                        "artifact_uri": "gs://bucket/model"
+                    }
+                )
+            ),
+            "--deploy_args={}".format(
+                json.dumps({"endpoint_display_name": "benchmark_pipeline"})
+            )
+        ],
+        "needs_model": False
+    }
+}
+
+# Study cancelled once it converges, polled often enough to see it
+# cancelling before it is cancelled.
+component_scenarios["hptune_converged"] = dict(
+    component_scenarios["hptune"],
+    argv=component_scenarios["hptune"]["argv"] + [
+        "--convergence_patience=2",
+        "--job_polling_backoff=1"
+    ]
+)
+
+# Polling arguments of each polling strategy, run against a training job.
+polling_strategies = {
+    "fixed": ["--job_polling_backoff=1", "--job_polling_jitter=0"],
+    "backoff": [],
+    "expected_duration": ["--expected_job_duration=900"]
+}
+
+
+def parse_command_line_arguments():
+    """Parses command line arguments and returns dictionary.
+
+    Returns:
+        Dictionary containing command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--components",
+        help="Comma separated components to benchmark. Empty skips them.",
+        type=str,
+        default=",".join(component_scenarios)
+    )
+    parser.add_argument(
+        "--polling_strategies",
+        help="Comma separated polling strategies to benchmark. Empty skips them.",
+        type=str,
+        default=",".join(polling_strategies)
+    )
+    parser.add_argument(
+        "--repeats",
+        help="Number of times to run each scenario.",
+        type=int,
+        default=5
+    )
+    parser.add_argument(
+        "--backend_config_path",
+        help="Local or GCS path of JSON overrides of the fake backend config, i.e. latencies, state progressions and injected failures.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--rpc_latency",
+        help="Simulated number of seconds each RPC takes, unless the backend config sets it.",
+        type=float,
+        default=0.05
+    )
+    parser.add_argument(
+        "--get_failure_rate",
+        help="Fraction of get calls failing with a transient 503 error, unless the backend config sets it.",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--output_path",
+        help="Local or GCS path to write JSON results to.",
+        type=str,
+        default=""
+    )
+    return parser.parse_args().__dict__
+
+
+def get_backend_config(arguments):
+    """Gets fake backend config from arguments.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of fake backend config overrides.
+    """
+    config = {
+        "latencies": {"default": arguments["rpc_latency"]},
+        "rpc_failures": {
+            method: {"rate": arguments["get_failure_rate"], "code": 503}
+            for method in [
+                "get_custom_job",
+                "get_hyperparameter_tuning_job",
+                "get_batch_prediction_job"
+            ]
+        }
+    }
+    if arguments["backend_config_path"]:
+        config.update(gcs_utils.read_json(arguments["backend_config_path"], {}))
+    return config
+
+
+def seed_model(backend):
+    """Uploads model that scenarios needing one look up by display name.
+
+    Args:
+        backend: instance of `fake_vertex.FakeVertexBackend`.
+    """
+    backend.get_client("model_service", region).upload_model(
+        parent="projects/{}/locations/{}".format(project, region),
+        model={"display_name": model_display_name}
+    ).result()
+
+
+def run_scenario(module_name, argv, backend_config, needs_model, trace_memory):
+    """Runs component once against a fresh fake backend.
+
+    Args:
+        module_name: str, name of component module.
+        argv: list, component arguments besides project and region.
+        backend_config: dict, fake backend config overrides.
+        needs_model: bool, whether to upload a model beforehand.
+        trace_memory: bool, whether to trace peak memory, which slows the run.
+
+    Returns:
+        Dictionary of metrics of run.
+    """
+    backend = fake_vertex.FakeVertexBackend(backend_config)
+    if needs_model:
+        seed_model(backend)
+    backend.rpc_counts.clear()
+    simulated_start = backend.clock.monotonic()
+    random.seed(backend.config["seed"])
+
+    module = importlib.import_module(module_name)
+    parser = argparse.ArgumentParser(prog=module_name)
+    module.parse_arguments(parser)
+
+    # Polling sleeps advance the virtual clock instead of blocking.
+    poller_time = job_poller.time
+    job_poller.time = backend.clock
+    vertex_clients.use_backend(backend)
+    try:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            arguments = parser.parse_args(
+                ["--project={}".format(project), "--region={}".format(region)]
+                + argv
+            ).__dict__
+            module.run(arguments)
+        wall_seconds = time.perf_counter() - start
+        peak_memory_bytes = None
+        if trace_memory:
+            peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        vertex_clients.use_backend(None)
+        job_poller.time = poller_time
+
+    # Lag between jobs ending and the component noticing.
+    detection_lags = [
+        job.detected_at - job.end_time.timestamp()
+        for kind in ["custom_job", "hyperparameter_tuning_job", "batch_prediction_job"]
+        for job in backend.resources[kind].values()
+        if job.detected_at is not None
+    ]
+    return {
+        "wall_seconds": wall_seconds,
+        "peak_memory_bytes": peak_memory_bytes,
+        "simulated_seconds": backend.clock.monotonic() - simulated_start,
+        "rpc_count": sum(
+            count for method, count in backend.rpc_counts.items()
+            if method != "create_client" and not method.endswith("_failed")
+        ),
+        "rpc_counts": dict(backend.rpc_counts),
+        "detection_lag_seconds": (
+            max(detection_lags) if detection_lags else None
+        )
+    }
+
+
+def benchmark_scenario(module_name, argv, backend_config, needs_model, repeats):
+    """Runs scenario repeatedly and summarizes its metrics.
+
+    Wall time is the median of untraced runs, peak memory comes from one
+    extra traced run. RPC counts are deterministic for a given seed.
+
+    Args:
+        module_name: str, name of component module.
+        argv: list, component arguments besides project and region.
+        backend_config: dict, fake backend config overrides.
+        needs_model: bool, whether to upload a model beforehand.
+        repeats: int, number of untraced runs.
+
+    Returns:
+        Dictionary of summarized metrics.
+    """
+    runs = [
+        run_scenario(module_name, argv, backend_config, needs_model, False)
+        for _ in range(repeats)
+    ]
+    traced_run = run_scenario(
+        module_name, argv, backend_config, needs_model, True
+    )
+    summary = dict(traced_run)
+    summary["wall_seconds"] = statistics.median(
+        run["wall_seconds"] for run in runs
+    )
+    summary["max_wall_seconds"] = max(run["wall_seconds"] for run in runs)
+    return summary
+
+
+def run_benchmark(arguments):
+    """Benchmarks components and polling strategies against the fake backend.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of component and polling strategy results.
+    """
+    backend_config = get_backend_config(arguments)
+    results = {"components": {}, "polling_strategies": {}}
+    for component in filter(None, arguments["components"].split(",")):
+        scenario = component_scenarios[component]
+        results["components"][component] = benchmark_scenario(
+            scenario["module"],
+            scenario["argv"],
+            backend_config,
+            scenario["needs_model"],
+            arguments["repeats"]
+        )
+
+    train_scenario = component_scenarios["train"]
+    for strategy in filter(None, arguments["polling_strategies"].split(",")):
+        results["polling_strategies"][strategy] = benchmark_scenario(
+            train_scenario["module"],
+            train_scenario["argv"] + polling_strategies[strategy],
+            backend_config,
+            False,
+            arguments["repeats"]
+        )
+    return results
+
+
+def format_results(results):
+    """Formats results as a table.
+
+    Args:
+        results: dict, component and polling strategy results.
+
+    Returns:
+        Table string.
+    """
+    lines = [
+        "{:<36}{:>12}{:>10}{:>12}{:>14}{:>12}".format(
+            "scenario", "wall_ms", "rpcs", "peak_kib", "simulated_s", "lag_s"
+        )
+    ]
+    for group, group_results in results.items():
+        for name, summary in group_results.items():
+            lag = summary["detection_lag_seconds"]
+            lines.append(
+                "{:<36}{:>12.2f}{:>10}{:>12.1f}{:>14.1f}{:>12}".format(
+                    "{}/{}".format(group, name),
+                    summary["wall_seconds"] * 1000,
+                    summary["rpc_count"],
+                    summary["peak_memory_bytes"] / 1024.0,
+                    summary["simulated_seconds"],
+                    "-" if lag is None else "{:.1f}".format(lag)
+                )
+            )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    arguments = parse_command_line_arguments()
+    results = run_benchmark(arguments)
+    print(format_results(results))
+    if arguments["output_path"]:
+        gcs_utils.write_text(
+            arguments["output_path"], json.dumps(results, indent=2)
+        )
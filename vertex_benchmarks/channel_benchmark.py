@@ -0,0 +1,158 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+# Shared modules live in a sibling directory of the repo.
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [
+    path
+    for path in sorted(glob.glob(os.path.join(repo_dir, "vertex_*")))
+    if os.path.isdir(path)
+]
+
+import gcs_utils  # noqa: E402
+import vertex_clients  # noqa: E402
+
+
+# Cheap list call of each service to time.
+service_methods = {
+    "job_service": "list_custom_jobs",
+    "model_service": "list_models",
+    "endpoint_service": "list_endpoints"
+}
+
+
+def parse_command_line_arguments():
+    """Parses command line arguments and returns dictionary.
+
+    Returns:
+        Dictionary containing command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--project",
+        help="GCP project to send RPCs to.",
+        type=str,
+        required=True
+    )
+    parser.add_argument(
+        "--region",
+        help="Region of Vertex AI API endpoint.",
+        type=str,
+        default="us-central1"
+    )
+    parser.add_argument(
+        "--services",
+        help="Comma separated services to benchmark.",
+        type=str,
+        default=",".join(service_methods)
+    )
+    parser.add_argument(
+        "--calls",
+        help="Number of calls to time per service and channel state.",
+        type=int,
+        default=20
+    )
+    parser.add_argument(
+        "--output_path",
+        help="Local or GCS path to write JSON results to.",
+        type=str,
+        default=""
+    )
+    return parser.parse_args().__dict__
+
+
+def time_call(service, arguments):
+    """Times one list call of service with a pooled client.
+
+    Args:
+        service: str, name of service, i.e. job_service.
+        arguments: dict, command line arguments.
+
+    Returns:
+        Number of seconds the call took, including creating the client.
+    """
+    start = time.perf_counter()
+    client = vertex_clients.get_client(service, arguments["region"])
+    next(
+        iter(
+            getattr(client, service_methods[service])(
+                request={
+                    "parent": vertex_clients.get_parent(arguments),
+                    "page_size": 1
+                }
+            )
+        ),
+        None
+    )
+    return time.perf_counter() - start
+
+
+def summarize(samples):
+    """Summarizes latency samples.
+
+    Args:
+        samples: list, seconds per call.
+
+    Returns:
+        Dictionary of median, p90 and max milliseconds.
+    """
+    samples = sorted(samples)
+    return {
+        "median_ms": statistics.median(samples) * 1000,
+        "p90_ms": samples[int(0.9 * (len(samples) - 1))] * 1000,
+        "max_ms": samples[-1] * 1000
+    }
+
+
+def run_benchmark(arguments):
+    """Times calls on cold channels, new for every call, and warm ones.
+
+    Cold calls pay for channel setup, the TLS handshake and fetching
+    credentials like a component creating a fresh client per operation.
+    Warm calls reuse the pooled channel after a first untimed call.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of cold and warm latency summaries keyed by service.
+    """
+    results = {}
+    for service in arguments["services"].split(","):
+        cold_samples = []
+        for _ in range(arguments["calls"]):
+            vertex_clients.clear_client_pool()
+            cold_samples.append(time_call(service, arguments))
+
+        vertex_clients.clear_client_pool()
+        time_call(service, arguments)
+        warm_samples = [
+            time_call(service, arguments) for _ in range(arguments["calls"])
+        ]
+        results[service] = {
+            "cold": summarize(cold_samples),
+            "warm": summarize(warm_samples)
+        }
+    return results
+
+
+if __name__ == "__main__":
+    arguments = parse_command_line_arguments()
+    results = run_benchmark(arguments)
+    for service, summaries in results.items():
+        print(
+            "{}: cold median = {:.1f}ms, warm median = {:.1f}ms".format(
+                service,
+                summaries["cold"]["median_ms"],
+                summaries["warm"]["median_ms"]
+            )
+        )
+    if arguments["output_path"]:
+        gcs_utils.write_text(
+            arguments["output_path"], json.dumps(results, indent=2)
+        )
@@ -0,0 +1,261 @@
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Shared modules live in a sibling directory of the repo.
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [
+    path
+    for path in sorted(glob.glob(os.path.join(repo_dir, "vertex_*")))
+    if os.path.isdir(path)
+]
+
+import gcs_utils  # noqa: E402
+import prediction_compaction  # noqa: E402
+
+
+def parse_command_line_arguments():
+    """Parses command line arguments and returns dictionary.
+
+    Returns:
+        Dictionary containing command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--input_files",
+        help="Number of prediction files to generate, like the shards of a batch prediction job.",
+        type=int,
+        default=200
+    )
+    parser.add_argument(
+        "--rows_per_file",
+        help="Number of predictions per generated file.",
+        type=int,
+        default=5000
+    )
+    parser.add_argument(
+        "--compact_formats",
+        help="Comma separated formats to compact into.",
+        type=str,
+        default=",".join(prediction_compaction.compact_formats)
+    )
+    parser.add_argument(
+        "--work_dir",
+        help="Local or GCS directory to generate predictions and compact them in. Empty uses a local temporary directory.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--repeats",
+        help="Number of times to compact each format.",
+        type=int,
+        default=3
+    )
+    parser.add_argument(
+        "--output_path",
+        help="Local or GCS path to write JSON results to.",
+        type=str,
+        default=""
+    )
+    prediction_compaction.add_compaction_arguments(parser)
+    return parser.parse_args().__dict__
+
+
+def generate_predictions(arguments, input_dir):
+    """Writes prediction files shaped like batch prediction job outputs.
+
+    Keys are shuffled across files, as jobs write predictions in whatever
+    order workers finish them.
+
+    Args:
+        arguments: dict, command line arguments.
+        input_dir: str, local or GCS directory to write files to.
+
+    Returns:
+        List of URIs of prediction files and their total size in bytes.
+    """
+    rng = random.Random(0)
+    keys = list(range(arguments["input_files"] * arguments["rows_per_file"]))
+    rng.shuffle(keys)
+    uris = []
+    total_bytes = 0
+    for index in range(arguments["input_files"]):
+        uri = "{}/prediction.results-{:05d}-of-{:05d}".format(
+            input_dir, index, arguments["input_files"]
+        )
+        text = "".join(
+            json.dumps(
+                {
+                    "instance": {
+                        "id": key,
+                        "features": [rng.random() for _ in range(4)]
+                    },
+                    "prediction": rng.random()
+                }
+            ) + "\n"
+            for key in keys[
+                index * arguments["rows_per_file"]:
+                (index + 1) * arguments["rows_per_file"]
+            ]
+        )
+        gcs_utils.write_text(uri, text)
+        uris.append(uri)
+        total_bytes += len(text)
+    return uris, total_bytes
+
+
+def time_reads(uris):
+    """Times reading files one at a time, like a downstream job would.
+
+    Args:
+        uris: list, local paths or GCS URIs of files.
+
+    Returns:
+        Number of seconds reading took.
+    """
+    start = time.perf_counter()
+    for uri in uris:
+        gcs_utils.read_bytes(uri)
+    return time.perf_counter() - start
+
+
+def run_compaction(arguments, uris, trace_memory):
+    """Compacts prediction files once.
+
+    Args:
+        arguments: dict, compaction arguments.
+        uris: list, local paths or GCS URIs of prediction files.
+        trace_memory: bool, whether to trace peak memory, which slows the run.
+
+    Returns:
+        Dictionary of metrics of run.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    output_uris, row_count = prediction_compaction.compact_predictions(
+        arguments, uris
+    )
+    wall_seconds = time.perf_counter() - start
+    peak_memory_bytes = None
+    if trace_memory:
+        peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "wall_seconds": wall_seconds,
+        "peak_memory_bytes": peak_memory_bytes,
+        "row_count": row_count,
+        "output_uris": output_uris
+    }
+
+
+def run_benchmark(arguments):
+    """Benchmarks compaction of generated predictions into each format.
+
+    Wall time is the median of untraced runs, peak memory comes from one
+    extra traced run. Reading the compacted files one at a time is timed
+    against reading the original ones, as downstream jobs would.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of results keyed by format.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = (arguments["work_dir"] or temp_dir).rstrip("/")
+        uris, input_bytes = generate_predictions(
+            arguments, "{}/predictions".format(work_dir)
+        )
+        input_read_seconds = time_reads(uris)
+        results = {}
+        for compact_format in arguments["compact_formats"].split(","):
+            compaction_arguments = dict(
+                arguments,
+                compact_output_uri="{}/compacted_{}".format(
+                    work_dir, compact_format
+                ),
+                compact_format=compact_format,
+                compact_key_field=arguments["compact_key_field"] or "id",
+                predictions_format="jsonl"
+            )
+            runs = [
+                run_compaction(compaction_arguments, uris, False)
+                for _ in range(arguments["repeats"])
+            ]
+            summary = run_compaction(compaction_arguments, uris, True)
+            summary["wall_seconds"] = statistics.median(
+                run["wall_seconds"] for run in runs
+            )
+            summary["max_wall_seconds"] = max(
+                run["wall_seconds"] for run in runs
+            )
+            summary["rows_per_second"] = (
+                summary["row_count"] / summary["wall_seconds"]
+            )
+            summary["input_mib_per_second"] = (
+                input_bytes / 2 ** 20 / summary["wall_seconds"]
+            )
+            summary["output_bytes"] = sum(
+                gcs_utils.get_sizes(uri)[uri]
+                for uri in summary["output_uris"]
+            )
+            summary["input_read_seconds"] = input_read_seconds
+            summary["output_read_seconds"] = time_reads(
+                summary.pop("output_uris")
+            )
+            summary["input_files"] = len(uris)
+            summary["input_bytes"] = input_bytes
+            results[compact_format] = summary
+        if arguments["work_dir"]:
+            for uri in gcs_utils.list_uris("{}/**".format(work_dir)):
+                gcs_utils.delete(uri)
+    return results
+
+
+def format_results(results):
+    """Formats results as a table.
+
+    Args:
+        results: dict, results keyed by format.
+
+    Returns:
+        Table string.
+    """
+    lines = [
+        "{:<10}{:>12}{:>14}{:>10}{:>12}{:>12}{:>14}{:>14}".format(
+            "format", "wall_ms", "rows_per_s", "mib_s", "peak_kib",
+            "out_kib", "read_in_ms", "read_out_ms"
+        )
+    ]
+    for compact_format, summary in results.items():
+        lines.append(
+            "{:<10}{:>12.1f}{:>14.0f}{:>10.1f}{:>12.1f}{:>12.1f}{:>14.1f}{:>14.1f}".format(
+                compact_format,
+                summary["wall_seconds"] * 1000,
+                summary["rows_per_second"],
+                summary["input_mib_per_second"],
+                summary["peak_memory_bytes"] / 1024.0,
+                summary["output_bytes"] / 1024.0,
+                summary["input_read_seconds"] * 1000,
+                summary["output_read_seconds"] * 1000
+            )
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    arguments = parse_command_line_arguments()
+    results = run_benchmark(arguments)
+    print(format_results(results))
+    if arguments["output_path"]:
+        gcs_utils.write_text(
+            arguments["output_path"], json.dumps(results, indent=2)
+        )
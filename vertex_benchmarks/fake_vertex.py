@@ -0,0 +1,701 @@
+import collections
+from datetime import datetime, timezone
+import itertools
+import random
+import re
+import time
+import types
+
+
+# Vertex AI JobState values, as in `job_poller`.
+JOB_STATE_QUEUED = 1
+JOB_STATE_PENDING = 2
+JOB_STATE_RUNNING = 3
+JOB_STATE_SUCCEEDED = 4
+JOB_STATE_FAILED = 5
+JOB_STATE_CANCELLING = 6
+JOB_STATE_CANCELLED = 7
+
+# Vertex AI Trial.State value of finished trials.
+TRIAL_STATE_SUCCEEDED = 4
+
+# Default number of seconds jobs spend in each state before they succeed.
+default_state_progressions = {
+    "custom_job": [
+        (JOB_STATE_QUEUED, 30),
+        (JOB_STATE_PENDING, 120),
+        (JOB_STATE_RUNNING, 900)
+    ],
+    "hyperparameter_tuning_job": [
+        (JOB_STATE_QUEUED, 30),
+        (JOB_STATE_PENDING, 120),
+        (JOB_STATE_RUNNING, 2700)
+    ],
+    "batch_prediction_job": [
+        (JOB_STATE_QUEUED, 30),
+        (JOB_STATE_PENDING, 300),
+        (JOB_STATE_RUNNING, 600)
+    ]
+}
+
+# Default number of seconds long-running operations take.
+default_operation_durations = {
+    "upload_model": 60,
+    "export_model": 120,
+    "create_endpoint": 10,
+    "deploy_model": 900
+}
+
+default_config = {
+    # Seconds per RPC, by method name or "default".
+    "latencies": {"default": 0.05},
+    "state_progressions": default_state_progressions,
+    "operation_durations": default_operation_durations,
+    # Failure injection by method name, i.e.
+    # {"get_custom_job": {"rate": 0.1, "code": 429}}.
+    "rpc_failures": {},
+    # Fraction of jobs of each type that end up failed instead of succeeded.
+    "job_failure_rates": {},
+    # Number of trials hyperparameter tuning jobs run when max_trial_count
+    # is not set. Trials end evenly spread over the running state with
+    # uniformly random metric values.
+    "default_trial_count": 10,
+    # Seconds cancelled jobs spend cancelling before they are cancelled.
+    "cancelling_seconds": 120,
+    "seed": 0
+}
+
+
+class FakeApiError(Exception):
+    """Error raised by fake RPCs, shaped like `google.api_core` errors.
+
+    Args:
+        code: int, HTTP status code, i.e. 429.
+        message: str, error message.
+    """
+    def __init__(self, code, message):
+        super().__init__("{} {}".format(code, message))
+        self.code = code
+        self.message = message
+
+
+class VirtualClock(object):
+    """Clock whose sleeps advance time instantly.
+
+    Installed in place of the `time` module of `job_poller`, jobs that take
+    hours are simulated in milliseconds while polling behaves the same.
+
+    Args:
+        start_epoch: float, epoch seconds the clock starts at.
+    """
+    def __init__(self, start_epoch=None):
+        self.start_epoch = time.time() if start_epoch is None else start_epoch
+        self.elapsed = 0.0
+
+    def monotonic(self):
+        return self.elapsed
+
+    def time(self):
+        return self.start_epoch + self.elapsed
+
+    def sleep(self, seconds):
+        self.elapsed += max(seconds, 0.0)
+
+
+class RealClock(object):
+    """Clock backed by the `time` module, for real-time runs."""
+    def __init__(self):
+        self.origin = time.monotonic()
+
+    def monotonic(self):
+        return time.monotonic() - self.origin
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds, 0.0))
+
+
+class EnumNamespace(object):
+    """Stands in for gapic enums, members are their own names."""
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, member):
+        if member.isupper():
+            return member
+        return EnumNamespace("{}.{}".format(self._name, member))
+
+
+class FakeOperation(object):
+    """Long-running operation that completes after a duration.
+
+    Args:
+        backend: instance of `FakeVertexBackend`.
+        name: str, operation name.
+        duration: float, seconds until done.
+        finish: function, returns response once done.
+    """
+    def __init__(self, backend, name, duration, finish):
+        self.backend = backend
+        self.operation = types.SimpleNamespace(name=name)
+        self.done_at = backend.clock.monotonic() + duration
+        self.finish = finish
+
+    def result(self):
+        self.backend.clock.sleep(self.done_at - self.backend.clock.monotonic())
+        return self.finish()
+
+
+def parse_filter(list_filter):
+    """Parses the subset of list filter syntax the components use.
+
+    Args:
+        list_filter: str, filter, i.e. display_name="x" or
+            labels.key="value" or update_time>="2021-01-01T00:00:00Z".
+
+    Returns:
+        List of (field, operator, value) tuples that must all hold.
+    """
+    clauses = []
+    for clause in re.split(r"\s+AND\s+", list_filter or ""):
+        match = re.match(r'^\s*([\w.]+)\s*(>=|<=|!=|=|>|<)\s*"?(.*?)"?\s*$', clause)
+        if match:
+            clauses.append(match.groups())
+    return clauses
+
+
+def matches_filter(resource, clauses):
+    """Checks whether resource matches parsed filter.
+
+    Args:
+        resource: fake resource.
+        clauses: list, (field, operator, value) tuples.
+
+    Returns:
+        Whether resource matches.
+    """
+    for field, operator, value in clauses:
+        if field.startswith("labels."):
+            actual = (resource.labels or {}).get(field.split(".", 1)[1])
+        else:
+            actual = getattr(resource, field, None)
+        if isinstance(actual, datetime):
+            value = datetime.strptime(
+                value.replace("Z", "").split(".")[0], "%Y-%m-%dT%H:%M:%S"
+            ).replace(tzinfo=timezone.utc)
+            actual = actual.replace(microsecond=0)
+        ok = {
+            "=": lambda a, b: a == b,
+            "!=": lambda a, b: a != b,
+            ">": lambda a, b: a is not None and a > b,
+            "<": lambda a, b: a is not None and a < b,
+            ">=": lambda a, b: a is not None and a >= b,
+            "<=": lambda a, b: a is not None and a <= b
+        }[operator](actual, value)
+        if not ok:
+            return False
+    return True
+
+
+def sample_parameter(rng, parameter):
+    """Samples value of a study parameter uniformly, ignoring its scale.
+
+    Args:
+        rng: instance of `random.Random`.
+        parameter: dict, Vertex AI ParameterSpec.
+
+    Returns:
+        Parameter value.
+    """
+    if "double_value_spec" in parameter:
+        value_spec = parameter["double_value_spec"]
+        return rng.uniform(value_spec["min_value"], value_spec["max_value"])
+    if "integer_value_spec" in parameter:
+        value_spec = parameter["integer_value_spec"]
+        return float(
+            rng.randint(int(value_spec["min_value"]), int(value_spec["max_value"]))
+        )
+    if "discrete_value_spec" in parameter:
+        return rng.choice(parameter["discrete_value_spec"]["values"])
+    return rng.choice(parameter["categorical_value_spec"]["values"])
+
+
+class FakeVertexBackend(object):
+    """In-process stand-in for the Vertex AI Job, Model and Endpoint services.
+
+    Every RPC is counted, takes its configured latency on the clock and may
+    fail with an injected error. Jobs move through configured states over
+    time and long-running operations complete after configured durations.
+
+    Args:
+        config: dict, overrides of `default_config`.
+        clock: instance of `VirtualClock` or `RealClock`.
+    """
+    def __init__(self, config=None, clock=None):
+        self.config = dict(default_config)
+        self.config.update(config or {})
+        self.clock = clock or VirtualClock()
+        self.random = random.Random(self.config["seed"])
+        self.ids = itertools.count(1)
+        self.rpc_counts = collections.Counter()
+        self.resources = collections.defaultdict(dict)
+        self.types = types.SimpleNamespace(
+            AcceleratorType=EnumNamespace("AcceleratorType"),
+            StudySpec=EnumNamespace("StudySpec")
+        )
+
+    def get_client(self, service, region, use_async=False):
+        """Creates fake client of service.
+
+        Args:
+            service: str, name of service, i.e. job_service.
+            region: str, region of resources.
+            use_async: bool, unsupported, fake clients are synchronous.
+
+        Returns:
+            Fake service client.
+        """
+        assert not use_async, "Fake clients are synchronous only."
+        self.rpc_counts["create_client"] += 1
+        return {
+            "job_service": FakeJobServiceClient,
+            "model_service": FakeModelServiceClient,
+            "endpoint_service": FakeEndpointServiceClient
+        }[service](self)
+
+    def now(self):
+        """Gets current time of the clock as a datetime.
+
+        Returns:
+            Timezone aware datetime.
+        """
+        return datetime.fromtimestamp(self.clock.time(), timezone.utc)
+
+    def call(self, method):
+        """Records RPC, applies its latency and injects failures.
+
+        Args:
+            method: str, name of RPC method.
+        """
+        self.rpc_counts[method] += 1
+        latencies = self.config["latencies"]
+        self.clock.sleep(latencies.get(method, latencies.get("default", 0.0)))
+        failure = self.config["rpc_failures"].get(method)
+        if failure and self.random.random() < failure.get("rate", 0.0):
+            self.rpc_counts["{}_failed".format(method)] += 1
+            raise FakeApiError(failure.get("code", 503), "Injected failure")
+
+    def new_name(self, parent, collection):
+        """Makes resource name with a fresh numeric ID.
+
+        Args:
+            parent: str, parent resource name.
+            collection: str, collection, i.e. models.
+
+        Returns:
+            Resource name.
+        """
+        return "{}/{}/{}".format(parent, collection, next(self.ids))
+
+    def add_resource(self, kind, name, fields):
+        """Creates resource with timestamps.
+
+        Args:
+            kind: str, kind of resource, i.e. models.
+            name: str, resource name.
+            fields: dict, fields of resource.
+
+        Returns:
+            Fake resource.
+        """
+        now = self.now()
+        resource = types.SimpleNamespace(
+            name=name,
+            display_name=fields.get("display_name", ""),
+            labels=dict(fields.get("labels", {})),
+            create_time=now,
+            update_time=now,
+            **{
+                key: value for key, value in fields.items()
+                if key not in ["name", "display_name", "labels"]
+            }
+        )
+        self.resources[kind][name] = resource
+        return resource
+
+    def get_resource(self, kind, name):
+        """Gets resource or raises not found.
+
+        Args:
+            kind: str, kind of resource, i.e. models.
+            name: str, resource name.
+
+        Returns:
+            Fake resource.
+        """
+        if name not in self.resources[kind]:
+            raise FakeApiError(404, "{} not found".format(name))
+        return self.resources[kind][name]
+
+    def list_resources(self, kind, request):
+        """Lists resources of parent matching filter.
+
+        Args:
+            kind: str, kind of resource, i.e. models.
+            request: dict, list request with parent and optional filter.
+
+        Returns:
+            List of fake resources.
+        """
+        clauses = parse_filter(request.get("filter"))
+        return [
+            resource for name, resource in sorted(self.resources[kind].items())
+            if name.startswith(request["parent"] + "/")
+            and matches_filter(resource, clauses)
+        ]
+
+    def create_job(self, job_type, parent, job_spec):
+        """Creates job that progresses through states over time.
+
+        Args:
+            job_type: str, type of job, i.e. custom_job.
+            parent: str, parent resource name.
+            job_spec: dict, job resource.
+
+        Returns:
+            Fake job.
+        """
+        collection = {
+            "custom_job": "customJobs",
+            "hyperparameter_tuning_job": "hyperparameterTuningJobs",
+            "batch_prediction_job": "batchPredictionJobs"
+        }[job_type]
+        fails = (
+            self.random.random()
+            < self.config["job_failure_rates"].get(job_type, 0.0)
+        )
+        trial_count = 0
+        if job_type == "hyperparameter_tuning_job":
+            trial_count = (
+                job_spec.get("max_trial_count")
+                or self.config["default_trial_count"]
+            )
+        name = self.new_name(parent, collection)
+        if job_type == "batch_prediction_job":
+            # Named like real jobs' output directories, nothing is written.
+            gcs_destination = job_spec.get("output_config", {}).get(
+                "gcs_destination", {}
+            )
+            job_spec = dict(
+                job_spec,
+                output_info=types.SimpleNamespace(
+                    gcs_output_directory="{}/prediction-{}".format(
+                        gcs_destination["output_uri_prefix"].rstrip("/"),
+                        name.split("/")[-1]
+                    ) if gcs_destination else ""
+                )
+            )
+        return self.add_resource(
+            job_type,
+            name,
+            dict(
+                job_spec,
+                job_type=job_type,
+                trial_values=[self.random.random() for _ in range(trial_count)],
+                trials=[],
+                created_at=self.clock.monotonic(),
+                final_state=JOB_STATE_FAILED if fails else JOB_STATE_SUCCEEDED,
+                cancelled_at=None,
+                detected_at=None,
+                state=JOB_STATE_QUEUED,
+                start_time=None,
+                end_time=None,
+                error=types.SimpleNamespace(message="")
+            )
+        )
+
+    def at(self, monotonic):
+        """Converts monotonic clock reading to a datetime.
+
+        Args:
+            monotonic: float, earlier reading of `clock.monotonic()`.
+
+        Returns:
+            Timezone aware datetime.
+        """
+        return datetime.fromtimestamp(
+            self.clock.time() - (self.clock.monotonic() - monotonic),
+            timezone.utc
+        )
+
+    def refresh_job(self, job):
+        """Moves job to the state it should be in by now.
+
+        Timestamps are set to when the job actually changed state, not to
+        when it was polled, and `detected_at` records when a client first
+        saw the job end.
+
+        Args:
+            job: fake job.
+
+        Returns:
+            Fake job.
+        """
+        if job.end_time is not None:
+            return job
+        self.refresh_trials(job)
+        if job.cancelled_at is not None:
+            state, entered_at = JOB_STATE_CANCELLING, job.cancelled_at
+            if self.clock.monotonic() >= entered_at + self.config["cancelling_seconds"]:
+                state = JOB_STATE_CANCELLED
+                entered_at += self.config["cancelling_seconds"]
+        else:
+            state, entered_at = job.final_state, job.created_at
+            for progression_state, duration in self.config["state_progressions"][job.job_type]:
+                if self.clock.monotonic() < entered_at + duration:
+                    state = progression_state
+                    break
+                if progression_state == JOB_STATE_RUNNING:
+                    job.start_time = job.start_time or self.at(entered_at)
+                entered_at += duration
+        if state == job.state:
+            return job
+
+        job.update_time = self.at(entered_at)
+        if state == JOB_STATE_RUNNING:
+            job.start_time = self.at(entered_at)
+        if state in [JOB_STATE_SUCCEEDED, JOB_STATE_FAILED, JOB_STATE_CANCELLED]:
+            job.end_time = self.at(entered_at)
+            job.detected_at = self.clock.time()
+            if state == JOB_STATE_FAILED:
+                job.error.message = "Injected job failure"
+        job.state = state
+        return job
+
+    def refresh_trials(self, job):
+        """Adds trials of job that have ended by now.
+
+        Args:
+            job: fake job.
+        """
+        if not job.trial_values:
+            return
+        running_start = job.created_at
+        for progression_state, duration in self.config["state_progressions"][job.job_type]:
+            if progression_state == JOB_STATE_RUNNING:
+                break
+            running_start += duration
+        now = self.clock.monotonic()
+        if job.cancelled_at is not None:
+            now = min(now, job.cancelled_at)
+        trial_duration = duration / len(job.trial_values)
+        while len(job.trials) < len(job.trial_values):
+            ended_at = running_start + trial_duration * (len(job.trials) + 1)
+            if ended_at > now:
+                break
+            job.trials.append(
+                types.SimpleNamespace(
+                    id=str(len(job.trials) + 1),
+                    state=TRIAL_STATE_SUCCEEDED,
+                    start_time=self.at(ended_at - trial_duration),
+                    end_time=self.at(ended_at),
+                    parameters=[
+                        types.SimpleNamespace(
+                            parameter_id=parameter["parameter_id"],
+                            value=sample_parameter(self.random, parameter)
+                        )
+                        for parameter in job.study_spec["parameters"]
+                    ],
+                    final_measurement=types.SimpleNamespace(
+                        metrics=[
+                            types.SimpleNamespace(
+                                metric_id=metric["metric_id"],
+                                value=job.trial_values[len(job.trials)]
+                            )
+                            for metric in job.study_spec["metrics"]
+                        ]
+                    )
+                )
+            )
+
+    def create_operation(self, method, name, finish):
+        """Starts long-running operation.
+
+        Args:
+            method: str, name of RPC method.
+            name: str, name of resource operated on.
+            finish: function, returns response once done.
+
+        Returns:
+            Instance of `FakeOperation`.
+        """
+        return FakeOperation(
+            self,
+            "{}/operations/{}".format(name, next(self.ids)),
+            self.config["operation_durations"].get(method, 0),
+            finish
+        )
+
+
+class FakeJobServiceClient(object):
+    """Fake `JobServiceClient`.
+
+    Args:
+        backend: instance of `FakeVertexBackend`.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _create(self, job_type, parent, job):
+        self.backend.call("create_{}".format(job_type))
+        return self.backend.create_job(job_type, parent, job)
+
+    def _get(self, job_type, name):
+        self.backend.call("get_{}".format(job_type))
+        return self.backend.refresh_job(self.backend.get_resource(job_type, name))
+
+    def _list(self, job_type, request):
+        self.backend.call("list_{}s".format(job_type))
+        return [
+            self.backend.refresh_job(job)
+            for job in self.backend.list_resources(job_type, request)
+        ]
+
+    def _cancel(self, job_type, name):
+        self.backend.call("cancel_{}".format(job_type))
+        job = self.backend.get_resource(job_type, name)
+        if job.end_time is None:
+            job.cancelled_at = self.backend.clock.monotonic()
+
+    def create_custom_job(self, parent, custom_job):
+        return self._create("custom_job", parent, custom_job)
+
+    def get_custom_job(self, name):
+        return self._get("custom_job", name)
+
+    def list_custom_jobs(self, request):
+        return self._list("custom_job", request)
+
+    def cancel_custom_job(self, name):
+        return self._cancel("custom_job", name)
+
+    def create_hyperparameter_tuning_job(self, parent, hyperparameter_tuning_job):
+        return self._create(
+            "hyperparameter_tuning_job", parent, hyperparameter_tuning_job
+        )
+
+    def get_hyperparameter_tuning_job(self, name):
+        return self._get("hyperparameter_tuning_job", name)
+
+    def list_hyperparameter_tuning_jobs(self, request):
+        return self._list("hyperparameter_tuning_job", request)
+
+    def cancel_hyperparameter_tuning_job(self, name):
+        return self._cancel("hyperparameter_tuning_job", name)
+
+    def create_batch_prediction_job(self, parent, batch_prediction_job):
+        return self._create("batch_prediction_job", parent, batch_prediction_job)
+
+    def get_batch_prediction_job(self, name):
+        return self._get("batch_prediction_job", name)
+
+    def list_batch_prediction_jobs(self, request):
+        return self._list("batch_prediction_job", request)
+
+    def cancel_batch_prediction_job(self, name):
+        return self._cancel("batch_prediction_job", name)
+
+
+class FakeModelServiceClient(object):
+    """Fake `ModelServiceClient`.
+
+    Args:
+        backend: instance of `FakeVertexBackend`.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def upload_model(self, parent, model):
+        self.backend.call("upload_model")
+        name = self.backend.new_name(parent, "models")
+
+        def finish():
+            self.backend.add_resource("models", name, model)
+            return types.SimpleNamespace(model=name)
+
+        return self.backend.create_operation("upload_model", name, finish)
+
+    def get_model(self, name):
+        self.backend.call("get_model")
+        return self.backend.get_resource("models", name)
+
+    def list_models(self, request):
+        self.backend.call("list_models")
+        return self.backend.list_resources("models", request)
+
+    def export_model(self, name, output_config):
+        self.backend.call("export_model")
+        self.backend.get_resource("models", name)
+        return self.backend.create_operation(
+            "export_model",
+            name,
+            lambda: types.SimpleNamespace(output_config=output_config)
+        )
+
+
+class FakeEndpointServiceClient(object):
+    """Fake `EndpointServiceClient`.
+
+    Args:
+        backend: instance of `FakeVertexBackend`.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def create_endpoint(self, parent, endpoint):
+        self.backend.call("create_endpoint")
+        name = self.backend.new_name(parent, "endpoints")
+        return self.backend.create_operation(
+            "create_endpoint",
+            name,
+            lambda: self.backend.add_resource(
+                "endpoints",
+                name,
+                dict(endpoint, deployed_models=[], traffic_split={})
+            )
+        )
+
+    def get_endpoint(self, name):
+        self.backend.call("get_endpoint")
+        return self.backend.get_resource("endpoints", name)
+
+    def list_endpoints(self, request):
+        self.backend.call("list_endpoints")
+        return self.backend.list_resources("endpoints", request)
+
+    def deploy_model(self, endpoint, deployed_model, traffic_split):
+        self.backend.call("deploy_model")
+        endpoint_resource = self.backend.get_resource("endpoints", endpoint)
+        self.backend.get_resource("models", deployed_model["model"])
+        deployed_model_id = str(next(self.backend.ids))
+
+        def finish():
+            endpoint_resource.deployed_models.append(
+                types.SimpleNamespace(
+                    id=deployed_model_id,
+                    display_name=deployed_model.get("display_name", ""),
+                    model=deployed_model["model"]
+                )
+            )
+            endpoint_resource.traffic_split = {
+                (deployed_model_id if key == "0" else key): value
+                for key, value in traffic_split.items()
+            }
+            endpoint_resource.update_time = self.backend.now()
+            return types.SimpleNamespace(
+                deployed_model=types.SimpleNamespace(id=deployed_model_id)
+            )
+
+        return self.backend.create_operation("deploy_model", endpoint, finish)
@@ -0,0 +1,400 @@
+import fcntl
+import fnmatch
+import glob
+import json
+import os
+import random
+import time
+
+
+def split_gcs_uri(uri):
+    """Splits GCS URI into bucket and object names.
+
+    Args:
+        uri: str, GCS URI of the form gs://bucket/object.
+
+    Returns:
+        Bucket name and object name.
+    """
+    bucket_name, _, object_name = uri[len("gs://"):].partition("/")
+    return bucket_name, object_name
+
+
+def get_blob(uri):
+    """Gets GCS blob of URI.
+
+    Args:
+        uri: str, GCS URI of the form gs://bucket/object.
+
+    Returns:
+        Instance of `storage.Blob`.
+    """
+    from google.cloud import storage
+
+    bucket_name, object_name = split_gcs_uri(uri)
+    return storage.Client().bucket(bucket_name).blob(object_name)
+
+
+def has_wildcards(pattern):
+    """Checks whether pattern has wildcards.
+
+    Args:
+        pattern: str, local path or GCS URI.
+
+    Returns:
+        Bool.
+    """
+    return any(wildcard in pattern for wildcard in "*?[")
+
+
+def iter_files(pattern):
+    """Iterates over files matching a local or GCS wildcard pattern.
+
+    A pattern without wildcards matches the file itself or, if it is a
+    directory, every file under it.
+
+    Args:
+        pattern: str, local path or GCS URI, optionally with wildcards.
+
+    Yields:
+        Tuples of URI, size in bytes and a fingerprint that changes
+        whenever the content does.
+    """
+    if not pattern.startswith("gs://"):
+        if has_wildcards(pattern):
+            paths = glob.glob(pattern, recursive=True)
+        elif os.path.isdir(pattern):
+            paths = sorted(
+                os.path.join(directory, file_name)
+                for directory, _, file_names in os.walk(pattern)
+                for file_name in file_names
+            )
+        else:
+            paths = [pattern]
+        for uri in paths:
+            if os.path.isfile(uri):
+                stat = os.stat(uri)
+                yield uri, stat.st_size, "{}:{}".format(
+                    stat.st_size, stat.st_mtime_ns
+                )
+        return
+
+    from google.cloud import storage
+
+    bucket_name, object_pattern = split_gcs_uri(pattern)
+    if has_wildcards(object_pattern):
+        # Only list the prefix before the first wildcard.
+        prefix = object_pattern
+        for wildcard in "*?[":
+            prefix = prefix.split(wildcard)[0]
+
+        def matches(name):
+            return fnmatch.fnmatchcase(name, object_pattern)
+    else:
+        prefix = object_pattern
+        directory = object_pattern.rstrip("/") + "/"
+
+        def matches(name):
+            return name == object_pattern or name.startswith(directory)
+    for blob in storage.Client().list_blobs(bucket_name, prefix=prefix):
+        if matches(blob.name):
+            uri = "gs://{}/{}".format(bucket_name, blob.name)
+            yield uri, blob.size, "{}:{}:{}".format(
+                blob.size, blob.generation, blob.crc32c
+            )
+
+
+def get_fingerprints(pattern):
+    """Gets fingerprints of files matching a local or GCS wildcard pattern.
+
+    Args:
+        pattern: str, local path or GCS URI, optionally with wildcards.
+
+    Returns:
+        Dictionary mapping matching URIs to a fingerprint that changes
+        whenever their content does.
+    """
+    return {
+        uri: fingerprint for uri, _, fingerprint in iter_files(pattern)
+    }
+
+
+def get_sizes(pattern):
+    """Gets sizes of files matching a local or GCS wildcard pattern.
+
+    Args:
+        pattern: str, local path or GCS URI, optionally with wildcards.
+
+    Returns:
+        Dictionary mapping matching URIs to their size in bytes.
+    """
+    return {uri: size for uri, size, _ in iter_files(pattern)}
+
+
+def list_uris(pattern):
+    """Lists URIs matching a local or GCS wildcard pattern.
+
+    Args:
+        pattern: str, local path or GCS URI, optionally with wildcards.
+
+    Returns:
+        Sorted list of matching URIs.
+    """
+    return sorted(get_fingerprints(pattern))
+
+
+def exists(uri):
+    """Checks whether local path or GCS URI exists.
+
+    Args:
+        uri: str, local path or GCS URI.
+
+    Returns:
+        Whether file exists.
+    """
+    if uri.startswith("gs://"):
+        return get_blob(uri).exists()
+    return os.path.exists(uri)
+
+
+def read_text(uri):
+    """Reads text of local path or GCS URI.
+
+    Args:
+        uri: str, local path or GCS URI.
+
+    Returns:
+        Text of file.
+    """
+    if uri.startswith("gs://"):
+        return get_blob(uri).download_as_text()
+    with open(uri, "r") as f:
+        return f.read()
+
+
+def read_json(uri, default=None):
+    """Reads JSON object of local path or GCS URI.
+
+    Args:
+        uri: str, local path or GCS URI.
+        default: object to return if file does not exist.
+
+    Returns:
+        Deserialized JSON object.
+    """
+    if not exists(uri):
+        return default
+    return json.loads(read_text(uri))
+
+
+def write_text(uri, text):
+    """Writes text to local path or GCS URI.
+
+    Args:
+        uri: str, local path or GCS URI.
+        text: str, text to write.
+    """
+    if uri.startswith("gs://"):
+        get_blob(uri).upload_from_string(text)
+        return
+    directory = os.path.dirname(uri)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write then rename so readers never see a partial file.
+    temp_path = "{}.tmp".format(uri)
+    with open(temp_path, "w") as f:
+        f.write(text)
+    os.replace(temp_path, uri)
+
+
+def write_bytes(uri, data):
+    """Writes bytes to local path or GCS URI.
+
+    Args:
+        uri: str, local path or GCS URI.
+        data: bytes, data to write.
+    """
+    if uri.startswith("gs://"):
+        get_blob(uri).upload_from_string(data)
+        return
+    directory = os.path.dirname(uri)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = "{}.tmp".format(uri)
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, uri)
+
+
+def read_bytes(uri):
+    """Reads bytes of local path or GCS URI.
+
+    Args:
+        uri: str, local path or GCS URI.
+
+    Returns:
+        Bytes of file.
+    """
+    if uri.startswith("gs://"):
+        return get_blob(uri).download_as_bytes()
+    with open(uri, "rb") as f:
+        return f.read()
+
+
+def read_range(uri, start, end):
+    """Reads byte range of local path or GCS URI.
+
+    Args:
+        uri: str, local path or GCS URI.
+        start: int, offset of first byte.
+        end: int, offset after last byte.
+
+    Returns:
+        Bytes in [start, end), fewer if the file ends first.
+    """
+    if end <= start:
+        return b""
+    if uri.startswith("gs://"):
+        # GCS ranges include their end.
+        return get_blob(uri).download_as_bytes(start=start, end=end - 1)
+    with open(uri, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def open_reader(uri):
+    """Opens binary file of local path or GCS URI for streaming reads.
+
+    Args:
+        uri: str, local path or GCS URI.
+
+    Returns:
+        Readable file object, to use as a context manager.
+    """
+    if uri.startswith("gs://"):
+        return get_blob(uri).open("rb")
+    return open(uri, "rb")
+
+
+def open_writer(uri):
+    """Opens binary file of local path or GCS URI for streaming writes.
+
+    Args:
+        uri: str, local path or GCS URI.
+
+    Returns:
+        Writable file object, to use as a context manager.
+    """
+    if uri.startswith("gs://"):
+        return get_blob(uri).open("wb")
+    directory = os.path.dirname(uri)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return open(uri, "wb")
+
+
+def copy_range(source_uri, destination_uri, start, end, header=b"", chunk_size=8 * 2 ** 20):
+    """Copies byte range of a file to a new file, a chunk at a time.
+
+    Args:
+        source_uri: str, local path or GCS URI to copy from.
+        destination_uri: str, local path or GCS URI to copy to.
+        start: int, offset of first byte.
+        end: int, offset after last byte.
+        header: bytes, bytes to write before the range, i.e. a CSV header.
+        chunk_size: int, number of bytes read at once.
+    """
+    with open_writer(destination_uri) as f:
+        f.write(header)
+        for chunk_start in range(start, end, chunk_size):
+            f.write(
+                read_range(
+                    source_uri, chunk_start, min(chunk_start + chunk_size, end)
+                )
+            )
+
+
+def copy(source_uri, destination_uri):
+    """Copies file, within GCS without downloading it.
+
+    Args:
+        source_uri: str, local path or GCS URI to copy from.
+        destination_uri: str, local path or GCS URI to copy to.
+    """
+    if source_uri.startswith("gs://") and destination_uri.startswith("gs://"):
+        source_blob = get_blob(source_uri)
+        bucket_name, object_name = split_gcs_uri(destination_uri)
+        source_blob.bucket.copy_blob(
+            source_blob, source_blob.client.bucket(bucket_name), object_name
+        )
+        return
+    write_bytes(destination_uri, read_bytes(source_uri))
+
+
+def delete(uri):
+    """Deletes local path or GCS URI if it exists.
+
+    Args:
+        uri: str, local path or GCS URI.
+    """
+    if uri.startswith("gs://"):
+        from google.api_core import exceptions
+
+        try:
+            get_blob(uri).delete()
+        except exceptions.NotFound:
+            pass
+        return
+    if os.path.exists(uri):
+        os.remove(uri)
+
+
+def update_json(uri, update_fn, max_attempts=10):
+    """Atomically applies update to JSON object stored at local path or GCS URI.
+
+    Local files are locked while updating. GCS objects are updated with a
+    generation precondition and retried if another writer got there first.
+
+    Args:
+        uri: str, local path or GCS URI.
+        update_fn: function, takes dictionary and updates it in place.
+        max_attempts: int, max number of attempts of GCS updates.
+
+    Returns:
+        Updated dictionary.
+    """
+    if not uri.startswith("gs://"):
+        directory = os.path.dirname(uri)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open("{}.lock".format(uri), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            data = json.loads(read_text(uri)) if os.path.exists(uri) else {}
+            update_fn(data)
+            write_text(uri, json.dumps(data, indent=2, sort_keys=True))
+        return data
+
+    from google.api_core import exceptions
+
+    blob = get_blob(uri)
+    for attempt in range(max_attempts):
+        try:
+            if blob.exists():
+                blob.reload()
+                generation = blob.generation
+                data = json.loads(
+                    blob.download_as_text(if_generation_match=generation)
+                )
+            else:
+                # Generation 0 means the object must not exist yet.
+                generation = 0
+                data = {}
+            update_fn(data)
+            blob.upload_from_string(
+                json.dumps(data, indent=2, sort_keys=True),
+                if_generation_match=generation
+            )
+            return data
+        except exceptions.PreconditionFailed:
+            time.sleep(random.uniform(0.1, 2 ** attempt * 0.1))
+    raise RuntimeError("Could not update {} due to contention.".format(uri))
@@ -0,0 +1,267 @@
+import vertex_clients
+
+
+# Snapshot of documented Vertex AI accelerator support. Accelerators on N1
+# machines can be attached in any of the listed counts, all other machine
+# types come with a fixed number of accelerators. Use
+# --skip_hardware_validation to submit combinations missing from here.
+accelerator_catalog = {
+    "NVIDIA_TESLA_K80": {
+        "machine_families": ["n1"],
+        "counts": [1, 2, 4, 8],
+        "regions": ["us-central1", "us-east1", "us-west1", "europe-west1", "asia-east1"]
+    },
+    "NVIDIA_TESLA_P4": {
+        "machine_families": ["n1"],
+        "counts": [1, 2, 4],
+        "regions": [
+            "us-central1", "us-east4", "us-west2", "northamerica-northeast1",
+            "europe-west4", "asia-southeast1", "australia-southeast1"
+        ]
+    },
+    "NVIDIA_TESLA_P100": {
+        "machine_families": ["n1"],
+        "counts": [1, 2, 4],
+        "regions": [
+            "us-central1", "us-east1", "us-west1", "europe-west1",
+            "europe-west4", "asia-east1", "australia-southeast1"
+        ]
+    },
+    "NVIDIA_TESLA_T4": {
+        "machine_families": ["n1"],
+        "counts": [1, 2, 4],
+        "regions": [
+            "us-central1", "us-east1", "us-east4", "us-west1", "us-west2",
+            "northamerica-northeast1", "southamerica-east1", "europe-west1",
+            "europe-west2", "europe-west4", "asia-east1", "asia-northeast1",
+            "asia-northeast3", "asia-south1", "asia-southeast1",
+            "australia-southeast1"
+        ]
+    },
+    "NVIDIA_TESLA_V100": {
+        "machine_families": ["n1"],
+        "counts": [1, 2, 4, 8],
+        "regions": ["us-central1", "us-east1", "us-west1", "europe-west4", "asia-east1"]
+    },
+    "NVIDIA_TESLA_A100": {
+        "machine_counts": {
+            "a2-highgpu-1g": 1,
+            "a2-highgpu-2g": 2,
+            "a2-highgpu-4g": 4,
+            "a2-highgpu-8g": 8,
+            "a2-megagpu-16g": 16
+        },
+        "regions": [
+            "us-central1", "us-east4", "us-west1", "us-west4", "europe-west4",
+            "asia-northeast1", "asia-northeast3", "asia-southeast1"
+        ]
+    },
+    "NVIDIA_A100_80GB": {
+        "machine_counts": {
+            "a2-ultragpu-1g": 1,
+            "a2-ultragpu-2g": 2,
+            "a2-ultragpu-4g": 4,
+            "a2-ultragpu-8g": 8
+        },
+        "regions": ["us-central1", "us-east4", "us-east5", "europe-west4", "asia-southeast1"]
+    },
+    "NVIDIA_H100_80GB": {
+        "machine_counts": {
+            "a3-highgpu-8g": 8,
+            "a3-megagpu-8g": 8
+        },
+        "regions": [
+            "us-central1", "us-east4", "us-east5", "us-west1", "europe-west4",
+            "asia-southeast1"
+        ]
+    },
+    "NVIDIA_L4": {
+        "machine_counts": {
+            "g2-standard-4": 1,
+            "g2-standard-8": 1,
+            "g2-standard-12": 1,
+            "g2-standard-16": 1,
+            "g2-standard-24": 2,
+            "g2-standard-32": 1,
+            "g2-standard-48": 4,
+            "g2-standard-96": 8
+        },
+        "regions": [
+            "us-central1", "us-east1", "us-east4", "us-west1", "us-west4",
+            "europe-west1", "europe-west4", "asia-east1", "asia-northeast1",
+            "asia-southeast1"
+        ]
+    },
+    "TPU_V2": {
+        "machine_counts": {"cloud-tpu": 8},
+        "regions": ["us-central1", "europe-west4", "asia-east1"]
+    },
+    "TPU_V3": {
+        "machine_counts": {"cloud-tpu": 8},
+        "regions": ["us-central1", "europe-west4"]
+    },
+    "TPU_V4_POD": {
+        "machine_counts": {"ct4p-hightpu-4t": 4},
+        "regions": ["us-central2"],
+        "pod_slices": True
+    },
+    "TPU_V5_LITEPOD": {
+        "machine_counts": {
+            "ct5lp-hightpu-1t": 1,
+            "ct5lp-hightpu-4t": 4,
+            "ct5lp-hightpu-8t": 8
+        },
+        "regions": ["us-central1", "us-east1", "us-east5", "us-west1", "us-west4", "europe-west4"],
+        "pod_slices": True
+    }
+}
+
+
+def add_hardware_arguments(parser):
+    """Adds hardware command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--skip_hardware_validation",
+        help="Whether to skip checking machine specs against the hardware catalog.",
+        action="store_true"
+    )
+
+
+def get_accelerator_type(accelerator_name):
+    """Gets accelerator type enum from its name.
+
+    Args:
+        accelerator_name: str, name of accelerator type.
+
+    Returns:
+        Accelerator type enum.
+    """
+    accelerator_types = vertex_clients.get_types().AcceleratorType
+    if accelerator_name == "ACCELERATOR_TYPE_UNSPECIFIED":
+        return accelerator_types.ACCELERATOR_TYPE_UNSPECIFIED
+    assert accelerator_name in accelerator_catalog, \
+    "Unknown accelerator type {}. Choices are {}.".format(
+        accelerator_name, sorted(accelerator_catalog)
+    )
+    accelerator_type = getattr(accelerator_types, accelerator_name, None)
+    assert accelerator_type is not None, \
+    "Accelerator type {} needs a newer google-cloud-aiplatform.".format(
+        accelerator_name
+    )
+    return accelerator_type
+
+
+def get_machine_family(machine_type):
+    """Gets machine family of machine type, i.e. n1 of n1-standard-4.
+
+    Args:
+        machine_type: str, machine type.
+
+    Returns:
+        Machine family.
+    """
+    return machine_type.split("-")[0]
+
+
+def validate_machine_spec(machine_type, accelerator_name, accelerator_count, region, tpu_topology=""):
+    """Validates machine spec against the hardware catalog.
+
+    Args:
+        machine_type: str, machine type.
+        accelerator_name: str, name of accelerator type.
+        accelerator_count: int, number of accelerators per replica.
+        region: str, region to run in.
+        tpu_topology: str, TPU pod slice topology.
+    """
+    accelerator_machine_types = {
+        machine: name
+        for name, entry in accelerator_catalog.items()
+        for machine in entry.get("machine_counts", {})
+    }
+    if accelerator_name == "ACCELERATOR_TYPE_UNSPECIFIED":
+        assert not accelerator_count, \
+        "Must set accelerator_type to use {} accelerators.".format(
+            accelerator_count
+        )
+        assert machine_type not in accelerator_machine_types, \
+        "Machine type {} needs accelerator_type {}.".format(
+            machine_type, accelerator_machine_types.get(machine_type)
+        )
+        assert not tpu_topology, "tpu_topology is only used with TPUs."
+        return
+
+    get_accelerator_type(accelerator_name)
+    entry = accelerator_catalog[accelerator_name]
+    assert region in entry["regions"], \
+    "{} is not available in {}. Regions are {}.".format(
+        accelerator_name, region, entry["regions"]
+    )
+
+    if "machine_counts" in entry:
+        assert machine_type in entry["machine_counts"], \
+        "{} needs one of machine types {}, not {}.".format(
+            accelerator_name, sorted(entry["machine_counts"]), machine_type
+        )
+        expected_count = entry["machine_counts"][machine_type]
+        assert accelerator_count == expected_count, \
+        "Machine type {} has {} {} accelerators, not {}.".format(
+            machine_type, expected_count, accelerator_name, accelerator_count
+        )
+    else:
+        assert get_machine_family(machine_type) in entry["machine_families"], \
+        "{} needs a machine type of families {}, not {}.".format(
+            accelerator_name, entry["machine_families"], machine_type
+        )
+        assert accelerator_count in entry["counts"], \
+        "{} can be attached in counts of {}, not {}.".format(
+            accelerator_name, entry["counts"], accelerator_count
+        )
+
+    if tpu_topology:
+        assert entry.get("pod_slices"), \
+        "tpu_topology is only used with TPU pod slices, not {}.".format(
+            accelerator_name
+        )
+        dimensions = tpu_topology.split("x")
+        assert all(dimension.isdigit() for dimension in dimensions), \
+        "tpu_topology must look like 2x2 or 2x2x1, not {}.".format(tpu_topology)
+
+
+def build_machine_spec(arguments, machine_type, accelerator_name, accelerator_count, tpu_topology=""):
+    """Builds validated machine spec.
+
+    Args:
+        arguments: dict, command line arguments.
+        machine_type: str, machine type.
+        accelerator_name: str, name of accelerator type.
+        accelerator_count: int, number of accelerators per replica.
+        tpu_topology: str, TPU pod slice topology.
+
+    Returns:
+        Dictionary of machine spec.
+    """
+    if not arguments.get("skip_hardware_validation"):
+        validate_machine_spec(
+            machine_type,
+            accelerator_name,
+            accelerator_count,
+            arguments["region"],
+            tpu_topology
+        )
+        accelerator_type = get_accelerator_type(accelerator_name)
+    else:
+        accelerator_type = getattr(
+            vertex_clients.get_types().AcceleratorType, accelerator_name
+        )
+
+    machine_spec = {
+        "machine_type": machine_type,
+        "accelerator_type": accelerator_type,
+        "accelerator_count": accelerator_count
+    }
+    if tpu_topology:
+        machine_spec["tpu_topology"] = tpu_topology
+    return machine_spec
@@ -0,0 +1,283 @@
+import hashlib
+import io
+import json
+import time
+
+import gcs_utils
+
+
+def add_incremental_arguments(parser):
+    """Adds incremental batch prediction command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--incremental_state_uri",
+        help="Local or GCS directory keeping hashes and predictions of scored instances between runs, so only new or changed instances are scored. Empty scores the whole input every time.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--incremental_full_refresh",
+        help="Whether to rescore every instance even if incremental state exists.",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--incremental_batch_rows",
+        help="Number of rows hashed and looked up at once while streaming.",
+        type=int,
+        default=10000
+    )
+
+
+def hash_instance(instance):
+    """Hashes instance by content, ignoring key order and whitespace.
+
+    Args:
+        instance: JSON serializable instance.
+
+    Returns:
+        Unsigned 64-bit int hash.
+    """
+    return int.from_bytes(
+        hashlib.blake2b(
+            json.dumps(
+                instance, sort_keys=True, separators=(",", ":")
+            ).encode("utf-8"),
+            digest_size=8
+        ).digest(),
+        "little"
+    )
+
+
+def iter_line_batches(uris, batch_rows):
+    """Iterates over non-empty lines of files, a batch at a time.
+
+    Args:
+        uris: list, local paths or GCS URIs of JSONL files.
+        batch_rows: int, number of lines per batch.
+
+    Yields:
+        Lists of lines as bytes with their newline.
+    """
+    batch = []
+    for uri in uris:
+        with gcs_utils.open_reader(uri) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                batch.append(line if line.endswith(b"\n") else line + b"\n")
+                if len(batch) >= batch_rows:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def hash_array(hashes):
+    """Builds sorted array of unique hashes.
+
+    Args:
+        hashes: iterable of unsigned 64-bit int hashes.
+
+    Returns:
+        Sorted numpy array of unique uint64 hashes, 8 bytes per instance.
+    """
+    # Imported here since only incremental runs need it.
+    import numpy as np
+
+    return np.unique(np.array(list(hashes), dtype=np.uint64))
+
+
+def contains(sorted_hashes, hashes):
+    """Checks which hashes are in a sorted hash array.
+
+    Args:
+        sorted_hashes: sorted numpy array of unique uint64 hashes.
+        hashes: numpy array of uint64 hashes to look up.
+
+    Returns:
+        Numpy array of bools.
+    """
+    import numpy as np
+
+    if not len(sorted_hashes):
+        return np.zeros(len(hashes), dtype=bool)
+    positions = np.minimum(
+        np.searchsorted(sorted_hashes, hashes), len(sorted_hashes) - 1
+    )
+    return sorted_hashes[positions] == hashes
+
+
+def write_delta(input_uris, scored_hashes, delta_uri, batch_rows):
+    """Streams instances that weren't scored yet into a delta input file.
+
+    Args:
+        input_uris: list, local paths or GCS URIs of JSONL input files.
+        scored_hashes: sorted numpy array of hashes of scored instances.
+        delta_uri: str, local path or GCS URI of delta file to write.
+        batch_rows: int, number of rows hashed and looked up at once.
+
+    Returns:
+        Sorted numpy array of unique hashes of all input instances and
+        number of instances in delta.
+    """
+    import numpy as np
+
+    input_hashes = []
+    delta_hashes = set()
+    with gcs_utils.open_writer(delta_uri) as f:
+        for lines in iter_line_batches(input_uris, batch_rows):
+            hashes = np.array(
+                [hash_instance(json.loads(line)) for line in lines],
+                dtype=np.uint64
+            )
+            input_hashes.append(hashes)
+            for line, instance_hash, scored in zip(
+                lines, hashes.tolist(), contains(scored_hashes, hashes)
+            ):
+                # Duplicate instances are only scored once.
+                if not scored and instance_hash not in delta_hashes:
+                    delta_hashes.add(instance_hash)
+                    f.write(line)
+    return (
+        np.unique(np.concatenate(input_hashes)) if input_hashes
+        else hash_array([]),
+        len(delta_hashes)
+    )
+
+
+def stitch_predictions(previous_uris, input_hashes, delta_uris, output_prefix, batch_rows):
+    """Combines still wanted earlier predictions with those of the delta.
+
+    Earlier predictions of instances that are no longer in the input, i.e.
+    changed rows, are dropped. Instances are matched to predictions by the
+    "instance" every JSONL prediction echoes.
+
+    Args:
+        previous_uris: list, local paths or GCS URIs of earlier complete
+            JSONL predictions.
+        input_hashes: sorted numpy array of hashes of input instances.
+        delta_uris: list, local paths or GCS URIs of JSONL predictions of
+            delta.
+        output_prefix: str, local or GCS prefix to write predictions to.
+        batch_rows: int, number of rows hashed and looked up at once.
+
+    Returns:
+        List of URIs of complete predictions and sorted numpy array of
+        hashes of their instances.
+    """
+    import numpy as np
+
+    output_uris = []
+    output_hashes = []
+    # Earlier predictions go into one part, each delta file into its own.
+    for part_uris, keep_all in [(previous_uris, False)] + [
+        ([uri], True) for uri in delta_uris
+    ]:
+        output_uri = "{}/predictions-{:05d}.jsonl".format(
+            output_prefix.rstrip("/"), len(output_uris)
+        )
+        row_count = 0
+        with gcs_utils.open_writer(output_uri) as f:
+            for lines in iter_line_batches(part_uris, batch_rows):
+                hashes = np.array(
+                    [
+                        hash_instance(json.loads(line)["instance"])
+                        for line in lines
+                    ],
+                    dtype=np.uint64
+                )
+                keep = (
+                    np.ones(len(lines), dtype=bool) if keep_all
+                    else contains(input_hashes, hashes)
+                )
+                for line, kept in zip(lines, keep):
+                    if kept:
+                        f.write(line)
+                output_hashes.append(hashes[keep])
+                row_count += int(keep.sum())
+        if row_count:
+            output_uris.append(output_uri)
+        else:
+            gcs_utils.delete(output_uri)
+    return (
+        output_uris,
+        np.unique(np.concatenate(output_hashes)) if output_hashes
+        else hash_array([])
+    )
+
+
+def get_state_uri(state_uri):
+    """Gets URI of state file of incremental batch prediction.
+
+    Args:
+        state_uri: str, local or GCS directory of state.
+
+    Returns:
+        URI of state file.
+    """
+    return "{}/state.json".format(state_uri.rstrip("/"))
+
+
+def read_state(state_uri):
+    """Reads state of incremental batch prediction.
+
+    Args:
+        state_uri: str, local or GCS directory of state.
+
+    Returns:
+        Dictionary of state, with the sorted numpy array of hashes of scored
+        instances under "hashes", or None if there is none.
+    """
+    state = gcs_utils.read_json(get_state_uri(state_uri))
+    if state is None:
+        return None
+    import numpy as np
+
+    state["hashes"] = np.load(
+        io.BytesIO(gcs_utils.read_bytes(state["hashes_uri"]))
+    )
+    return state
+
+
+def write_state(state_uri, run_uri, model_name, prediction_uris, destination_uris, hashes, delta_count):
+    """Writes state of incremental batch prediction.
+
+    The hashes are written first, so the state file only ever points at
+    complete runs.
+
+    Args:
+        state_uri: str, local or GCS directory of state.
+        run_uri: str, local or GCS directory of this run.
+        model_name: str, resource name of model that scored instances.
+        prediction_uris: list, URIs of complete predictions of this run.
+        destination_uris: list, URIs predictions were copied to, which the
+            next run may replace.
+        hashes: sorted numpy array of hashes of scored instances.
+        delta_count: int, number of instances scored by this run.
+
+    Returns:
+        URI of state file.
+    """
+    import numpy as np
+
+    hashes_uri = "{}/hashes.npy".format(run_uri)
+    buffer = io.BytesIO()
+    np.save(buffer, hashes)
+    gcs_utils.write_bytes(hashes_uri, buffer.getvalue())
+    state = {
+        "run_uri": run_uri,
+        "model_name": model_name,
+        "prediction_uris": prediction_uris,
+        "destination_uris": destination_uris,
+        "hashes_uri": hashes_uri,
+        "row_count": len(hashes),
+        "delta_count": delta_count,
+        "updated_at": time.time()
+    }
+    gcs_utils.write_text(
+        get_state_uri(state_uri), json.dumps(state, indent=2, sort_keys=True)
+    )
+    return get_state_uri(state_uri)
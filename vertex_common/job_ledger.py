@@ -0,0 +1,182 @@
+from datetime import datetime
+import hashlib
+import json
+
+import gcs_utils
+import job_poller
+
+
+# Label set on submitted jobs so they can be found even if the ledger write
+# was lost, e.g. when the pod was evicted right after submitting.
+job_key_label = "vertex_job_key"
+
+
+def add_ledger_arguments(parser):
+    """Adds job ledger command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--job_ledger_uri",
+        help="Local or GCS path of JSON job ledger used to reattach to in-flight jobs.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--dag_run_id",
+        help="ID of DAG run, i.e. {{ run_id }}, that jobs are deduplicated within.",
+        type=str,
+        default=""
+    )
+
+
+def check_dag_run_id(dag_run_id):
+    """Checks that jobs can be told apart by DAG run.
+
+    Without a DAG run ID, every DAG run would reattach to the first run's
+    job and skip its own.
+
+    Args:
+        dag_run_id: str, ID of DAG run.
+    """
+    assert dag_run_id, \
+    "Job ledger needs dag_run_id, i.e. {{ run_id }}, to tell DAG runs apart."
+
+
+def compute_job_key(job_spec, dag_run_id):
+    """Computes deterministic key of job spec within DAG run.
+
+    Args:
+        job_spec: dict, spec of job. Display names are left out by callers
+            since they default to the submission time.
+        dag_run_id: str, ID of DAG run.
+
+    Returns:
+        Hex digest of job key.
+    """
+    check_dag_run_id(dag_run_id)
+    canonical_spec = json.dumps(
+        {"job_spec": job_spec, "dag_run_id": dag_run_id},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    # Label values are limited to 63 characters.
+    return hashlib.sha256(canonical_spec.encode("utf-8")).hexdigest()[:32]
+
+
+def find_job_name(ledger_uri, job_key):
+    """Finds name of job recorded in ledger under key.
+
+    Args:
+        ledger_uri: str, local or GCS path of job ledger.
+        job_key: str, job key.
+
+    Returns:
+        Resource name of job or None if not recorded.
+    """
+    entry = gcs_utils.read_json(ledger_uri, default={}).get(job_key)
+    return entry["job_name"] if entry else None
+
+
+def record_job_name(ledger_uri, job_key, job_name, dag_run_id):
+    """Records name of job in ledger under key.
+
+    Args:
+        ledger_uri: str, local or GCS path of job ledger.
+        job_key: str, job key.
+        job_name: str, resource name of job.
+        dag_run_id: str, ID of DAG run.
+    """
+    def update(ledger):
+        ledger[job_key] = {
+            "job_name": job_name,
+            "dag_run_id": dag_run_id,
+            "recorded_at": datetime.utcnow().isoformat() + "Z"
+        }
+
+    gcs_utils.update_json(ledger_uri, update)
+
+
+def is_resumable(job):
+    """Checks whether job can be watched instead of resubmitted.
+
+    Failed, cancelling and cancelled jobs are resubmitted so task retries
+    still retry.
+
+    Args:
+        job: job resource.
+
+    Returns:
+        Whether job is in flight or succeeded.
+    """
+    return (
+        job.state in job_poller.running_states
+        and job.state != job_poller.JOB_STATE_CANCELLING
+    ) or job.state == job_poller.completed_state
+
+
+def resume_or_create_job(arguments, job_key, create_job, get_job, list_jobs):
+    """Gets name of in-flight or succeeded job with key, creating it if needed.
+
+    Args:
+        arguments: dict, command line arguments.
+        job_key: str, job key.
+        create_job: function, creates job labelled with key and returns its name.
+        get_job: function, takes job name and returns job.
+        list_jobs: function, takes filter and returns matching jobs.
+
+    Returns:
+        Resource name of job.
+    """
+    ledger_uri = arguments["job_ledger_uri"]
+    job_name = find_job_name(ledger_uri, job_key)
+    if job_name and is_resumable(get_job(job_name)):
+        print("Reattaching to job {} from ledger.".format(job_name))
+        return job_name
+
+    for job in list_jobs('labels.{}="{}"'.format(job_key_label, job_key)):
+        if is_resumable(job):
+            print("Reattaching to unrecorded job {}.".format(job.name))
+            record_job_name(ledger_uri, job_key, job.name, arguments["dag_run_id"])
+            return job.name
+
+    job_name = create_job()
+    record_job_name(ledger_uri, job_key, job_name, arguments["dag_run_id"])
+    return job_name
+
+
+async def resume_or_create_job_async(arguments, job_key, create_job, get_job, list_jobs):
+    """Gets name of in-flight or succeeded job with key, creating it if needed.
+
+    Same as `resume_or_create_job`, for jobs submitted concurrently with
+    async clients.
+
+    Args:
+        arguments: dict, command line arguments.
+        job_key: str, job key.
+        create_job: coroutine function, creates job labelled with key and
+            returns its name.
+        get_job: coroutine function, takes job name and returns job.
+        list_jobs: coroutine function, takes filter and returns list of
+            matching jobs.
+
+    Returns:
+        Resource name of job.
+    """
+    ledger_uri = arguments["job_ledger_uri"]
+    job_name = find_job_name(ledger_uri, job_key)
+    if job_name and is_resumable(await get_job(job_name)):
+        print("Reattaching to job {} from ledger.".format(job_name))
+        return job_name
+
+    for job in await list_jobs('labels.{}="{}"'.format(job_key_label, job_key)):
+        if is_resumable(job):
+            print("Reattaching to unrecorded job {}.".format(job.name))
+            record_job_name(ledger_uri, job_key, job.name, arguments["dag_run_id"])
+            return job.name
+
+    job_name = await create_job()
+    record_job_name(ledger_uri, job_key, job_name, arguments["dag_run_id"])
+    return job_name
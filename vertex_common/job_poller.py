@@ -0,0 +1,474 @@
+import random
+import time
+from datetime import datetime
+
+import telemetry
+
+
+# Vertex AI JobState values.
+JOB_STATE_QUEUED = 1
+JOB_STATE_PENDING = 2
+JOB_STATE_RUNNING = 3
+JOB_STATE_SUCCEEDED = 4
+JOB_STATE_FAILED = 5
+JOB_STATE_CANCELLING = 6
+JOB_STATE_CANCELLED = 7
+JOB_STATE_PAUSED = 8
+
+job_state_names = {
+    JOB_STATE_QUEUED: "JOB_STATE_QUEUED",
+    JOB_STATE_PENDING: "JOB_STATE_PENDING",
+    JOB_STATE_RUNNING: "JOB_STATE_RUNNING",
+    JOB_STATE_SUCCEEDED: "JOB_STATE_SUCCEEDED",
+    JOB_STATE_FAILED: "JOB_STATE_FAILED",
+    JOB_STATE_CANCELLING: "JOB_STATE_CANCELLING",
+    JOB_STATE_CANCELLED: "JOB_STATE_CANCELLED",
+    JOB_STATE_PAUSED: "JOB_STATE_PAUSED"
+}
+
+waiting_states = set([JOB_STATE_QUEUED, JOB_STATE_PENDING, JOB_STATE_PAUSED])
+# Cancelling jobs are still polled until they are cancelled.
+running_states = set(
+    [
+        JOB_STATE_QUEUED,
+        JOB_STATE_PENDING,
+        JOB_STATE_RUNNING,
+        JOB_STATE_PAUSED,
+        JOB_STATE_CANCELLING
+    ]
+)
+completed_state = JOB_STATE_SUCCEEDED
+
+# Errors worth retrying, i.e. throttling and outages.
+transient_error_codes = set([408, 429, 500, 502, 503, 504])
+transient_grpc_status_names = set(
+    ["RESOURCE_EXHAUSTED", "UNAVAILABLE", "DEADLINE_EXCEEDED", "INTERNAL"]
+)
+
+
+def add_polling_arguments(parser):
+    """Adds job polling command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--job_polling_frequency",
+        help="Number of seconds to wait between job status polls.",
+        type=int,
+        default=15
+    )
+    parser.add_argument(
+        "--job_polling_max_interval",
+        help="Max number of seconds to wait between job status polls.",
+        type=int,
+        default=300
+    )
+    parser.add_argument(
+        "--job_polling_backoff",
+        help="Multiplier applied to the polling interval while state is unchanged.",
+        type=float,
+        default=1.5
+    )
+    parser.add_argument(
+        "--job_polling_jitter",
+        help="Fraction of the polling interval to randomly jitter by.",
+        type=float,
+        default=0.2
+    )
+    parser.add_argument(
+        "--job_polling_timeout",
+        help="Number of seconds after which the job is cancelled. 0 means no timeout.",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--job_polling_max_errors",
+        help="Number of consecutive transient polling errors to tolerate.",
+        type=int,
+        default=10
+    )
+    parser.add_argument(
+        "--expected_job_duration",
+        help="Expected number of seconds the job runs for. 0 means unknown.",
+        type=int,
+        default=0
+    )
+
+
+def get_polling_config(arguments):
+    """Gets polling config from arguments.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of polling config.
+    """
+    polling_frequency = arguments.get("job_polling_frequency", 15)
+    return {
+        "frequency": polling_frequency,
+        "max_interval": max(
+            arguments.get("job_polling_max_interval", 300), polling_frequency
+        ),
+        "backoff": max(arguments.get("job_polling_backoff", 1.5), 1.0),
+        "jitter": min(max(arguments.get("job_polling_jitter", 0.2), 0.0), 1.0),
+        "timeout": arguments.get("job_polling_timeout", 0),
+        "max_errors": arguments.get("job_polling_max_errors", 10),
+        "expected_duration": arguments.get("expected_job_duration", 0)
+    }
+
+
+def get_state_name(state):
+    """Gets printable name of job state.
+
+    Args:
+        state: int or enum, job state.
+
+    Returns:
+        Name of job state.
+    """
+    return getattr(state, "name", job_state_names.get(state, str(state)))
+
+
+def is_transient_error(error):
+    """Checks whether error is worth retrying.
+
+    Args:
+        error: exception raised by API call.
+
+    Returns:
+        Whether error is transient.
+    """
+    if getattr(error, "code", None) in transient_error_codes:
+        return True
+    grpc_status_code = getattr(error, "grpc_status_code", None)
+    return getattr(grpc_status_code, "name", None) in transient_grpc_status_names
+
+
+def compute_poll_interval(state, streak, running_elapsed, polling_config):
+    """Computes number of seconds to wait until next poll.
+
+    Jobs waiting for resources are polled with exponential backoff up to the
+    max interval. Running jobs are polled with backoff too unless an expected
+    duration is known, in which case the interval shrinks as the expected
+    completion time approaches.
+
+    Args:
+        state: int, current job state.
+        streak: int, number of consecutive polls in current state.
+        running_elapsed: float, seconds job has been in the running state.
+        polling_config: dict, polling config.
+
+    Returns:
+        Number of seconds to wait.
+    """
+    frequency = polling_config["frequency"]
+    max_interval = polling_config["max_interval"]
+    if state in waiting_states:
+        # Provisioning takes minutes, so start slower while waiting.
+        interval = 2 * frequency * polling_config["backoff"] ** streak
+    else:
+        interval = frequency * polling_config["backoff"] ** streak
+
+    expected_duration = polling_config["expected_duration"]
+    if state == JOB_STATE_RUNNING and expected_duration:
+        remaining = expected_duration - running_elapsed
+        # Poll a quarter of the remaining time out, at base frequency if overdue.
+        interval = min(interval, max(remaining / 4.0, frequency))
+    interval = min(max(interval, frequency), max_interval)
+
+    jitter = polling_config["jitter"]
+    return interval * random.uniform(1.0 - jitter, 1.0 + jitter)
+
+
+def compute_error_interval(error_count, polling_config):
+    """Computes number of seconds to wait after a transient error.
+
+    Args:
+        error_count: int, number of consecutive transient errors.
+        polling_config: dict, polling config.
+
+    Returns:
+        Number of seconds to wait.
+    """
+    frequency = polling_config["frequency"]
+    interval = min(frequency * 2 ** error_count, polling_config["max_interval"])
+    # Full jitter spreads out retries of many clients throttled at once.
+    return random.uniform(frequency, max(interval, frequency))
+
+
+def create_poll_status(job_name):
+    """Creates status used to track polling of a job.
+
+    Args:
+        job_name: str, resource name of job.
+
+    Returns:
+        Dictionary of polling status.
+    """
+    return {
+        "job_name": job_name,
+        "start_time": time.monotonic(),
+        "timeline": [],
+        "state": None,
+        "streak": 0,
+        "running_start_time": None,
+        "error_count": 0
+    }
+
+
+def check_timeout(status, polling_config):
+    """Raises if job has been polled for longer than the timeout.
+
+    Args:
+        status: dict, polling status.
+        polling_config: dict, polling config.
+    """
+    elapsed = time.monotonic() - status["start_time"]
+    if polling_config["timeout"] and elapsed > polling_config["timeout"]:
+        raise TimeoutError(
+            "Job {} did not finish within {} seconds.".format(
+                status["job_name"], polling_config["timeout"]
+            )
+        )
+
+
+def record_job(status, job):
+    """Records polled job, appending to the timeline on state transitions.
+
+    Args:
+        status: dict, polling status.
+        job: polled job.
+
+    Returns:
+        Whether job has left the running states.
+    """
+    status["error_count"] = 0
+    if job.state != status["state"]:
+        status["state"] = job.state
+        status["streak"] = 0
+        status["timeline"].append(
+            {
+                "state": get_state_name(job.state),
+                "state_value": int(job.state),
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "elapsed_seconds": round(
+                    time.monotonic() - status["start_time"], 3
+                )
+            }
+        )
+        print(
+            "Job {} state = {}".format(
+                status["job_name"], get_state_name(job.state)
+            )
+        )
+        if job.state == JOB_STATE_RUNNING and status["running_start_time"] is None:
+            status["running_start_time"] = time.monotonic()
+    else:
+        status["streak"] += 1
+
+    finished = job.state not in running_states
+    if finished:
+        telemetry.record_job(job, status["timeline"], time.time())
+    return finished
+
+
+def record_error(status, error, polling_config):
+    """Records polling error, re-raising it unless it is transient.
+
+    Args:
+        status: dict, polling status.
+        error: exception raised by API call.
+        polling_config: dict, polling config.
+
+    Returns:
+        Number of seconds to wait before retrying.
+    """
+    if not is_transient_error(error):
+        raise error
+    status["error_count"] += 1
+    if status["error_count"] > polling_config["max_errors"]:
+        raise error
+    interval = compute_error_interval(status["error_count"], polling_config)
+    print(
+        "Transient error polling job {}: {}. Retrying in {:.1f}s.".format(
+            status["job_name"], error, interval
+        )
+    )
+    return interval
+
+
+def get_next_interval(status, polling_config):
+    """Gets number of seconds to wait until next poll of a running job.
+
+    Args:
+        status: dict, polling status.
+        polling_config: dict, polling config.
+
+    Returns:
+        Number of seconds to wait.
+    """
+    now = time.monotonic()
+    running_elapsed = (
+        now - status["running_start_time"]
+        if status["running_start_time"] else 0.0
+    )
+    interval = compute_poll_interval(
+        status["state"], status["streak"], running_elapsed, polling_config
+    )
+    if polling_config["timeout"]:
+        remaining = polling_config["timeout"] - (now - status["start_time"])
+        interval = min(interval, max(remaining, 0.0))
+    return interval
+
+
+def wait_for_job(get_job, job_name, polling_config, cancel_job=None, on_poll=None):
+    """Polls job until it leaves the running states.
+
+    Args:
+        get_job: function, takes job name and returns job.
+        job_name: str, resource name of job.
+        polling_config: dict, polling config.
+        cancel_job: function, takes job name and cancels job on timeout.
+        on_poll: function, takes job and is called after every poll.
+
+    Returns:
+        Last polled job and list of state transitions.
+    """
+    status = create_poll_status(job_name)
+    while True:
+        try:
+            check_timeout(status, polling_config)
+        except TimeoutError:
+            if cancel_job is not None:
+                print("Job {} timed out, cancelling.".format(job_name))
+                cancel_job(job_name)
+            raise
+
+        try:
+            job = get_job(job_name)
+        except Exception as error:
+            time.sleep(record_error(status, error, polling_config))
+            continue
+        finished = record_job(status, job)
+
+        if on_poll is not None:
+            on_poll(job)
+
+        if finished:
+            return job, status["timeline"]
+        time.sleep(get_next_interval(status, polling_config))
+
+
+async def wait_for_job_async(get_job, job_name, polling_config, cancel_job=None, on_poll=None):
+    """Polls job without blocking the event loop until it leaves the running states.
+
+    Args:
+        get_job: coroutine function, takes job name and returns job.
+        job_name: str, resource name of job.
+        polling_config: dict, polling config.
+        cancel_job: coroutine function, takes job name and cancels job on timeout.
+        on_poll: function, takes job and is called after every poll.
+
+    Returns:
+        Last polled job and list of state transitions.
+    """
+    # Imported here since asyncio is slow to import and sync callers skip it.
+    import asyncio
+
+    status = create_poll_status(job_name)
+    while True:
+        try:
+            check_timeout(status, polling_config)
+        except TimeoutError:
+            if cancel_job is not None:
+                print("Job {} timed out, cancelling.".format(job_name))
+                await cancel_job(job_name)
+            raise
+
+        try:
+            job = await get_job(job_name)
+        except Exception as error:
+            await asyncio.sleep(record_error(status, error, polling_config))
+            continue
+        finished = record_job(status, job)
+
+        if on_poll is not None:
+            on_poll(job)
+
+        if finished:
+            return job, status["timeline"]
+        await asyncio.sleep(get_next_interval(status, polling_config))
+
+
+async def wait_for_jobs_async(get_job, job_names, polling_config, cancel_job=None, max_concurrent_polls=10):
+    """Polls many jobs from one watch loop until they all leave the running states.
+
+    Every job keeps its own backoff, and each round only the jobs that are due
+    are polled, so the number of reads grows with the number of state changes
+    rather than with the number of jobs.
+
+    Args:
+        get_job: coroutine function, takes job name and returns job.
+        job_names: list, resource names of jobs.
+        polling_config: dict, polling config.
+        cancel_job: coroutine function, takes job name and cancels job on timeout.
+        max_concurrent_polls: int, max number of polls in flight at once.
+
+    Returns:
+        Dictionary mapping job name to dictionary of last polled job, list of
+        state transitions and error, if any.
+    """
+    import asyncio
+
+    semaphore = asyncio.Semaphore(max_concurrent_polls)
+    statuses = {name: create_poll_status(name) for name in job_names}
+    next_poll_times = {name: time.monotonic() for name in job_names}
+    results = {}
+
+    async def poll(job_name):
+        status = statuses[job_name]
+        try:
+            check_timeout(status, polling_config)
+        except TimeoutError as error:
+            if cancel_job is not None:
+                print("Job {} timed out, cancelling.".format(job_name))
+                await cancel_job(job_name)
+            return None, 0.0, error
+
+        try:
+            async with semaphore:
+                job = await get_job(job_name)
+        except Exception as error:
+            try:
+                return None, record_error(status, error, polling_config), None
+            except Exception as fatal_error:
+                return None, 0.0, fatal_error
+        if record_job(status, job):
+            return job, 0.0, None
+        return None, get_next_interval(status, polling_config), None
+
+    while next_poll_times:
+        now = time.monotonic()
+        due_job_names = [
+            name for name, poll_time in next_poll_times.items()
+            if poll_time <= now
+        ]
+        outcomes = await asyncio.gather(*[poll(name) for name in due_job_names])
+        for job_name, (job, interval, error) in zip(due_job_names, outcomes):
+            if job is not None or error is not None:
+                results[job_name] = {
+                    "job": job,
+                    "timeline": statuses[job_name]["timeline"],
+                    "error": error
+                }
+                del next_poll_times[job_name]
+            else:
+                next_poll_times[job_name] = time.monotonic() + interval
+
+        if next_poll_times:
+            await asyncio.sleep(
+                max(min(next_poll_times.values()) - time.monotonic(), 0.0)
+            )
+    return results
@@ -0,0 +1,338 @@
+import collections
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import pickle
+
+import gcs_utils
+import online_predictions
+
+
+# Artifact file names of the pre-built sklearn and xgboost serving
+# containers, in the order they look for them.
+artifact_file_names = ["model.bst", "model.joblib", "model.pkl"]
+
+# Model loaded once per worker process by `load_model`.
+model = None
+
+
+def add_local_prediction_arguments(parser):
+    """Adds local prediction command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--prediction_backend",
+        help="Where instances are scored, by a Vertex AI batch prediction job or by loading the sklearn or xgboost model artifact in this process.",
+        type=str,
+        default="vertex",
+        choices=["vertex", "local"]
+    )
+    parser.add_argument(
+        "--local_artifact_uri",
+        help="Local or GCS directory of model artifact to predict locally with. Empty uses the artifact_uri of the model.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--local_chunk_rows",
+        help="Number of instances parsed and predicted at once by a local worker.",
+        type=int,
+        default=10000
+    )
+    parser.add_argument(
+        "--local_prediction_workers",
+        help="Number of local worker processes. 0 uses one per CPU.",
+        type=int,
+        default=0
+    )
+
+
+def download_artifact(artifact_uri, local_dir):
+    """Downloads model artifact file the serving containers would load.
+
+    Args:
+        artifact_uri: str, local or GCS directory of model artifact.
+        local_dir: str, local directory to download to.
+
+    Returns:
+        Local path of artifact file.
+    """
+    for file_name in artifact_file_names:
+        uri = "{}/{}".format(artifact_uri.rstrip("/"), file_name)
+        if gcs_utils.exists(uri):
+            local_path = os.path.join(local_dir, file_name)
+            gcs_utils.write_bytes(local_path, gcs_utils.read_bytes(uri))
+            return local_path
+    raise FileNotFoundError(
+        "No {} in {}.".format(" or ".join(artifact_file_names), artifact_uri)
+    )
+
+
+def load_model(model_path):
+    """Loads sklearn or xgboost model into this process.
+
+    Args:
+        model_path: str, local path of model.bst, model.joblib or model.pkl.
+    """
+    global model
+    if model_path.endswith(".bst"):
+        # Imported here since only xgboost boosters need it.
+        import xgboost
+
+        model = xgboost.Booster(model_file=model_path)
+    elif model_path.endswith(".joblib"):
+        import joblib
+
+        model = joblib.load(model_path)
+    else:
+        with open(model_path, "rb") as f:
+            model = pickle.load(f)
+
+
+def predict_array(array):
+    """Predicts rows of array with the loaded model.
+
+    Args:
+        array: numpy array of instances.
+
+    Returns:
+        List of predictions.
+    """
+    if type(model).__name__ == "Booster":
+        import xgboost
+
+        return model.predict(xgboost.DMatrix(array)).tolist()
+    return model.predict(array).tolist()
+
+
+def parse_chunk(chunk, instances_format):
+    """Parses chunk of input into instances.
+
+    Args:
+        chunk: list, JSONL lines as str or CSV rows as lists of str.
+        instances_format: str, either "jsonl" or "csv".
+
+    Returns:
+        List of instances, lists of values like batch jobs send them, or
+        dicts for JSONL objects.
+    """
+    if instances_format == "jsonl":
+        return [json.loads(line) for line in chunk]
+    return [
+        [online_predictions.parse_csv_value(value) for value in row]
+        for row in chunk
+    ]
+
+
+def get_feature_names(line):
+    """Gets feature order of dict instances from the first instance.
+
+    Args:
+        line: str, first JSONL line of input.
+
+    Returns:
+        List of field names, empty if instances aren't dicts.
+    """
+    instance = json.loads(line)
+    return list(instance) if isinstance(instance, dict) else []
+
+
+def get_feature_vector(instance, feature_names):
+    """Converts dict instance to a list of values in feature order.
+
+    Args:
+        instance: list or dict, instance.
+        feature_names: list, field names in the order the model expects.
+
+    Returns:
+        List of values.
+
+    Raises:
+        ValueError: if dict instance has other fields than the first.
+    """
+    if not isinstance(instance, dict):
+        return instance
+    if sorted(instance) != sorted(feature_names):
+        raise ValueError(
+            "Instance fields {} differ from fields {} of the first instance.".format(
+                sorted(instance), feature_names
+            )
+        )
+    return [instance[name] for name in feature_names]
+
+
+def predict_chunk(chunk, instances_format, predictions_format, feature_names):
+    """Parses and predicts chunk of input in a worker process.
+
+    Like the pre-built serving containers, instances are passed to the
+    model as a numpy array. The whole chunk is predicted with one
+    vectorized call. If that fails,
+    rows are predicted one by one so only bad rows end up as errors.
+
+    Args:
+        chunk: list, JSONL lines as str or CSV rows as lists of str.
+        instances_format: str, either "jsonl" or "csv".
+        predictions_format: str, either "jsonl" or "csv".
+        feature_names: list, field order of dict instances, which are
+            echoed as they are but predicted as lists of values.
+
+    Returns:
+        Text of predictions lines, text of errors lines and number of
+        errors.
+    """
+    import numpy as np
+
+    instances = parse_chunk(chunk, instances_format)
+    try:
+        predictions = predict_array(
+            np.asarray(
+                [
+                    get_feature_vector(instance, feature_names)
+                    for instance in instances
+                ]
+            )
+        )
+        errors = [None] * len(instances)
+    except Exception:
+        predictions, errors = [], []
+        for instance in instances:
+            try:
+                predictions.append(
+                    predict_array(
+                        np.asarray(
+                            [get_feature_vector(instance, feature_names)]
+                        )
+                    )[0]
+                )
+                errors.append(None)
+            except Exception as error:
+                predictions.append(None)
+                errors.append(error)
+
+    prediction_lines = []
+    error_lines = []
+    for instance, prediction, error in zip(instances, predictions, errors):
+        if error is not None:
+            error_lines.append(online_predictions.format_error(instance, error))
+        else:
+            prediction_lines.append(
+                online_predictions.format_prediction(
+                    instance, prediction, predictions_format
+                )
+            )
+    return "".join(prediction_lines), "".join(error_lines), len(error_lines)
+
+
+def iter_chunks(uris, instances_format, chunk_rows):
+    """Iterates over input rows, a chunk at a time.
+
+    CSV is read with a CSV reader over the stream, so quoted values may
+    span lines.
+
+    Args:
+        uris: list, local paths or GCS URIs of input files.
+        instances_format: str, either "jsonl" or "csv".
+        chunk_rows: int, number of rows per chunk.
+
+    Yields:
+        Tuples of list of JSONL lines as str or CSV rows as lists of str,
+        and CSV header of their file.
+    """
+    for uri in uris:
+        with gcs_utils.open_reader(uri) as f:
+            header = None
+            if instances_format == "csv":
+                rows = csv.reader(
+                    io.TextIOWrapper(f, encoding="utf-8", newline="")
+                )
+                header = next(rows, [])
+            else:
+                rows = (
+                    line.decode("utf-8") for line in f if line.strip()
+                )
+            chunk = []
+            for row in rows:
+                if row:
+                    chunk.append(row)
+                if len(chunk) == chunk_rows:
+                    yield chunk, header
+                    chunk = []
+            if chunk:
+                yield chunk, header
+
+
+def predict_files(arguments, model_path, uris, output_dir):
+    """Predicts input files with a pool of local worker processes.
+
+    Chunks are predicted in parallel but written in input order. At most
+    two chunks per worker are in flight, so memory stays bounded however
+    large the input is.
+
+    Args:
+        arguments: dict, command line arguments.
+        model_path: str, local path of model artifact file.
+        uris: list, local paths or GCS URIs of input files.
+        output_dir: str, local or GCS directory to write files to.
+
+    Returns:
+        Number of instances predicted and number that failed.
+    """
+    workers = arguments["local_prediction_workers"] or os.cpu_count()
+    predictions_format = arguments["predictions_format"]
+    counts = {"predictions": 0, "errors": 0}
+    with gcs_utils.open_writer(
+        "{}/predictions_00001.{}".format(output_dir, predictions_format)
+    ) as predictions_file, gcs_utils.open_writer(
+        "{}/errors_00001.jsonl".format(output_dir)
+    ) as errors_file, concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=load_model, initargs=(model_path,)
+    ) as executor:
+        pending = collections.deque()
+
+        def write_next():
+            future, row_count = pending.popleft()
+            prediction_text, error_text, error_count = future.result()
+            predictions_file.write(prediction_text.encode("utf-8"))
+            errors_file.write(error_text.encode("utf-8"))
+            counts["predictions"] += row_count - error_count
+            counts["errors"] += error_count
+
+        header_written = False
+        feature_names = None
+        for chunk, header in iter_chunks(
+            uris, arguments["instances_format"], arguments["local_chunk_rows"]
+        ):
+            if feature_names is None:
+                feature_names = (
+                    get_feature_names(chunk[0])
+                    if arguments["instances_format"] == "jsonl" else []
+                )
+            if predictions_format == "csv" and not header_written:
+                predictions_file.write(
+                    online_predictions.format_csv_row(
+                        list(header) + ["prediction"]
+                    ).encode("utf-8")
+                )
+                header_written = True
+            pending.append(
+                (
+                    executor.submit(
+                        predict_chunk,
+                        chunk,
+                        arguments["instances_format"],
+                        predictions_format,
+                        feature_names
+                    ),
+                    len(chunk)
+                )
+            )
+            if len(pending) >= 2 * workers:
+                write_next()
+        while pending:
+            write_next()
+    return counts["predictions"], counts["errors"]
+
@@ -0,0 +1,351 @@
+import concurrent.futures
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import gcs_utils
+import searchers
+
+
+# Local searcher used for each Vertex AI search algorithm.
+algorithm_searchers = {
+    "bayesian": "tpe",
+    "random": "random",
+    "grid": "grid"
+}
+
+
+def add_local_trial_arguments(parser):
+    """Adds local trial execution command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--tuning_backend",
+        help="Where trials run, as a Vertex AI tuning job or as local subprocesses.",
+        type=str,
+        default="vertex",
+        choices=["vertex", "local"]
+    )
+    parser.add_argument(
+        "--local_searcher",
+        help='Searcher suggesting local trials, "random", "grid", "tpe", or the import path of a custom searcher class. Empty picks the one matching algorithm.',
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--local_searcher_seed",
+        help="Random seed of the local searcher. 0 uses a random one.",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--local_trials_dir",
+        help="Local directory to install the model package and write trial logs and metrics to. Empty uses a temporary one.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--local_trial_timeout",
+        help="Number of seconds after which a local trial is killed and counted as failed. 0 means no timeout.",
+        type=int,
+        default=0
+    )
+
+
+def install_package(package_path, trials_dir):
+    """Installs model package into the trials directory.
+
+    Args:
+        package_path: str, local path or GCS URI of package tar.gz.
+        trials_dir: str, local directory of trials.
+
+    Returns:
+        Directory the package was installed into, to add to PYTHONPATH.
+    """
+    if package_path.startswith("gs://"):
+        local_path = os.path.join(trials_dir, os.path.basename(package_path))
+        gcs_utils.write_bytes(local_path, gcs_utils.read_bytes(package_path))
+        package_path = local_path
+    package_dir = os.path.join(trials_dir, "package")
+    subprocess.run(
+        [
+            sys.executable, "-m", "pip", "install",
+            "--quiet", "--target", package_dir, package_path
+        ],
+        check=True
+    )
+    return package_dir
+
+
+def format_parameter_args(parameters):
+    """Formats parameter values as trainer args the way Vertex AI does.
+
+    Args:
+        parameters: dict, parameter values keyed by parameter ID.
+
+    Returns:
+        List of "--parameter_id=value" args.
+    """
+    return [
+        "--{}={}".format(parameter_id, value)
+        for parameter_id, value in sorted(parameters.items())
+    ]
+
+
+def read_metric(metric_path, metric_id, goal_type, measurement_selection_type):
+    """Reads final metric of a trial from its hypertune metrics file.
+
+    Trainers report metrics with `cloudml-hypertune`, which appends a JSON
+    line per measurement to the file named by `CLOUD_ML_HP_METRIC_FILE`.
+
+    Args:
+        metric_path: str, local path of metrics file.
+        metric_id: str, name of metric.
+        goal_type: str, either "minimize" or "maximize".
+        measurement_selection_type: str, "last" uses the last measurement,
+            otherwise the best one is used like Vertex AI does by default.
+
+    Returns:
+        Metric value or None if none was reported.
+    """
+    if not os.path.exists(metric_path):
+        return None
+    values = []
+    with open(metric_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                measurement = json.loads(line)
+                if metric_id in measurement:
+                    values.append(float(measurement[metric_id]))
+    if not values:
+        return None
+    if measurement_selection_type == "last":
+        return values[-1]
+    return min(values) if goal_type == "minimize" else max(values)
+
+
+class LocalTrialRunner(object):
+    """Runs trials of a study as subprocesses of this process.
+
+    Each trial runs the trainer's python module with the trainer args and
+    its parameters as "--parameter_id=value" args, like a Vertex AI trial.
+
+    Args:
+        arguments: dict, command line arguments.
+        trials_dir: str, local directory of trials.
+        package_dir: str, directory the model package is installed in, empty
+            if the module is importable already.
+    """
+    def __init__(self, arguments, trials_dir, package_dir):
+        self.arguments = arguments
+        self.trials_dir = trials_dir
+        self.package_dir = package_dir
+        self.processes = {}
+        self.lock = threading.Lock()
+        self.stopped = False
+
+    def run_trial(self, trial_id, parameters):
+        """Runs trial until it exits or times out.
+
+        Args:
+            trial_id: str, ID of trial.
+            parameters: dict, parameter values keyed by parameter ID.
+
+        Returns:
+            Dictionary of trial like the ones of `trial_store.parse_trial`.
+        """
+        trial_dir = os.path.join(self.trials_dir, "trial_{}".format(trial_id))
+        os.makedirs(trial_dir, exist_ok=True)
+        metric_path = os.path.join(trial_dir, "output.metrics")
+        env = dict(
+            os.environ,
+            CLOUD_ML_HP_METRIC_FILE=metric_path,
+            CLOUD_ML_TRIAL_ID=trial_id,
+            AIP_MODEL_DIR=os.path.join(trial_dir, "model")
+        )
+        if self.package_dir:
+            env["PYTHONPATH"] = os.pathsep.join(
+                filter(None, [self.package_dir, env.get("PYTHONPATH")])
+            )
+
+        start_time = time.time()
+        with open(os.path.join(trial_dir, "trial.log"), "w") as log_file:
+            with self.lock:
+                if self.stopped:
+                    return None
+                process = subprocess.Popen(
+                    [sys.executable, "-m", self.arguments["python_module"]]
+                    + self.arguments["trainer_args"]
+                    + format_parameter_args(parameters),
+                    cwd=trial_dir,
+                    env=env,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT
+                )
+                self.processes[trial_id] = process
+            try:
+                return_code = process.wait(
+                    timeout=self.arguments["local_trial_timeout"] or None
+                )
+            except subprocess.TimeoutExpired:
+                process.kill()
+                return_code = process.wait()
+            finally:
+                with self.lock:
+                    del self.processes[trial_id]
+        end_time = time.time()
+        if self.stopped:
+            return None
+
+        metric_value = None
+        if return_code == 0:
+            metric_value = read_metric(
+                metric_path,
+                self.arguments["metric_id"],
+                self.arguments["goal_type"],
+                self.arguments["measurement_selection_type"]
+            )
+        return {
+            "trial_id": trial_id,
+            "state": "INFEASIBLE" if metric_value is None else "SUCCEEDED",
+            "metric_value": math.nan if metric_value is None else metric_value,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration_seconds": end_time - start_time,
+            "parameters": parameters,
+            "return_code": return_code
+        }
+
+    def stop(self):
+        """Kills running trials and stops new ones from starting."""
+        with self.lock:
+            self.stopped = True
+            for process in self.processes.values():
+                process.kill()
+
+
+def create_trials_dir(arguments):
+    """Creates local directory of trials.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Path of directory, a temporary one if none is configured.
+    """
+    if not arguments["local_trials_dir"]:
+        return tempfile.mkdtemp(prefix="vertex_hptuning_")
+    os.makedirs(arguments["local_trials_dir"], exist_ok=True)
+    return arguments["local_trials_dir"]
+
+
+def run_local_study(arguments, trials_dir, seed_trials, on_trial):
+    """Runs study with trials as local subprocesses.
+
+    Trials run `parallel_trial_count` at a time. Whenever one finishes, the
+    searcher is told its result and suggests the next one, until
+    `max_trial_count` trials ran, the searcher runs out of suggestions, or
+    `on_trial` asks to stop.
+
+    Args:
+        arguments: dict, command line arguments.
+        trials_dir: str, local directory of trials.
+        seed_trials: list, earlier trial dictionaries to tell the searcher
+            about before suggesting, i.e. from warm starting.
+        on_trial: function, takes finished trial dictionary and returns
+            whether to stop the study.
+
+    Returns:
+        Dictionary of whether on_trial stopped the study and the finished
+        trials.
+    """
+    assert arguments["python_module"] and not arguments["custom_training_container_uri"], \
+    "Local trials run the python_module of a model package, not custom containers."
+    assert arguments["max_trial_count"] > 0, \
+    "Local studies need max_trial_count."
+
+    package_dir = ""
+    if arguments["model_package_gcs_path"]:
+        package_dir = install_package(
+            arguments["model_package_gcs_path"], trials_dir
+        )
+
+    searcher = searchers.create_searcher(
+        arguments["local_searcher"]
+        or algorithm_searchers[arguments["algorithm"]],
+        arguments["parameters"],
+        arguments["goal_type"],
+        arguments["local_searcher_seed"] or None
+    )
+    for trial in seed_trials:
+        searcher.observe(trial["parameters"], trial["metric_value"])
+
+    runner = LocalTrialRunner(arguments, trials_dir, package_dir)
+    pool_size = max(arguments["parallel_trial_count"], 1)
+    print(
+        "Running up to {} local trials, {} at a time, in {}.".format(
+            arguments["max_trial_count"], pool_size, trials_dir
+        )
+    )
+    trials = []
+    failed_trial_count = 0
+    started_trial_count = 0
+    stopped = False
+    pending = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=pool_size) as executor:
+        while True:
+            while not stopped and len(pending) < pool_size and started_trial_count < arguments["max_trial_count"]:
+                parameters = searcher.suggest()
+                if parameters is None:
+                    break
+                started_trial_count += 1
+                future = executor.submit(
+                    runner.run_trial, str(started_trial_count), parameters
+                )
+                pending[future] = parameters
+            if not pending:
+                break
+
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                parameters = pending.pop(future)
+                trial = future.result()
+                if trial is None:
+                    continue
+                searcher.observe(
+                    parameters,
+                    None if trial["state"] != "SUCCEEDED" else trial["metric_value"]
+                )
+                trials.append(trial)
+                print(
+                    "Trial {} {} with {} = {}".format(
+                        trial["trial_id"],
+                        trial["state"],
+                        arguments["metric_id"],
+                        trial["metric_value"]
+                    )
+                )
+                if trial["state"] != "SUCCEEDED":
+                    failed_trial_count += 1
+                    if arguments["max_failed_trial_count"] and failed_trial_count >= arguments["max_failed_trial_count"]:
+                        runner.stop()
+                        raise RuntimeError(
+                            "Study failed after {} failed trials, see logs in {}.".format(
+                                failed_trial_count, trials_dir
+                            )
+                        )
+                if not stopped and on_trial(trial):
+                    stopped = True
+                    runner.stop()
+
+    return {"stopped": stopped, "trials": trials}
@@ -0,0 +1,312 @@
+import collections.abc
+import csv
+import io
+import json
+import random
+
+import gcs_utils
+import job_poller
+
+
+# Formats the endpoint fast path can read and write like a batch job.
+online_instances_formats = set(["jsonl", "csv"])
+online_predictions_formats = set(["jsonl", "csv"])
+
+
+def add_online_arguments(parser):
+    """Adds online endpoint fast path command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--online_max_instances",
+        help="Inputs with at most this many instances are sent to a deployed endpoint instead of a batch prediction job. 0 always uses a job.",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--online_endpoint_display_name",
+        help="Name of endpoint the model is deployed to, for the online fast path.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--online_endpoint_id",
+        help="Previously created endpoint ID the model is deployed to, for the online fast path.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--online_batch_size",
+        help="Number of instances per online prediction request.",
+        type=int,
+        default=32
+    )
+    parser.add_argument(
+        "--online_max_concurrent_requests",
+        help="Max number of online prediction requests in flight at once.",
+        type=int,
+        default=8
+    )
+    parser.add_argument(
+        "--online_max_attempts",
+        help="Max number of attempts of online prediction requests failing with transient errors.",
+        type=int,
+        default=5
+    )
+    parser.add_argument(
+        "--online_retry_delay",
+        help="Base number of seconds to wait before retrying online prediction requests, doubled every attempt.",
+        type=float,
+        default=0.5
+    )
+    parser.add_argument(
+        "--online_request_timeout",
+        help="Number of seconds before an online prediction request times out.",
+        type=float,
+        default=60.0
+    )
+
+
+def iter_rows(uris, instances_format):
+    """Iterates over instances of JSONL or CSV input files.
+
+    Args:
+        uris: list, local paths or GCS URIs of input files.
+        instances_format: str, either "jsonl" or "csv".
+
+    Yields:
+        Tuples of instance and CSV header of its file, None for JSONL.
+        Like batch jobs, CSV rows become lists of values.
+    """
+    for uri in uris:
+        with gcs_utils.open_reader(uri) as f:
+            lines = io.TextIOWrapper(f, encoding="utf-8", newline="")
+            if instances_format == "jsonl":
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line), None
+                continue
+            reader = csv.reader(lines)
+            header = next(reader, None)
+            for row in reader:
+                if row:
+                    yield [parse_csv_value(value) for value in row], header
+
+
+def parse_csv_value(value):
+    """Parses CSV value as a JSON number or literal if it is one.
+
+    Args:
+        value: str, CSV value.
+
+    Returns:
+        Parsed value or the string itself.
+    """
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def read_small_input(uris, instances_format, max_instances):
+    """Reads instances if there are few enough of them.
+
+    Reading stops as soon as there are too many, so large inputs cost a
+    partial read of their first file.
+
+    Args:
+        uris: list, local paths or GCS URIs of input files.
+        instances_format: str, format of input instances.
+        max_instances: int, max number of instances.
+
+    Returns:
+        List of instances and CSV header, or None if there are too many.
+    """
+    instances = []
+    header = None
+    for instance, header in iter_rows(uris, instances_format):
+        if len(instances) == max_instances:
+            return None
+        instances.append(instance)
+    return instances, header
+
+
+def to_json_value(value):
+    """Converts protobuf map and list values to plain dicts and lists.
+
+    Args:
+        value: prediction value.
+
+    Returns:
+        JSON serializable value.
+    """
+    if isinstance(value, collections.abc.Mapping):
+        return {key: to_json_value(item) for key, item in value.items()}
+    if isinstance(value, collections.abc.Sequence) and not isinstance(value, str):
+        return [to_json_value(item) for item in value]
+    return value
+
+
+async def predict_batch(client, endpoint_name, instances, arguments):
+    """Predicts batch of instances, retrying transient errors.
+
+    Args:
+        client: instance of `PredictionServiceAsyncClient`.
+        endpoint_name: str, resource name of endpoint.
+        instances: list, instances of batch.
+        arguments: dict, command line arguments.
+
+    Returns:
+        List of predictions and None, or None and the error if the batch
+        failed.
+    """
+    import asyncio
+
+    for attempt in range(arguments["online_max_attempts"]):
+        try:
+            response = await client.predict(
+                endpoint=endpoint_name,
+                instances=instances,
+                timeout=arguments["online_request_timeout"]
+            )
+            predictions = [
+                to_json_value(prediction) for prediction in response.predictions
+            ]
+            assert len(predictions) == len(instances), \
+            "Endpoint returned {} predictions for {} instances.".format(
+                len(predictions), len(instances)
+            )
+            return predictions, None
+        except Exception as error:
+            if not job_poller.is_transient_error(error) or attempt + 1 == arguments["online_max_attempts"]:
+                return None, error
+            # Full jitter spreads out retries of requests throttled at once.
+            delay = random.uniform(
+                0.0, arguments["online_retry_delay"] * 2 ** attempt
+            )
+            print(
+                "Transient error predicting batch: {}. Retrying in {:.1f}s.".format(
+                    error, delay
+                )
+            )
+            await asyncio.sleep(delay)
+
+
+async def predict_instances(client, endpoint_name, instances, arguments):
+    """Predicts instances with concurrent batched requests.
+
+    Args:
+        client: instance of `PredictionServiceAsyncClient`.
+        endpoint_name: str, resource name of endpoint.
+        instances: list, instances to predict.
+        arguments: dict, command line arguments.
+
+    Returns:
+        List of tuples of instance, prediction and error, in input order.
+    """
+    import asyncio
+
+    semaphore = asyncio.Semaphore(arguments["online_max_concurrent_requests"])
+    batch_size = arguments["online_batch_size"]
+
+    async def predict(batch):
+        async with semaphore:
+            return await predict_batch(client, endpoint_name, batch, arguments)
+
+    batches = [
+        instances[start:start + batch_size]
+        for start in range(0, len(instances), batch_size)
+    ]
+    # Gathered results keep the order of batches, whatever order they end in.
+    outcomes = await asyncio.gather(*[predict(batch) for batch in batches])
+    results = []
+    for batch, (predictions, error) in zip(batches, outcomes):
+        for index, instance in enumerate(batch):
+            results.append(
+                (instance, predictions[index] if predictions else None, error)
+            )
+    return results
+
+
+def format_csv_row(values):
+    """Formats values as a CSV line.
+
+    Args:
+        values: list, values, non-strings are written as JSON.
+
+    Returns:
+        CSV line with its newline.
+    """
+    line = io.StringIO()
+    csv.writer(line, lineterminator="\n").writerow(
+        [value if isinstance(value, str) else json.dumps(value) for value in values]
+    )
+    return line.getvalue()
+
+
+def format_prediction(instance, prediction, predictions_format):
+    """Formats prediction as a line of a batch job's predictions file.
+
+    Args:
+        instance: instance that was predicted.
+        prediction: prediction of instance.
+        predictions_format: str, either "jsonl" or "csv".
+
+    Returns:
+        Line with its newline.
+    """
+    if predictions_format == "csv":
+        return format_csv_row(list(instance) + [prediction])
+    return json.dumps({"instance": instance, "prediction": prediction}) + "\n"
+
+
+def format_error(instance, error):
+    """Formats error as a line of a batch job's errors file.
+
+    Args:
+        instance: instance that failed.
+        error: exception or message of failure.
+
+    Returns:
+        JSON line with its newline.
+    """
+    return json.dumps(
+        {"instance": instance, "error": {"message": str(error)}}
+    ) + "\n"
+
+
+def write_outputs(output_dir, predictions_format, header, results):
+    """Writes predictions and errors files like a batch prediction job.
+
+    Args:
+        output_dir: str, local or GCS directory to write files to.
+        predictions_format: str, either "jsonl" or "csv".
+        header: list, CSV header of instances, None for JSONL instances.
+        results: list, tuples of instance, prediction and error.
+
+    Returns:
+        Number of instances predicted and number that failed.
+    """
+    predictions = io.StringIO()
+    errors = io.StringIO()
+    if predictions_format == "csv":
+        predictions.write(format_csv_row(list(header or []) + ["prediction"]))
+    prediction_count = 0
+    for instance, prediction, error in results:
+        if error is not None:
+            errors.write(format_error(instance, error))
+            continue
+        prediction_count += 1
+        predictions.write(
+            format_prediction(instance, prediction, predictions_format)
+        )
+    gcs_utils.write_text(
+        "{}/predictions_00001.{}".format(output_dir, predictions_format),
+        predictions.getvalue()
+    )
+    gcs_utils.write_text(
+        "{}/errors_00001.jsonl".format(output_dir), errors.getvalue()
+    )
+    return prediction_count, len(results) - prediction_count
@@ -0,0 +1,579 @@
+import collections
+import concurrent.futures
+import csv
+import heapq
+import io
+import itertools
+import json
+import operator
+import os
+import pickle
+import tempfile
+import time
+
+import gcs_utils
+import online_predictions
+
+
+# Formats predictions can be compacted into, by file extension.
+compact_formats = ["jsonl", "csv", "parquet"]
+
+# Number of records pickled, written or read back at once.
+block_rows = 10000
+
+
+def add_compaction_arguments(parser):
+    """Adds prediction output compaction command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--compact_output_uri",
+        help="Local or GCS directory to compact predictions into a few large files sorted by key. Empty leaves predictions as they are written.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--compact_format",
+        help="Format of compacted prediction files.",
+        type=str,
+        default="jsonl",
+        choices=compact_formats
+    )
+    parser.add_argument(
+        "--compact_key_field",
+        help="Field of instances, or column of CSV instances, that keys predictions.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--compact_include_instances",
+        help="Whether compacted predictions keep their instance next to their key.",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--compact_file_rows",
+        help="Max number of predictions per compacted file.",
+        type=int,
+        default=1000000
+    )
+    parser.add_argument(
+        "--compact_buffer_rows",
+        help="Number of predictions sorted in memory before spilling a sorted run to local disk.",
+        type=int,
+        default=200000
+    )
+    parser.add_argument(
+        "--compact_read_workers",
+        help="Number of prediction files read at once.",
+        type=int,
+        default=8
+    )
+
+
+def is_prediction_file(uri):
+    """Checks whether file holds predictions, not errors or metadata.
+
+    Args:
+        uri: str, local path or GCS URI of output file.
+
+    Returns:
+        Bool.
+    """
+    name = os.path.basename(uri)
+    return name.startswith("prediction") and "error" not in name
+
+
+def overlaps(uri, other_uri):
+    """Checks whether one directory is, or is inside, the other.
+
+    Args:
+        uri: str, local or GCS directory.
+        other_uri: str, local or GCS directory.
+
+    Returns:
+        Bool.
+    """
+    uri = uri.rstrip("/")
+    other_uri = other_uri.rstrip("/")
+    return (
+        uri == other_uri
+        or uri.startswith(other_uri + "/")
+        or other_uri.startswith(uri + "/")
+    )
+
+
+def check_output_uri(output_uri, source_uris):
+    """Checks that compacted files can't overwrite or delete source files.
+
+    Args:
+        output_uri: str, local or GCS directory to compact into.
+        source_uris: list, local paths or GCS URIs of files compaction must
+            leave alone, i.e. inputs and predictions.
+    """
+    for source_dir in sorted(set(os.path.dirname(uri) for uri in source_uris)):
+        assert not overlaps(output_uri, source_dir), \
+        "compact_output_uri {} overlaps {}, compact into a directory of its own.".format(
+            output_uri, source_dir
+        )
+
+
+def get_manifest_uri(output_uri):
+    """Gets URI of manifest of compacted files.
+
+    Args:
+        output_uri: str, local or GCS directory of compacted files.
+
+    Returns:
+        URI of manifest.
+    """
+    return "{}/manifest.json".format(output_uri.rstrip("/"))
+
+
+def read_csv_header(uri):
+    """Reads header of CSV file.
+
+    Args:
+        uri: str, local path or GCS URI of CSV file.
+
+    Returns:
+        List of column names.
+    """
+    with gcs_utils.open_reader(uri) as f:
+        return next(csv.reader([f.readline().decode("utf-8")]), [])
+
+
+def iter_file_contents(uris, max_workers):
+    """Iterates over contents of files, reading several ahead at once.
+
+    Prediction files are many and small, so reading them one at a time is
+    bound by per file latency. At most `max_workers` files are held.
+
+    Args:
+        uris: list, local paths or GCS URIs of files.
+        max_workers: int, max number of files read at once.
+
+    Yields:
+        Tuples of URI and bytes of file, in order of uris.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        for uri in uris:
+            pending.append((uri, executor.submit(gcs_utils.read_bytes, uri)))
+            if len(pending) > max_workers:
+                uri, future = pending.popleft()
+                yield uri, future.result()
+        while pending:
+            uri, future = pending.popleft()
+            yield uri, future.result()
+
+
+def get_key(instance, key_field, key_index):
+    """Gets key of instance.
+
+    Args:
+        instance: dict or list, instance echoed with its prediction.
+        key_field: str, field of dict instances.
+        key_index: int, position of key in list instances, None if unknown.
+
+    Returns:
+        Key value or None if instance has no key.
+    """
+    if isinstance(instance, dict):
+        return instance.get(key_field)
+    assert key_index is not None, \
+    "List instances need a CSV header or integer key field to key by {}.".format(
+        key_field
+    )
+    return instance[key_index] if key_index < len(instance) else None
+
+
+def get_sort_key(key):
+    """Gets sort key that totally orders keys of any type.
+
+    Numbers come first, then strings, then lists and dicts by their JSON,
+    then missing keys. CSV keys are parsed, so "7" and "007" become a
+    number and a string.
+
+    Args:
+        key: key value, None if missing.
+
+    Returns:
+        Tuple of type rank and value comparable within the rank.
+    """
+    if key is None:
+        return (3, "")
+    if isinstance(key, (bool, int, float)):
+        return (0, key)
+    if isinstance(key, str):
+        return (1, key)
+    return (2, json.dumps(key, sort_keys=True))
+
+
+def iter_records(uris, arguments, header):
+    """Iterates over predictions of files as records keyed for sorting.
+
+    Args:
+        uris: list, local paths or GCS URIs of prediction files.
+        arguments: dict, command line arguments.
+        header: list, CSV header of instances, None if unknown.
+
+    Yields:
+        Tuples of sort key, key, prediction and instance, None unless
+        instances are kept.
+    """
+    key_field = arguments["compact_key_field"]
+    include_instances = arguments["compact_include_instances"]
+    key_index = None
+    if header and key_field in header:
+        key_index = header.index(key_field)
+    elif key_field.isdigit():
+        key_index = int(key_field)
+
+    for uri, data in iter_file_contents(uris, arguments["compact_read_workers"]):
+        text = data.decode("utf-8")
+        if arguments["predictions_format"] == "csv":
+            rows = csv.reader(io.StringIO(text, newline=""))
+            # Predictions are the last column, after the instance's.
+            file_header = next(rows, [])
+            file_key_index = (
+                file_header.index(key_field) if key_field in file_header
+                else key_index
+            )
+            for row in rows:
+                if not row:
+                    continue
+                values = [
+                    online_predictions.parse_csv_value(value) for value in row
+                ]
+                instance = values[:-1]
+                key = get_key(instance, key_field, file_key_index)
+                yield (
+                    get_sort_key(key),
+                    key,
+                    values[-1],
+                    instance if include_instances else None
+                )
+            continue
+        # Not splitlines, which also splits at separators JSON leaves raw.
+        for line in text.split("\n"):
+            if not line.strip():
+                continue
+            prediction = json.loads(line)
+            key = get_key(prediction["instance"], key_field, key_index)
+            yield (
+                get_sort_key(key),
+                key,
+                prediction["prediction"],
+                prediction["instance"] if include_instances else None
+            )
+
+
+def write_run(records, path):
+    """Writes sorted run of records to a local file.
+
+    Args:
+        records: list, sorted records.
+        path: str, local path of run file.
+    """
+    with open(path, "wb") as f:
+        for start in range(0, len(records), block_rows):
+            pickle.dump(
+                records[start:start + block_rows],
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+
+
+def iter_run(path):
+    """Iterates over records of a run file, a block at a time.
+
+    Args:
+        path: str, local path of run file.
+
+    Yields:
+        Records in sorted order.
+    """
+    with open(path, "rb") as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+
+def iter_sorted_records(records, buffer_rows, run_dir):
+    """Sorts records by key with bounded memory.
+
+    Up to `buffer_rows` records are sorted in memory at a time. If there
+    are more, each sorted buffer is spilled to a run file and the runs are
+    merged lazily, holding one block per run.
+
+    Args:
+        records: iterable of records.
+        buffer_rows: int, max number of records sorted in memory.
+        run_dir: str, local directory to spill runs to.
+
+    Yields:
+        Records in key order, records with equal keys in input order.
+    """
+    run_paths = []
+    buffer = []
+    for record in records:
+        buffer.append(record)
+        if len(buffer) >= buffer_rows:
+            buffer.sort(key=operator.itemgetter(0))
+            run_paths.append(
+                os.path.join(run_dir, "run-{:05d}".format(len(run_paths)))
+            )
+            write_run(buffer, run_paths[-1])
+            buffer = []
+    buffer.sort(key=operator.itemgetter(0))
+    if not run_paths:
+        yield from buffer
+        return
+    print("Merging {} sorted runs.".format(len(run_paths) + 1))
+    yield from heapq.merge(
+        *[iter_run(path) for path in run_paths] + [iter(buffer)],
+        key=operator.itemgetter(0)
+    )
+
+
+def get_rows(records, key_field, include_instances):
+    """Converts records to rows of compacted predictions.
+
+    Args:
+        records: list, records.
+        key_field: str, name of key column.
+        include_instances: bool, whether rows keep their instance.
+
+    Returns:
+        List of dictionaries.
+    """
+    if include_instances:
+        return [
+            {key_field: key, "prediction": prediction, "instance": instance}
+            for _, key, prediction, instance in records
+        ]
+    return [
+        {key_field: key, "prediction": prediction}
+        for _, key, prediction, _ in records
+    ]
+
+
+def iter_unified_schemas(records, arguments, schemas):
+    """Passes records through, unifying the Parquet schemas of every block.
+
+    Prediction types can differ across shards, i.e. ints in one and floats
+    or nulls in another, so the schema of whichever block comes first in
+    key order won't do. Numbers are widened and missing values made
+    nullable.
+
+    Args:
+        records: iterable of records.
+        arguments: dict, command line arguments.
+        schemas: list, holds the unified schema once records are exhausted.
+
+    Yields:
+        Records as they come.
+    """
+    block = []
+    for record in records:
+        block.append(record)
+        if len(block) == block_rows:
+            schemas[:] = [unify_schemas(schemas, block, arguments)]
+            block = []
+        yield record
+    if block or not schemas:
+        schemas[:] = [unify_schemas(schemas, block, arguments)]
+
+
+def unify_schemas(schemas, records, arguments):
+    """Unifies schemas with the Parquet schema of records.
+
+    Args:
+        schemas: list, schemas unified so far.
+        records: list, sampled records.
+        arguments: dict, command line arguments.
+
+    Returns:
+        Unified instance of `pyarrow.Schema`.
+    """
+    # Imported here since only Parquet output needs it.
+    import pyarrow
+
+    rows = get_rows(
+        records,
+        arguments["compact_key_field"],
+        arguments["compact_include_instances"]
+    )
+    if not rows:
+        rows = get_rows(
+            [(None, None, None, None)],
+            arguments["compact_key_field"],
+            arguments["compact_include_instances"]
+        )
+    try:
+        return pyarrow.unify_schemas(
+            schemas + [pyarrow.Table.from_pylist(rows).schema],
+            promote_options="permissive"
+        )
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError) as error:
+        raise TypeError(
+            "Keys, predictions or instances mix types Parquet can't hold in one column, compact to jsonl or csv instead: {}".format(
+                error
+            )
+        )
+
+
+def write_file(uri, records, arguments, schema=None):
+    """Writes records into one compacted file, a block at a time.
+
+    Args:
+        uri: str, local path or GCS URI of file.
+        records: iterator of sorted records, consumed up to the file's rows.
+        arguments: dict, command line arguments.
+        schema: instance of `pyarrow.Schema` of Parquet files.
+
+    Returns:
+        Number of records written.
+    """
+    key_field = arguments["compact_key_field"]
+    include_instances = arguments["compact_include_instances"]
+    compact_format = arguments["compact_format"]
+    row_count = 0
+    writer = None
+    with gcs_utils.open_writer(uri) as f:
+        if compact_format == "csv":
+            f.write(
+                online_predictions.format_csv_row(
+                    [key_field, "prediction"]
+                    + (["instance"] if include_instances else [])
+                ).encode("utf-8")
+            )
+        while row_count < arguments["compact_file_rows"]:
+            block = list(
+                itertools.islice(
+                    records,
+                    min(block_rows, arguments["compact_file_rows"] - row_count)
+                )
+            )
+            if not block:
+                break
+            row_count += len(block)
+            rows = get_rows(block, key_field, include_instances)
+            if compact_format == "jsonl":
+                f.write(
+                    "".join(json.dumps(row) + "\n" for row in rows).encode("utf-8")
+                )
+            elif compact_format == "csv":
+                # One writer per block, non-strings as JSON like batch jobs.
+                text = io.StringIO()
+                csv.writer(text, lineterminator="\n").writerows(
+                    [
+                        value if isinstance(value, str) else json.dumps(value)
+                        for value in row.values()
+                    ]
+                    for row in rows
+                )
+                f.write(text.getvalue().encode("utf-8"))
+            else:
+                # Imported here since only Parquet output needs it.
+                import pyarrow
+                import pyarrow.parquet
+
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(f, schema)
+                writer.write_table(
+                    pyarrow.Table.from_pylist(rows, schema=schema)
+                )
+        if compact_format == "parquet":
+            if writer is None:
+                import pyarrow.parquet
+
+                # Still a valid Parquet file when there are no predictions.
+                writer = pyarrow.parquet.ParquetWriter(f, schema)
+            writer.close()
+    return row_count
+
+
+def compact_predictions(arguments, prediction_uris, header=None):
+    """Compacts prediction files into a few large files sorted by key.
+
+    Prediction files are streamed, each prediction is joined to the key
+    of the instance it echoes, and the predictions are sorted by key with
+    bounded memory into files of `compact_file_rows` predictions each,
+    named `predictions-<part>.<format>` in key order. The files are listed
+    in a manifest, and files the previous manifest listed that weren't
+    rewritten are deleted. Nothing else in the output directory is.
+
+    Args:
+        arguments: dict, command line arguments.
+        prediction_uris: list, local paths or GCS URIs of prediction files.
+        header: list, CSV header of instances, None if unknown.
+
+    Returns:
+        List of URIs of compacted files and number of predictions.
+    """
+    assert arguments["compact_key_field"], \
+    "Compacting predictions needs compact_key_field."
+    output_uri = arguments["compact_output_uri"].rstrip("/")
+    check_output_uri(output_uri, prediction_uris)
+    extension = arguments["compact_format"]
+    previous_manifest = gcs_utils.read_json(
+        get_manifest_uri(output_uri), default={}
+    )
+    output_uris = []
+    row_count = 0
+    schemas = []
+    with tempfile.TemporaryDirectory() as run_dir:
+        records = iter_records(prediction_uris, arguments, header)
+        if extension == "parquet":
+            records = iter_unified_schemas(records, arguments, schemas)
+        records = iter_sorted_records(
+            records, arguments["compact_buffer_rows"], run_dir
+        )
+        while True:
+            # Every record was read, and schemas unified, once one comes out.
+            first_record = next(records, None)
+            if first_record is None and output_uris:
+                break
+            uri = "{}/predictions-{:05d}.{}".format(
+                output_uri, len(output_uris), extension
+            )
+            file_rows = write_file(
+                uri,
+                itertools.chain([first_record], records)
+                if first_record is not None else iter([]),
+                arguments,
+                schemas[0] if schemas else None
+            )
+            output_uris.append(uri)
+            row_count += file_rows
+            if file_rows < arguments["compact_file_rows"]:
+                break
+
+    gcs_utils.write_text(
+        get_manifest_uri(output_uri),
+        json.dumps(
+            {
+                "output_uris": output_uris,
+                "row_count": row_count,
+                "prediction_uris": prediction_uris,
+                "created_at": time.time()
+            },
+            indent=2,
+            sort_keys=True
+        )
+    )
+    for uri in previous_manifest.get("output_uris", []):
+        if uri not in output_uris:
+            gcs_utils.delete(uri)
+    print(
+        "Compacted {} predictions of {} files into {} files in {}".format(
+            row_count, len(prediction_uris), len(output_uris), output_uri
+        )
+    )
+    return output_uris, row_count
@@ -0,0 +1,320 @@
+import concurrent.futures
+import json
+import math
+import os
+import time
+
+import gcs_utils
+
+
+# Instances formats whose files can be split at line boundaries.
+line_formats = set(["jsonl", "csv"])
+
+
+def add_shard_arguments(parser):
+    """Adds sharded batch prediction command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--shard_count",
+        help="Number of batch prediction jobs to spread the input over. 0 or 1 runs a single job.",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--shard_split_bytes",
+        help="JSONL and CSV input files larger than this are split at line boundaries into pieces of about this size. 0 uses an even share of the input per shard.",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--shard_regions",
+        help="Comma separated regions to spread shard jobs over, each needs a model with model_display_name. Empty uses region.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--max_concurrent_submissions",
+        help="Max number of shard jobs to submit or poll, or files to copy, at once.",
+        type=int,
+        default=10
+    )
+
+
+def get_regions(arguments):
+    """Gets regions to spread shard jobs over.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        List of regions.
+    """
+    regions = [
+        region.strip() for region in arguments["shard_regions"].split(",")
+        if region.strip()
+    ]
+    return regions or [arguments["region"]]
+
+
+def list_input_files(gcs_source):
+    """Lists non-empty input files of batch prediction.
+
+    Args:
+        gcs_source: str, GCS URI of input files, optionally with wildcards.
+
+    Returns:
+        Sorted list of tuples of URI and size in bytes.
+    """
+    files = sorted(
+        (uri, size) for uri, size in gcs_utils.get_sizes(gcs_source).items()
+        if size
+    )
+    assert files, "No input files match {}.".format(gcs_source)
+    return files
+
+
+def find_line_end(uri, offset, size, window=2 ** 16):
+    """Finds end of the line that the byte at offset is in.
+
+    Args:
+        uri: str, local path or GCS URI of file.
+        offset: int, offset of byte.
+        size: int, size of file in bytes.
+        window: int, number of bytes read at once while looking.
+
+    Returns:
+        Offset after the next newline, or size if there is none.
+    """
+    while offset < size:
+        chunk = gcs_utils.read_range(uri, offset, min(offset + window, size))
+        index = chunk.find(b"\n")
+        if index >= 0:
+            return offset + index + 1
+        offset += len(chunk)
+    return size
+
+
+def split_file(uri, size, split_bytes):
+    """Splits file into byte ranges of whole lines.
+
+    Only a small window around each split point is read, not the file.
+
+    Args:
+        uri: str, local path or GCS URI of file.
+        size: int, size of file in bytes.
+        split_bytes: int, approximate size of ranges.
+
+    Returns:
+        List of tuples of start and end offsets.
+    """
+    ranges = []
+    start = 0
+    while start < size:
+        end = size
+        if size - start > split_bytes:
+            end = find_line_end(uri, start + split_bytes - 1, size)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def plan_shards(files, instances_format, shard_count, split_bytes):
+    """Splits input files into pieces and balances them over shards.
+
+    Args:
+        files: list, tuples of URI and size in bytes of input files.
+        instances_format: str, format of input instances.
+        shard_count: int, max number of shards.
+        split_bytes: int, line format files larger than this are split, 0
+            uses an even share of the input per shard.
+
+    Returns:
+        List of shard dictionaries with their pieces and total size.
+    """
+    if not split_bytes:
+        split_bytes = max(
+            math.ceil(sum(size for _, size in files) / shard_count), 1
+        )
+    pieces = []
+    for uri, size in files:
+        ranges = [(0, size)]
+        if instances_format in line_formats and size > split_bytes:
+            ranges = split_file(uri, size, split_bytes)
+        for start, end in ranges:
+            pieces.append(
+                {
+                    "uri": uri,
+                    "start": start,
+                    "end": end,
+                    "file_size": size
+                }
+            )
+
+    # Largest pieces first, each to the smallest shard so far, keeps
+    # shards even so no single job holds up the rest.
+    shards = [
+        {"pieces": [], "size": 0}
+        for _ in range(min(shard_count, len(pieces)))
+    ]
+    for piece in sorted(
+        pieces, key=lambda piece: piece["end"] - piece["start"], reverse=True
+    ):
+        shard = min(shards, key=lambda shard: shard["size"])
+        shard["pieces"].append(piece)
+        shard["size"] += piece["end"] - piece["start"]
+    return shards
+
+
+def stage_pieces(shards, staging_uri, instances_format, max_workers):
+    """Copies partial file pieces to files of their own.
+
+    Batch prediction jobs read whole files, so split pieces are copied by
+    byte range. Pieces of CSV files get the header of their file. Whole
+    files are used as they are.
+
+    Args:
+        shards: list, shard dictionaries of `plan_shards`.
+        staging_uri: str, GCS prefix to copy pieces to.
+        instances_format: str, format of input instances.
+        max_workers: int, max number of pieces copied at once.
+    """
+    headers = {}
+    copies = []
+    for piece in [piece for shard in shards for piece in shard["pieces"]]:
+        if piece["start"] == 0 and piece["end"] == piece["file_size"]:
+            piece["staged_uri"] = piece["uri"]
+            continue
+        header = b""
+        if instances_format == "csv" and piece["start"] > 0:
+            if piece["uri"] not in headers:
+                headers[piece["uri"]] = gcs_utils.read_range(
+                    piece["uri"],
+                    0,
+                    find_line_end(piece["uri"], 0, piece["file_size"])
+                )
+            header = headers[piece["uri"]]
+        piece["staged_uri"] = "{}/input-{:05d}{}".format(
+            staging_uri.rstrip("/"),
+            len(copies),
+            os.path.splitext(piece["uri"])[1]
+        )
+        copies.append(
+            (piece["uri"], piece["staged_uri"], piece["start"], piece["end"], header)
+        )
+
+    print("Copying {} split input pieces.".format(len(copies)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [
+            executor.submit(gcs_utils.copy_range, *copy_args)
+            for copy_args in copies
+        ]:
+            future.result()
+
+
+def merge_outputs(shard_results, destination_prefix, max_workers):
+    """Copies output files of shard jobs into one destination prefix.
+
+    Each file keeps its name with the shard index appended, i.e.
+    predictions_00001.jsonl of shard 3 becomes predictions_00001-00003.jsonl.
+
+    Args:
+        shard_results: list, shard result dictionaries with the output
+            directory of their job.
+        destination_prefix: str, GCS prefix to merge outputs into.
+        max_workers: int, max number of files copied at once.
+
+    Returns:
+        List of lists of merged output URIs, one per shard.
+    """
+    copies = []
+    merged_uris = []
+    for shard_result in shard_results:
+        shard_uris = []
+        for uri in gcs_utils.list_uris(
+            "{}/*".format(shard_result["output_dir"].rstrip("/"))
+        ):
+            stem, extension = os.path.splitext(os.path.basename(uri))
+            merged_uri = "{}/{}-{:05d}{}".format(
+                destination_prefix.rstrip("/"),
+                stem,
+                shard_result["shard"],
+                extension
+            )
+            copies.append((uri, merged_uri))
+            shard_uris.append(merged_uri)
+        merged_uris.append(shard_uris)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [
+            executor.submit(gcs_utils.copy, *copy_args) for copy_args in copies
+        ]:
+            future.result()
+    return merged_uris
+
+
+def delete_files(uris, max_workers):
+    """Deletes files.
+
+    Args:
+        uris: list, local paths or GCS URIs.
+        max_workers: int, max number of files deleted at once.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(gcs_utils.delete, uri) for uri in uris]:
+            future.result()
+
+
+def get_manifest_uri(destination_prefix):
+    """Gets URI of manifest of sharded batch prediction.
+
+    Args:
+        destination_prefix: str, GCS prefix of merged outputs.
+
+    Returns:
+        URI of manifest.
+    """
+    return "{}/manifest.json".format(destination_prefix.rstrip("/"))
+
+
+def write_manifest(destination_prefix, arguments, shard_results):
+    """Writes manifest of the shards and their inputs, jobs and outputs.
+
+    Args:
+        destination_prefix: str, GCS prefix of merged outputs.
+        arguments: dict, command line arguments.
+        shard_results: list, shard result dictionaries.
+
+    Returns:
+        URI of manifest.
+    """
+    manifest = {
+        "gcs_source": arguments["gcs_source"],
+        "instances_format": arguments["instances_format"],
+        "predictions_format": arguments["predictions_format"],
+        "shards": shard_results,
+        "output_uris": [
+            uri for shard_result in shard_results
+            for uri in shard_result.get("output_uris", [])
+        ],
+        "created_at": time.time()
+    }
+    manifest_uri = get_manifest_uri(destination_prefix)
+    gcs_utils.write_text(
+        manifest_uri, json.dumps(manifest, indent=2, sort_keys=True)
+    )
+    return manifest_uri
+
+
+def read_manifest(destination_prefix):
+    """Reads manifest of sharded batch prediction.
+
+    Args:
+        destination_prefix: str, GCS prefix of merged outputs.
+
+    Returns:
+        Dictionary of manifest or None if there is none.
+    """
+    return gcs_utils.read_json(get_manifest_uri(destination_prefix))
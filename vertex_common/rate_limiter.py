@@ -0,0 +1,368 @@
+import atexit
+import collections
+import json
+import threading
+import time
+
+import gcs_utils
+
+
+# Client methods that send an RPC and are rate limited. Other attributes,
+# i.e. resource path helpers, pass through.
+rpc_method_prefixes = (
+    "create_",
+    "get_",
+    "list_",
+    "cancel_",
+    "delete_",
+    "update_",
+    "deploy_",
+    "undeploy_",
+    "upload_",
+    "export_",
+    "predict",
+    "raw_predict",
+    "explain"
+)
+
+# Limiter of this process, set by `configure`.
+limiter = None
+
+# Takes a token out of a Redis bucket, reserving a future one if it is empty,
+# and returns the number of seconds to wait for it. Uses the server clock so
+# pods with skewed clocks agree on refills.
+redis_take_token_script = """
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local server_time = redis.call("TIME")
+local now = tonumber(server_time[1]) + tonumber(server_time[2]) / 1000000
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate) - 1
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("EXPIRE", KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(math.max(-tokens / rate, 0))
+"""
+
+
+def add_rate_limit_arguments(parser):
+    """Adds rate limit command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--rate_limits",
+        help='JSON dict of token buckets keyed by client method, i.e. "get_custom_job", verb, i.e. "get", or "default", each with "rate" in requests per second and "burst". Methods matched by the same key share a bucket. Empty disables rate limiting.',
+        type=json.loads,
+        default={}
+    )
+    parser.add_argument(
+        "--rate_limit_store",
+        help="Where buckets are kept. Empty keeps them in process, a local path, i.e. on a shared volume, or a redis:// URL shares them across processes.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--rate_limit_metrics_path",
+        help="Local or GCS path to write JSON throttling metrics to at exit.",
+        type=str,
+        default=""
+    )
+
+
+def take_token(state, rate, burst, now):
+    """Takes token from bucket, reserving a future one if it is empty.
+
+    Reserving rather than retrying means each call touches the store once
+    and waiting callers are served in the order they arrived.
+
+    Args:
+        state: list, tokens and update time of bucket, or None if new.
+        rate: float, number of tokens added per second.
+        burst: float, max number of tokens.
+        now: float, epoch seconds.
+
+    Returns:
+        New state of bucket and number of seconds to wait for the token.
+    """
+    tokens, updated = state if state else (burst, now)
+    tokens = min(burst, tokens + max(now - updated, 0.0) * rate) - 1
+    return [tokens, now], max(-tokens / rate, 0.0)
+
+
+class MemoryStore(object):
+    """Keeps buckets in process."""
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def reserve(self, key, rate, burst):
+        with self.lock:
+            self.buckets[key], wait = take_token(
+                self.buckets.get(key), rate, burst, time.time()
+            )
+        return wait
+
+
+class FileStore(object):
+    """Keeps buckets in a locked JSON file shared by processes.
+
+    Args:
+        path: str, local path of JSON file, i.e. on a shared volume.
+    """
+    def __init__(self, path):
+        assert not path.startswith("gs://"), \
+        "GCS is too slow to coordinate every RPC, use a local path or Redis."
+        self.path = path
+
+    def reserve(self, key, rate, burst):
+        result = {}
+
+        def update(buckets):
+            buckets[key], result["wait"] = take_token(
+                buckets.get(key), rate, burst, time.time()
+            )
+
+        gcs_utils.update_json(self.path, update)
+        return result["wait"]
+
+
+class RedisStore(object):
+    """Keeps buckets in Redis or a Redis compatible store, i.e. Memorystore.
+
+    Args:
+        url: str, Redis URL, i.e. redis://10.0.0.3:6379/0.
+    """
+    def __init__(self, url):
+        # Imported here since only shared Redis stores need it.
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.take_token = self.client.register_script(redis_take_token_script)
+
+    def reserve(self, key, rate, burst):
+        return float(
+            self.take_token(
+                keys=["vertex_rate_limit:{}".format(key)], args=[rate, burst]
+            )
+        )
+
+
+def create_store(store_uri):
+    """Creates bucket store.
+
+    Args:
+        store_uri: str, empty, local path, or redis:// URL.
+
+    Returns:
+        Bucket store.
+    """
+    if not store_uri:
+        return MemoryStore()
+    if store_uri.startswith(("redis://", "rediss://")):
+        return RedisStore(store_uri)
+    return FileStore(store_uri)
+
+
+class RateLimiter(object):
+    """Token bucket rate limiter of client methods.
+
+    Args:
+        rate_limits: dict, buckets keyed by method, verb or "default".
+        store: bucket store, i.e. instance of `MemoryStore`.
+    """
+    def __init__(self, rate_limits, store):
+        for key, bucket in rate_limits.items():
+            assert bucket.get("rate", 0) > 0, \
+            "Rate limit {} needs a positive rate.".format(key)
+        self.rate_limits = rate_limits
+        self.store = store
+        self.metrics = collections.defaultdict(
+            lambda: {"calls": 0, "throttled_calls": 0, "throttled_seconds": 0.0}
+        )
+        self.lock = threading.Lock()
+
+    def get_bucket_key(self, method):
+        """Gets key of bucket method draws from.
+
+        Args:
+            method: str, name of client method.
+
+        Returns:
+            Bucket key or None if method is not rate limited.
+        """
+        verb = method.split("_")[0]
+        for key in [method, verb, "default"]:
+            if key in self.rate_limits:
+                return key
+        return None
+
+    def reserve(self, method):
+        """Takes token for method call.
+
+        Args:
+            method: str, name of client method.
+
+        Returns:
+            Number of seconds to wait before calling.
+        """
+        key = self.get_bucket_key(method)
+        wait = 0.0
+        if key is not None:
+            bucket = self.rate_limits[key]
+            wait = self.store.reserve(
+                key, bucket["rate"], bucket.get("burst", bucket["rate"])
+            )
+        with self.lock:
+            metrics = self.metrics[method]
+            metrics["calls"] += 1
+            if wait > 0:
+                metrics["throttled_calls"] += 1
+                metrics["throttled_seconds"] += wait
+        return wait
+
+    def acquire(self, method):
+        """Blocks until method may be called.
+
+        Args:
+            method: str, name of client method.
+        """
+        wait = self.reserve(method)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, method):
+        """Waits without blocking the event loop until method may be called.
+
+        Args:
+            method: str, name of client method.
+        """
+        # Imported here since asyncio is slow to import and sync clients skip it.
+        import asyncio
+
+        wait = self.reserve(method)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def get_metrics(self):
+        """Gets throttling metrics per method and in total.
+
+        Returns:
+            Dictionary of metrics keyed by method and "total".
+        """
+        with self.lock:
+            metrics = {method: dict(values) for method, values in self.metrics.items()}
+        metrics["total"] = {
+            name: sum(values[name] for values in metrics.values())
+            for name in ["calls", "throttled_calls", "throttled_seconds"]
+        }
+        return metrics
+
+
+class RateLimitedClient(object):
+    """Wraps client so every RPC method waits for its rate limit first.
+
+    Args:
+        client: gapic service client.
+        limiter: instance of `RateLimiter`.
+        use_async: bool, whether client is an asyncio client.
+    """
+    def __init__(self, client, limiter, use_async):
+        self._client = client
+        self._limiter = limiter
+        self._use_async = use_async
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute) or not name.startswith(rpc_method_prefixes):
+            return attribute
+
+        if self._use_async:
+            async def call_async(*args, **kwargs):
+                await self._limiter.acquire_async(name)
+                return await attribute(*args, **kwargs)
+
+            return call_async
+
+        def call(*args, **kwargs):
+            self._limiter.acquire(name)
+            return attribute(*args, **kwargs)
+
+        return call
+
+
+def wrap_client(client, use_async=False, client_limiter=None):
+    """Wraps client with rate limiter, if there is one.
+
+    Args:
+        client: gapic service client.
+        use_async: bool, whether client is an asyncio client.
+        client_limiter: instance of `RateLimiter`, defaults to the one of
+            this process.
+
+    Returns:
+        Rate limited client or client itself if there is no limiter.
+    """
+    client_limiter = client_limiter or limiter
+    if client_limiter is None:
+        return client
+    return RateLimitedClient(client, client_limiter, use_async)
+
+
+def report_metrics(report_limiter, metrics_path):
+    """Prints throttling metrics and writes them to path.
+
+    Args:
+        report_limiter: instance of `RateLimiter`.
+        metrics_path: str, local or GCS path of JSON metrics. Empty only
+            prints.
+    """
+    metrics = report_limiter.get_metrics()
+    print(
+        "Rate limited {} of {} calls for {:.2f}s in total.".format(
+            metrics["total"]["throttled_calls"],
+            metrics["total"]["calls"],
+            metrics["total"]["throttled_seconds"]
+        )
+    )
+    if metrics_path:
+        gcs_utils.write_text(metrics_path, json.dumps(metrics, indent=2))
+
+
+def create_limiter(rate_limits, store_uri=""):
+    """Creates rate limiter.
+
+    Args:
+        rate_limits: dict, buckets keyed by method, verb or "default".
+        store_uri: str, empty, local path, or redis:// URL of bucket store.
+
+    Returns:
+        Instance of `RateLimiter` or None if rate limiting is disabled.
+    """
+    if not rate_limits:
+        return None
+    return RateLimiter(rate_limits, create_store(store_uri))
+
+
+def configure(arguments, report_at_exit=True):
+    """Sets up rate limiter of this process from arguments.
+
+    Args:
+        arguments: dict, command line arguments.
+        report_at_exit: bool, whether to report metrics when process exits,
+            even if it failed.
+
+    Returns:
+        Instance of `RateLimiter` or None if rate limiting is disabled.
+    """
+    global limiter
+    limiter = create_limiter(
+        arguments.get("rate_limits"), arguments.get("rate_limit_store", "")
+    )
+    if limiter is not None and report_at_exit:
+        atexit.register(
+            report_metrics, limiter, arguments.get("rate_limit_metrics_path", "")
+        )
+    return limiter
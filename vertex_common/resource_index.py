@@ -0,0 +1,420 @@
+import contextlib
+from datetime import datetime, timezone
+import os
+import sqlite3
+import tempfile
+import time
+
+import gcs_utils
+
+
+# List method of each indexed resource kind.
+list_methods = {
+    "models": "list_models",
+    "endpoints": "list_endpoints",
+    "custom_jobs": "list_custom_jobs",
+    "hyperparameter_tuning_jobs": "list_hyperparameter_tuning_jobs",
+    "batch_prediction_jobs": "list_batch_prediction_jobs"
+}
+
+schema = """
+CREATE TABLE IF NOT EXISTS resources (
+    name TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    display_name TEXT NOT NULL,
+    create_time REAL NOT NULL,
+    update_time REAL NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS resources_by_display_name
+    ON resources (kind, parent, display_name, create_time);
+CREATE TABLE IF NOT EXISTS sync_state (
+    kind TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    max_update_time REAL NOT NULL,
+    full_synced_at REAL NOT NULL,
+    PRIMARY KEY (kind, parent)
+);
+"""
+
+
+def add_index_arguments(parser):
+    """Adds resource index command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--resource_index_uri",
+        help="Local or GCS path of SQLite index used to resolve display names without listing. Empty always lists.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--resource_index_ttl_hours",
+        help="Number of hours after which the index is rebuilt with a full list, i.e. to notice deletions.",
+        type=float,
+        default=1
+    )
+
+
+def to_seconds(timestamp):
+    """Converts resource timestamp to epoch seconds.
+
+    Args:
+        timestamp: datetime of resource, i.e. `create_time`.
+
+    Returns:
+        Float epoch seconds.
+    """
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def to_rfc3339(seconds):
+    """Converts epoch seconds to timestamp usable in list filters.
+
+    Args:
+        seconds: float, epoch seconds.
+
+    Returns:
+        RFC 3339 timestamp string.
+    """
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%S.%fZ"
+    )
+
+
+def pick_newest(resources):
+    """Picks most recently created resource.
+
+    Ties are broken by resource name so the pick is deterministic.
+
+    Args:
+        resources: iterable, resources with the same display name.
+
+    Returns:
+        Newest resource or None if there are none.
+    """
+    resources = list(resources)
+    if not resources:
+        return None
+    return max(
+        resources,
+        key=lambda resource: (to_seconds(resource.create_time), resource.name)
+    )
+
+
+@contextlib.contextmanager
+def open_index(index_uri):
+    """Opens SQLite index stored locally or in GCS.
+
+    GCS indexes are downloaded to a temporary file and uploaded back if they
+    changed, unless another writer uploaded in between. Since the index is
+    only a cache, losing that race just means syncing again later.
+
+    Args:
+        index_uri: str, local path or GCS URI of index.
+
+    Yields:
+        Instance of `sqlite3.Connection`.
+    """
+    if not index_uri.startswith("gs://"):
+        directory = os.path.dirname(index_uri)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(index_uri, timeout=30)
+        try:
+            connection.executescript(schema)
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+        return
+
+    from google.api_core import exceptions
+
+    blob = gcs_utils.get_blob(index_uri)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        local_path = os.path.join(temp_dir, "resource_index.db")
+        # Generation 0 means the object must not exist yet.
+        generation = 0
+        if blob.exists():
+            blob.reload()
+            generation = blob.generation
+            blob.download_to_filename(local_path, if_generation_match=generation)
+        connection = sqlite3.connect(local_path)
+        try:
+            connection.executescript(schema)
+            yield connection
+            changed = connection.total_changes > 0
+            connection.commit()
+        finally:
+            connection.close()
+        if changed:
+            try:
+                blob.upload_from_filename(
+                    local_path, if_generation_match=generation
+                )
+            except exceptions.PreconditionFailed:
+                print("Resource index {} changed meanwhile.".format(index_uri))
+
+
+def upsert_resources(connection, kind, parent, resources):
+    """Adds or refreshes resources in index.
+
+    Args:
+        connection: instance of `sqlite3.Connection`.
+        kind: str, kind of resource, i.e. models.
+        parent: str, parent resource name.
+        resources: iterable, resources from list or get calls.
+
+    Returns:
+        Max update time in epoch seconds of resources, 0 if there are none.
+    """
+    now = time.time()
+    max_update_time = 0
+    for resource in resources:
+        update_time = to_seconds(resource.update_time)
+        max_update_time = max(max_update_time, update_time)
+        connection.execute(
+            "INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                resource.name,
+                kind,
+                parent,
+                resource.display_name,
+                to_seconds(resource.create_time),
+                update_time,
+                now
+            )
+        )
+    return max_update_time
+
+
+def sync_index(connection, kind, parent, client):
+    """Syncs resources created or updated since the last sync.
+
+    The first sync lists every resource of kind in parent, later ones only
+    list resources whose update time is past the newest one seen so far.
+
+    Args:
+        connection: instance of `sqlite3.Connection`.
+        kind: str, kind of resource, i.e. models.
+        parent: str, parent resource name.
+        client: service client with list method of kind.
+    """
+    row = connection.execute(
+        """
+        SELECT max_update_time, full_synced_at FROM sync_state
+        WHERE kind = ? AND parent = ?
+        """,
+        (kind, parent)
+    ).fetchone()
+    request = {"parent": parent}
+    if row:
+        # Resources updated in the same instant as the last one seen are
+        # listed again rather than missed.
+        request["filter"] = 'update_time>="{}"'.format(to_rfc3339(row[0]))
+    max_update_time = upsert_resources(
+        connection,
+        kind,
+        parent,
+        getattr(client, list_methods[kind])(request=request)
+    )
+    connection.execute(
+        "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+        (
+            kind,
+            parent,
+            max(max_update_time, row[0] if row else 0),
+            row[1] if row else time.time()
+        )
+    )
+
+
+def evict_expired(connection, kind, parent, ttl_seconds):
+    """Drops index of kind in parent if its last full sync is too old.
+
+    Incremental syncs never see deletions, so the whole index of kind is
+    dropped and rebuilt by the next sync rather than evicting resources one
+    by one, which could leave an older match behind a newer evicted one.
+
+    Args:
+        connection: instance of `sqlite3.Connection`.
+        kind: str, kind of resource, i.e. models.
+        parent: str, parent resource name.
+        ttl_seconds: float, number of seconds a full sync is trusted.
+    """
+    row = connection.execute(
+        "SELECT full_synced_at FROM sync_state WHERE kind = ? AND parent = ?",
+        (kind, parent)
+    ).fetchone()
+    if row and time.time() - row[0] > ttl_seconds:
+        for table in ["resources", "sync_state"]:
+            connection.execute(
+                "DELETE FROM {} WHERE kind = ? AND parent = ?".format(table),
+                (kind, parent)
+            )
+
+
+def lookup_name(connection, kind, parent, display_name):
+    """Looks up newest indexed resource with display name.
+
+    Args:
+        connection: instance of `sqlite3.Connection`.
+        kind: str, kind of resource, i.e. models.
+        parent: str, parent resource name.
+        display_name: str, display name of resource.
+
+    Returns:
+        Resource name or None on a miss.
+    """
+    row = connection.execute(
+        """
+        SELECT name FROM resources
+        WHERE kind = ? AND parent = ? AND display_name = ?
+        ORDER BY create_time DESC, name DESC
+        LIMIT 1
+        """,
+        (kind, parent, display_name)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def list_by_display_name(client, kind, parent, display_name):
+    """Lists resources with display name from the API.
+
+    Args:
+        client: service client with list method of kind.
+        kind: str, kind of resource, i.e. models.
+        parent: str, parent resource name.
+        display_name: str, display name of resource.
+
+    Returns:
+        List of matching resources.
+    """
+    return list(
+        getattr(client, list_methods[kind])(
+            request={
+                "parent": parent,
+                "filter": 'display_name="{}"'.format(display_name)
+            }
+        )
+    )
+
+
+def find_resource_name(arguments, kind, client, parent, display_name):
+    """Finds name of newest resource with display name.
+
+    With an index, hits are answered without any RPC. Misses sync the index
+    incrementally and then list by display name as a last resort.
+
+    Args:
+        arguments: dict, command line arguments.
+        kind: str, kind of resource, i.e. models.
+        client: service client with list method of kind.
+        parent: str, parent resource name.
+        display_name: str, display name of resource.
+
+    Returns:
+        Resource name or None if there is no match.
+    """
+    if not arguments.get("resource_index_uri"):
+        resource = pick_newest(
+            list_by_display_name(client, kind, parent, display_name)
+        )
+        return resource.name if resource else None
+
+    with open_index(arguments["resource_index_uri"]) as connection:
+        evict_expired(
+            connection,
+            kind,
+            parent,
+            arguments["resource_index_ttl_hours"] * 3600
+        )
+        name = lookup_name(connection, kind, parent, display_name)
+        if name:
+            return name
+
+        sync_index(connection, kind, parent, client)
+        name = lookup_name(connection, kind, parent, display_name)
+        if name:
+            return name
+
+        # Only hit if the list filters disagree, i.e. on eventual
+        # consistency of listing by update time.
+        resources = list_by_display_name(client, kind, parent, display_name)
+        upsert_resources(connection, kind, parent, resources)
+        resource = pick_newest(resources)
+        return resource.name if resource else None
+
+
+def get_model_id(arguments, model_client, parent):
+    """Gets ID of model from model ID or display name.
+
+    Args:
+        arguments: dict, command line arguments.
+        model_client: instance of `ModelServiceClient`.
+        parent: str, parent resource name of model.
+
+    Returns:
+        Model ID or None if model does not exist.
+    """
+    model_id = arguments["model_id"]
+    if not model_id:
+        model_display_name = arguments["model_display_name"]
+        model_name_match = find_resource_name(
+            arguments, "models", model_client, parent, model_display_name
+        )
+        if not model_name_match:
+            print(
+                "Model with name {} does NOT exist!".format(
+                    model_display_name
+                )
+            )
+            return
+        else:
+            model_id = model_name_match.split("/")[-1]
+    print("Model ID = {}".format(model_id))
+    return model_id
+
+
+def get_new_display_name(arguments, kind, client, parent, display_name):
+    """Gets display name for a new resource, suffixed if it is taken.
+
+    Args:
+        arguments: dict, command line arguments.
+        kind: str, kind of resource, i.e. models.
+        client: service client with list method of kind.
+        parent: str, parent resource name.
+        display_name: str, wanted display name of resource.
+
+    Returns:
+        Display name to create resource with.
+    """
+    if find_resource_name(arguments, kind, client, parent, display_name):
+        print(
+            "{} with name {} already exists!".format(
+                kind[:-1].capitalize(), display_name
+            )
+        )
+        display_name = "{}_0".format(display_name)
+    return display_name
+
+
+def record_resource(arguments, kind, parent, resource):
+    """Records resource created by this run so later lookups see it at once.
+
+    Args:
+        arguments: dict, command line arguments.
+        kind: str, kind of resource, i.e. models.
+        parent: str, parent resource name.
+        resource: created resource.
+    """
+    if not arguments.get("resource_index_uri"):
+        return
+    with open_index(arguments["resource_index_uri"]) as connection:
+        upsert_resources(connection, kind, parent, [resource])
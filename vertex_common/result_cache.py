@@ -0,0 +1,260 @@
+import hashlib
+import json
+import time
+
+import gcs_utils
+
+
+def add_cache_arguments(parser):
+    """Adds training result cache command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--result_cache_uri",
+        help="Local or GCS path of JSON training result cache.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--cache_input_uris",
+        help="JSON list of input data files, directories or wildcard patterns to fingerprint. Defaults to GCS URIs in trainer args.",
+        type=json.loads,
+        default=[]
+    )
+    parser.add_argument(
+        "--cache_output_arg",
+        help="Name of trainer arg holding the output directory.",
+        type=str,
+        default="output_dir"
+    )
+    parser.add_argument(
+        "--cache_ttl_hours",
+        help="Number of hours cached results stay valid for.",
+        type=float,
+        default=168
+    )
+    parser.add_argument(
+        "--cache_max_entries",
+        help="Max number of cached results to keep, least recently used are evicted first.",
+        type=int,
+        default=1000
+    )
+    parser.add_argument(
+        "--force_retrain",
+        help="Whether to retrain even if a cached result exists.",
+        action="store_true"
+    )
+
+
+def get_trainer_arg(trainer_args, name):
+    """Gets value of converted trainer arg.
+
+    Args:
+        trainer_args: list, trainer args from `convert_trainer_args`.
+        name: str, name of trainer arg.
+
+    Returns:
+        Value of trainer arg or None if not set.
+    """
+    for key, value in zip(trainer_args[::2], trainer_args[1::2]):
+        if key == "--" + name:
+            return value
+    return None
+
+
+def get_input_uris(arguments):
+    """Gets input data URIs whose content invalidates cached results.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        List of URIs or wildcard patterns.
+    """
+    if arguments["cache_input_uris"]:
+        return arguments["cache_input_uris"]
+    trainer_args = arguments["trainer_args"] or []
+    return [
+        value
+        for key, value in zip(trainer_args[::2], trainer_args[1::2])
+        if value.startswith("gs://")
+        and key != "--" + arguments["cache_output_arg"]
+    ]
+
+
+def get_fingerprints(pattern):
+    """Gets fingerprints of files a URI or pattern stands for.
+
+    Args:
+        pattern: str, file, directory or wildcard pattern.
+
+    Returns:
+        Dictionary mapping URIs to fingerprints.
+    """
+    fingerprints = gcs_utils.get_fingerprints(pattern)
+    assert fingerprints, \
+    "No files match {}, so the cache can't tell if it changed.".format(pattern)
+    return fingerprints
+
+
+def get_package_uris(worker_pool_specs):
+    """Gets URIs of Python packages that worker pools run.
+
+    Args:
+        worker_pool_specs: list, worker pool specs of job.
+
+    Returns:
+        Sorted list of package URIs.
+    """
+    return sorted(
+        set(
+            uri
+            for worker_pool_spec in worker_pool_specs
+            for uri in worker_pool_spec.get(
+                "python_package_spec", {}
+            ).get("package_uris", [])
+            if uri
+        )
+    )
+
+
+def compute_cache_key(worker_pool_specs, input_uris):
+    """Computes content-addressed key of training spec, packages and data.
+
+    Packages are keyed by content too, so one uploaded again to the same
+    path misses.
+
+    Args:
+        worker_pool_specs: list, worker pool specs of job.
+        input_uris: list, input data URIs, directories or wildcard patterns.
+
+    Returns:
+        Hex digest of cache key.
+    """
+    input_fingerprints = {
+        pattern: get_fingerprints(pattern) for pattern in input_uris
+    }
+    package_fingerprints = {
+        uri: get_fingerprints(uri)
+        for uri in get_package_uris(worker_pool_specs)
+    }
+    canonical_spec = json.dumps(
+        {
+            "worker_pool_specs": worker_pool_specs,
+            "input_fingerprints": input_fingerprints,
+            "package_fingerprints": package_fingerprints
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(canonical_spec.encode("utf-8")).hexdigest()
+
+
+def get_output_fingerprint(output_dir):
+    """Gets fingerprint of every file in an output directory.
+
+    Args:
+        output_dir: str, local or GCS output directory.
+
+    Returns:
+        Hex digest that changes whenever any output file does, or None if
+        there are none.
+    """
+    fingerprints = gcs_utils.get_fingerprints(output_dir.rstrip("/"))
+    if not fingerprints:
+        return None
+    return hashlib.sha256(
+        json.dumps(fingerprints, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def evict_entries(cache, ttl_seconds, max_entries, now):
+    """Evicts expired entries then least recently used ones over the max.
+
+    Args:
+        cache: dict, cache entries keyed by cache key.
+        ttl_seconds: float, number of seconds entries stay valid for.
+        max_entries: int, max number of entries to keep.
+        now: float, current epoch seconds.
+    """
+    for cache_key in list(cache):
+        if now - cache[cache_key]["created_at"] > ttl_seconds:
+            del cache[cache_key]
+    lru_keys = sorted(cache, key=lambda k: cache[k]["last_used_at"])
+    for cache_key in lru_keys[:max(len(cache) - max_entries, 0)]:
+        del cache[cache_key]
+
+
+def lookup_result(arguments, cache_key):
+    """Looks up cached result of a succeeded job with the same key.
+
+    Results whose output directory is gone or was written to since, i.e.
+    by a job with another spec and the same output directory, are treated
+    as misses.
+
+    Args:
+        arguments: dict, command line arguments.
+        cache_key: str, cache key.
+
+    Returns:
+        Dictionary of cached result or None on a miss.
+    """
+    ttl_seconds = arguments["cache_ttl_hours"] * 3600
+    entry = gcs_utils.read_json(arguments["result_cache_uri"], default={}).get(
+        cache_key
+    )
+    if not entry or time.time() - entry["created_at"] > ttl_seconds:
+        return None
+    output_dir = entry["output_dir"]
+    if output_dir:
+        output_fingerprint = get_output_fingerprint(output_dir)
+        if not output_fingerprint:
+            print("Cached output directory {} is gone.".format(output_dir))
+            return None
+        if output_fingerprint != entry.get("output_fingerprint"):
+            print(
+                "Cached output directory {} changed since.".format(output_dir)
+            )
+            return None
+
+    def update(cache):
+        if cache_key in cache:
+            cache[cache_key]["last_used_at"] = time.time()
+
+    gcs_utils.update_json(arguments["result_cache_uri"], update)
+    return entry
+
+
+def store_result(arguments, cache_key, job_name, output_dir):
+    """Stores result of a succeeded job.
+
+    Args:
+        arguments: dict, command line arguments.
+        cache_key: str, cache key.
+        job_name: str, resource name of succeeded job.
+        output_dir: str, output directory of job.
+    """
+    output_fingerprint = (
+        get_output_fingerprint(output_dir) if output_dir else None
+    )
+
+    def update(cache):
+        now = time.time()
+        cache[cache_key] = {
+            "job_name": job_name,
+            "output_dir": output_dir,
+            "output_fingerprint": output_fingerprint,
+            "created_at": now,
+            "last_used_at": now
+        }
+        evict_entries(
+            cache,
+            arguments["cache_ttl_hours"] * 3600,
+            arguments["cache_max_entries"],
+            now
+        )
+
+    gcs_utils.update_json(arguments["result_cache_uri"], update)
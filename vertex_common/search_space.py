@@ -0,0 +1,505 @@
+import math
+
+
+# Keys of the value specs a Vertex AI ParameterSpec can have.
+value_spec_types = {
+    "double_value_spec": "double",
+    "integer_value_spec": "integer",
+    "categorical_value_spec": "categorical",
+    "discrete_value_spec": "discrete"
+}
+
+log_scale_types = set(["UNIT_LOG_SCALE", "UNIT_REVERSE_LOG_SCALE"])
+
+# Keys of the parent values a ConditionalParameterSpec is active for, by
+# value type of the parent. Vertex AI can't condition on double parameters.
+parent_value_keys = {
+    "categorical": "parent_categorical_values",
+    "discrete": "parent_discrete_values",
+    "integer": "parent_int_values"
+}
+
+
+def get_value_type(parameter):
+    """Gets type of parameter from its value spec.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+
+    Returns:
+        Either "double", "integer", "categorical", or "discrete".
+    """
+    value_types = [
+        value_type for key, value_type in value_spec_types.items()
+        if key in parameter
+    ]
+    assert len(value_types) == 1, \
+    "Parameter {} needs exactly one value spec.".format(
+        parameter.get("parameter_id")
+    )
+    return value_types[0]
+
+
+def get_value_spec(parameter):
+    """Gets value spec of parameter.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+
+    Returns:
+        Dictionary of value spec.
+    """
+    return parameter["{}_value_spec".format(get_value_type(parameter))]
+
+
+def is_log_scale(parameter):
+    """Checks whether parameter is searched on a log scale.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec with a string scale type.
+
+    Returns:
+        Whether scale type is log or reverse log.
+    """
+    return parameter.get("scale_type") in log_scale_types
+
+
+def to_scale(parameter, value):
+    """Maps numeric value onto the scale parameter is searched on.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+        value: float, parameter value.
+
+    Returns:
+        Value on search scale.
+    """
+    if is_log_scale(parameter) and value > 0:
+        return math.log(value)
+    return float(value)
+
+
+def from_scale(parameter, value):
+    """Maps value on the search scale back to a parameter value.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+        value: float, value on search scale.
+
+    Returns:
+        Parameter value.
+    """
+    if is_log_scale(parameter):
+        return math.exp(value)
+    return value
+
+
+def get_bounds(parameter):
+    """Gets numeric bounds of parameter.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+
+    Returns:
+        Min and max value, or None for categorical parameters.
+    """
+    value_type = get_value_type(parameter)
+    value_spec = get_value_spec(parameter)
+    if value_type in ["double", "integer"]:
+        cast = float if value_type == "double" else int
+        return cast(value_spec["min_value"]), cast(value_spec["max_value"])
+    if value_type == "discrete":
+        return min(value_spec["values"]), max(value_spec["values"])
+    return None
+
+
+def fit_value(parameter, value, clip):
+    """Fits value onto the values parameter can take.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+        value: parameter value, i.e. from an earlier study.
+        clip: bool, whether to clip numeric values outside the bounds and
+            snap discrete ones to the nearest allowed value instead of
+            rejecting them.
+
+    Returns:
+        Fitted value or None if value doesn't fit.
+    """
+    value_type = get_value_type(parameter)
+    value_spec = get_value_spec(parameter)
+    if value_type == "categorical":
+        return value if str(value) in value_spec["values"] else None
+
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if value_type == "discrete":
+        nearest = min(
+            value_spec["values"],
+            key=lambda allowed: abs(
+                to_scale(parameter, allowed) - to_scale(parameter, value)
+            )
+        )
+        if not clip and not math.isclose(nearest, value):
+            return None
+        return nearest
+
+    min_value, max_value = get_bounds(parameter)
+    if value_type == "integer":
+        value = round(value)
+    if not min_value <= value <= max_value:
+        if not clip:
+            return None
+        value = min(max(value, min_value), max_value)
+    return int(value) if value_type == "integer" else value
+
+
+def get_parent_values(conditional_spec):
+    """Gets parent values a conditional parameter is active for.
+
+    Args:
+        conditional_spec: dict, Vertex AI ConditionalParameterSpec.
+
+    Returns:
+        List of parent values.
+    """
+    for key in parent_value_keys.values():
+        if key in conditional_spec:
+            return conditional_spec[key]["values"]
+    return []
+
+
+def get_active_parameters(parameter, value):
+    """Gets conditional parameters that are active for a parent value.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+        value: value of parameter.
+
+    Returns:
+        List of ParameterSpec dictionaries of active child parameters.
+    """
+    return [
+        conditional_spec["parameter_spec"]
+        for conditional_spec in parameter.get("conditional_parameter_specs", [])
+        if value in get_parent_values(conditional_spec)
+    ]
+
+
+def iter_parameters(parameters):
+    """Iterates over parameters and their conditional parameters.
+
+    Args:
+        parameters: list, Vertex AI ParameterSpec dictionaries.
+
+    Yields:
+        ParameterSpec dictionaries, each parent before its children.
+    """
+    for parameter in parameters:
+        yield parameter
+        for conditional_spec in parameter.get("conditional_parameter_specs", []):
+            for child in iter_parameters([conditional_spec["parameter_spec"]]):
+                yield child
+
+
+def is_valid_parent_value(parameter, value):
+    """Checks whether a parent parameter can take a value.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+        value: parent value a conditional parameter is active for.
+
+    Returns:
+        Whether value is one of the values of parameter.
+    """
+    value_type = get_value_type(parameter)
+    if value_type == "integer":
+        min_value, max_value = get_bounds(parameter)
+        return (
+            isinstance(value, (int, float)) and value == int(value)
+            and min_value <= value <= max_value
+        )
+    return value in get_value_spec(parameter)["values"]
+
+
+def normalize_parameters(parameters, parameter_ids=None):
+    """Validates parameters and translates their conditional parameters.
+
+    A conditional parameter is given under its parent's
+    "conditional_parameter_specs" either like Vertex AI does, with the
+    "parent_<type>_values" key matching the parent's type, or with a plain
+    "parent_values" list that is translated to it, i.e.
+    {"parameter_spec": {...}, "parent_values": ["sgd"]}. Conditional
+    parameters can have conditional parameters themselves.
+
+    Args:
+        parameters: list, ParameterSpec dictionaries.
+        parameter_ids: set, parameter IDs seen so far, used while recursing.
+
+    Returns:
+        List of Vertex AI ParameterSpec dictionaries.
+    """
+    if parameter_ids is None:
+        parameter_ids = set()
+    normalized_parameters = []
+    for parameter in parameters:
+        assert parameter.get("parameter_id"), \
+        "Every parameter needs a parameter_id."
+        parameter_id = parameter["parameter_id"]
+        assert parameter_id not in parameter_ids, \
+        "Parameter {} is defined more than once.".format(parameter_id)
+        parameter_ids.add(parameter_id)
+        value_type = get_value_type(parameter)
+
+        conditional_specs = parameter.get("conditional_parameter_specs")
+        if not conditional_specs:
+            normalized_parameters.append(parameter)
+            continue
+        assert value_type in parent_value_keys, \
+        "Parameter {} can't have conditional parameters, only {} ones can.".format(
+            parameter_id, sorted(parent_value_keys)
+        )
+        parent_value_key = parent_value_keys[value_type]
+
+        normalized_specs = []
+        for conditional_spec in conditional_specs:
+            assert "parameter_spec" in conditional_spec, \
+            "Conditional parameters of {} need a parameter_spec.".format(
+                parameter_id
+            )
+            child_id = conditional_spec["parameter_spec"].get("parameter_id")
+            value_keys = [
+                key for key in conditional_spec if key.startswith("parent_")
+            ]
+            assert value_keys in [["parent_values"], [parent_value_key]], \
+            "Conditional parameter {} needs either parent_values or {} of {} parent {}.".format(
+                child_id, parent_value_key, value_type, parameter_id
+            )
+            if value_keys == ["parent_values"]:
+                values = conditional_spec["parent_values"]
+            else:
+                values = conditional_spec[parent_value_key]["values"]
+            assert values, \
+            "Conditional parameter {} needs parent values.".format(child_id)
+            for value in values:
+                assert is_valid_parent_value(parameter, value), \
+                "Conditional parameter {} depends on {} = {}, which it can't take.".format(
+                    child_id, parameter_id, value
+                )
+            if value_type == "integer":
+                values = [int(value) for value in values]
+
+            normalized_specs.append(
+                {
+                    "parameter_spec": normalize_parameters(
+                        [conditional_spec["parameter_spec"]], parameter_ids
+                    )[0],
+                    parent_value_key: {"values": values}
+                }
+            )
+        normalized_parameters.append(
+            dict(parameter, conditional_parameter_specs=normalized_specs)
+        )
+    return normalized_parameters
+
+
+def get_grid_values(parameter):
+    """Gets distinct values of parameter on a grid, in order.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+
+    Returns:
+        Range of integer values or list of discrete or categorical values.
+    """
+    value_type = get_value_type(parameter)
+    assert value_type != "double", \
+    "Grid search can't search double parameter {}, use discrete values.".format(
+        parameter["parameter_id"]
+    )
+    if value_type == "integer":
+        min_value, max_value = get_bounds(parameter)
+        return range(min_value, max_value + 1)
+    values = []
+    for value in get_value_spec(parameter)["values"]:
+        # Numerically equal discrete values, i.e. 4 and 4.0, are one point.
+        if value not in values:
+            values.append(value)
+    return sorted(values) if value_type == "discrete" else values
+
+
+def dedupe_grid_parameter(parameter):
+    """Removes duplicate values and meaningless scale types for grid search.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+
+    Returns:
+        Deduped copy of parameter.
+    """
+    value_type = get_value_type(parameter)
+    parameter = dict(parameter)
+    if value_type in ["discrete", "categorical"]:
+        parameter["{}_value_spec".format(value_type)] = {
+            "values": get_grid_values(parameter)
+        }
+    if value_type == "categorical" and parameter.pop("scale_type", None):
+        print(
+            "Ignoring scale_type of categorical parameter {}.".format(
+                parameter["parameter_id"]
+            )
+        )
+    if parameter.get("conditional_parameter_specs"):
+        parameter["conditional_parameter_specs"] = [
+            dict(
+                conditional_spec,
+                parameter_spec=dedupe_grid_parameter(
+                    conditional_spec["parameter_spec"]
+                )
+            )
+            for conditional_spec in parameter["conditional_parameter_specs"]
+        ]
+    return parameter
+
+
+def get_grid_axis(parameter):
+    """Gets values of parameter on a grid, with its conditional parameters.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+
+    Returns:
+        Range or list of values of a parameter without conditional
+        parameters, otherwise list of dictionaries of the parameter value
+        and the values of the conditional parameters active for it, keyed by
+        parameter ID.
+    """
+    values = get_grid_values(parameter)
+    if not parameter.get("conditional_parameter_specs"):
+        return values
+    axis = []
+    for value in values:
+        for child_point in GridSpace(get_active_parameters(parameter, value)).iter_points():
+            point = {parameter["parameter_id"]: value}
+            point.update(child_point)
+            axis.append(point)
+    return axis
+
+
+def get_grid_size(parameter):
+    """Gets number of grid points of parameter and its conditional parameters.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+
+    Returns:
+        Number of distinct combinations, only counting conditional
+        parameters for the parent values they are active for.
+    """
+    values = get_grid_values(parameter)
+    if not parameter.get("conditional_parameter_specs"):
+        return len(values)
+    size = 0
+    for value in values:
+        value_size = 1
+        for child in get_active_parameters(parameter, value):
+            value_size *= get_grid_size(child)
+        size += value_size
+    return size
+
+
+class GridSpace(object):
+    """Grid of parameter values, enumerated lazily.
+
+    Points are numbered like `itertools.product`, with the last parameter
+    varying fastest, so the i-th point is found with index arithmetic
+    instead of materializing the Cartesian product. A parameter with
+    conditional parameters is one axis of its own combinations with them,
+    so inactive conditional parameters don't multiply the grid.
+
+    Args:
+        parameters: list, Vertex AI ParameterSpec dictionaries without
+            double parameters.
+    """
+    def __init__(self, parameters):
+        self.parameters = parameters
+        self.parameter_ids = [
+            parameter["parameter_id"] for parameter in parameters
+        ]
+        self.conditional = [
+            bool(parameter.get("conditional_parameter_specs"))
+            for parameter in parameters
+        ]
+        self.sizes = [get_grid_size(parameter) for parameter in parameters]
+        # Conditional axes are only built once points are enumerated.
+        self.axes = None
+        # Exact, Python ints don't overflow.
+        self.size = 1
+        for axis_size in self.sizes:
+            self.size *= axis_size
+        self.strides = []
+        stride = 1
+        for axis_size in reversed(self.sizes):
+            self.strides.insert(0, stride)
+            stride *= axis_size
+
+    def get_points(self, start, stop):
+        """Gets points with indexes in [start, stop).
+
+        Args:
+            start: int, index of first point.
+            stop: int, index after last point.
+
+        Returns:
+            List of dictionaries of parameter values keyed by parameter ID.
+        """
+        # Imported here since only grid searches need it.
+        import numpy as np
+
+        assert self.size < 2 ** 63, \
+        "Grid of {} points is too large to enumerate.".format(self.size)
+        if self.axes is None:
+            self.axes = []
+            for parameter in self.parameters:
+                axis = get_grid_axis(parameter)
+                if not isinstance(axis, range):
+                    # Filled in place so dictionaries stay array elements.
+                    values = np.empty(len(axis), dtype=object)
+                    values[:] = axis
+                    axis = values
+                self.axes.append(axis)
+        indexes = np.arange(start, min(stop, self.size), dtype=np.int64)
+        columns = []
+        for axis, axis_size, stride in zip(self.axes, self.sizes, self.strides):
+            positions = (indexes // stride) % axis_size
+            if isinstance(axis, range):
+                columns.append((positions + axis.start).tolist())
+            else:
+                columns.append(axis[positions].tolist())
+        points = []
+        for values in zip(*columns) if columns else [()] * len(indexes):
+            point = {}
+            for parameter_id, conditional, value in zip(
+                self.parameter_ids, self.conditional, values
+            ):
+                if conditional:
+                    point.update(value)
+                else:
+                    point[parameter_id] = value
+            points.append(point)
+        return points
+
+    def iter_points(self, batch_size=1024):
+        """Iterates over all points, computing them a batch at a time.
+
+        Args:
+            batch_size: int, number of points computed at once.
+
+        Yields:
+            Dictionaries of parameter values keyed by parameter ID.
+        """
+        for start in range(0, self.size, batch_size):
+            for point in self.get_points(start, start + batch_size):
+                yield point
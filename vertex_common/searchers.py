@@ -0,0 +1,313 @@
+import importlib
+import math
+import random
+
+import search_space
+
+
+class RandomSearcher(object):
+    """Suggests parameters uniformly at random on each parameter's scale.
+
+    Searchers suggest parameters one trial at a time and are told the
+    metric value of every finished trial, including earlier ones used to
+    warm start. Custom searchers implement the same `suggest` and `observe`
+    methods and take the same constructor arguments.
+
+    Args:
+        parameters: list, Vertex AI ParameterSpec dictionaries.
+        goal_type: str, either "minimize" or "maximize".
+        seed: int, random seed, None for a random one.
+    """
+    def __init__(self, parameters, goal_type, seed=None):
+        self.parameters = parameters
+        self.goal_type = goal_type
+        self.random = random.Random(seed)
+        self.observations = []
+
+    def sample_parameter(self, parameter):
+        """Samples value of parameter uniformly on its scale.
+
+        Args:
+            parameter: dict, Vertex AI ParameterSpec.
+
+        Returns:
+            Parameter value.
+        """
+        value_type = search_space.get_value_type(parameter)
+        if value_type == "categorical":
+            return self.random.choice(parameter["categorical_value_spec"]["values"])
+        if value_type == "discrete":
+            return self.random.choice(parameter["discrete_value_spec"]["values"])
+        min_value, max_value = search_space.get_bounds(parameter)
+        value = search_space.from_scale(
+            parameter,
+            self.random.uniform(
+                search_space.to_scale(parameter, min_value),
+                search_space.to_scale(parameter, max_value)
+            )
+        )
+        return search_space.fit_value(parameter, value, clip=True)
+
+    def suggest(self):
+        """Suggests parameters of the next trial.
+
+        Returns:
+            Dictionary of parameter values keyed by parameter ID, or None if
+            the search space is exhausted.
+        """
+        return self.sample_parameters(self.parameters)
+
+    def sample_parameters(self, parameters):
+        """Samples values of parameters and their active conditional ones.
+
+        Args:
+            parameters: list, Vertex AI ParameterSpec dictionaries.
+
+        Returns:
+            Dictionary of parameter values keyed by parameter ID.
+        """
+        suggestion = {}
+        for parameter in parameters:
+            value = self.sample_parameter(parameter)
+            suggestion[parameter["parameter_id"]] = value
+            suggestion.update(
+                self.sample_parameters(
+                    search_space.get_active_parameters(parameter, value)
+                )
+            )
+        return suggestion
+
+    def observe(self, parameters, metric_value):
+        """Records result of a finished trial.
+
+        Args:
+            parameters: dict, parameter values keyed by parameter ID.
+            metric_value: float, metric of trial, None if it failed.
+        """
+        self.observations.append((parameters, metric_value))
+
+
+class GridSearcher(RandomSearcher):
+    """Suggests every point of the grid once, in order.
+
+    Points that were already observed, i.e. from warm starting, are skipped.
+    """
+    def __init__(self, parameters, goal_type, seed=None):
+        super().__init__(parameters, goal_type, seed)
+        self.grid = search_space.GridSpace(parameters)
+        self.points = self.grid.iter_points()
+
+    def suggest(self):
+        # Points differ in which conditional parameters they have.
+        observed_points = set(
+            frozenset(parameters.items()) for parameters, _ in self.observations
+        )
+        for point in self.points:
+            if frozenset(point.items()) not in observed_points:
+                return point
+        return None
+
+
+class TPESearcher(RandomSearcher):
+    """Tree-structured Parzen estimator searcher.
+
+    After random startup trials, observations are split into the best
+    `gamma` fraction and the rest. Each parameter gets a Parzen density for
+    both, and the candidate sampled from the good density with the highest
+    ratio of good to bad density is suggested.
+    """
+    n_startup_trials = 10
+    gamma = 0.25
+    n_candidates = 24
+
+    def get_numeric_density(self, parameter, centers):
+        """Gets Parzen density of numeric values on the parameter's scale.
+
+        Args:
+            parameter: dict, Vertex AI ParameterSpec.
+            centers: list, values on the parameter's scale.
+
+        Returns:
+            Function taking a value on the scale and returning its density,
+            and function sampling a value on the scale from it.
+        """
+        min_value, max_value = search_space.get_bounds(parameter)
+        low = search_space.to_scale(parameter, min_value)
+        high = search_space.to_scale(parameter, max_value)
+        width = max(high - low, 1e-12)
+        sigma = width / (1 + len(centers))
+        # A uniform prior component keeps densities positive everywhere.
+        weight = 1.0 / (1 + len(centers))
+
+        def density(value):
+            total = weight / width
+            for center in centers:
+                total += weight * math.exp(
+                    -0.5 * ((value - center) / sigma) ** 2
+                ) / (sigma * math.sqrt(2 * math.pi))
+            return total
+
+        def sample():
+            if not centers or self.random.random() < weight:
+                return self.random.uniform(low, high)
+            center = self.random.choice(centers)
+            return min(max(self.random.gauss(center, sigma), low), high)
+
+        return density, sample
+
+    def suggest_numeric(self, parameter, good_values, bad_values):
+        """Suggests value of a double or integer parameter.
+
+        Args:
+            parameter: dict, Vertex AI ParameterSpec.
+            good_values: list, values of the best trials.
+            bad_values: list, values of the other trials.
+
+        Returns:
+            Parameter value.
+        """
+        good_density, sample = self.get_numeric_density(
+            parameter,
+            [search_space.to_scale(parameter, value) for value in good_values]
+        )
+        bad_density, _ = self.get_numeric_density(
+            parameter,
+            [search_space.to_scale(parameter, value) for value in bad_values]
+        )
+        candidates = [sample() for _ in range(self.n_candidates)]
+        best = max(
+            candidates,
+            key=lambda value: (
+                math.log(good_density(value)) - math.log(bad_density(value))
+            )
+        )
+        return search_space.fit_value(
+            parameter, search_space.from_scale(parameter, best), clip=True
+        )
+
+    def suggest_choice(self, parameter, good_values, bad_values):
+        """Suggests value of a categorical or discrete parameter.
+
+        Args:
+            parameter: dict, Vertex AI ParameterSpec.
+            good_values: list, values of the best trials.
+            bad_values: list, values of the other trials.
+
+        Returns:
+            Parameter value.
+        """
+        values = search_space.get_value_spec(parameter)["values"]
+
+        def get_probability(value, observed_values):
+            # Add one smoothing so unseen values keep being explored.
+            return (observed_values.count(value) + 1.0) / (
+                len(observed_values) + len(values)
+            )
+
+        candidates = self.random.choices(
+            values,
+            weights=[get_probability(value, good_values) for value in values],
+            k=self.n_candidates
+        )
+        return max(
+            candidates,
+            key=lambda value: (
+                get_probability(value, good_values)
+                / get_probability(value, bad_values)
+            )
+        )
+
+    def suggest(self):
+        observations = [
+            (parameters, metric_value)
+            for parameters, metric_value in self.observations
+            if metric_value is not None and not math.isnan(metric_value)
+        ]
+        if len(observations) < self.n_startup_trials:
+            return super().suggest()
+
+        observations.sort(
+            key=lambda observation: observation[1],
+            reverse=self.goal_type == "maximize"
+        )
+        good_count = max(1, int(math.ceil(self.gamma * len(observations))))
+        return self.suggest_parameters(
+            self.parameters,
+            observations[:good_count],
+            observations[good_count:]
+        )
+
+    def suggest_parameters(self, parameters, good_observations, bad_observations):
+        """Suggests values of parameters and their active conditional ones.
+
+        Conditional parameters are only fit to the observations they were
+        active in.
+
+        Args:
+            parameters: list, Vertex AI ParameterSpec dictionaries.
+            good_observations: list, observations of the best trials.
+            bad_observations: list, observations of the other trials.
+
+        Returns:
+            Dictionary of parameter values keyed by parameter ID.
+        """
+        suggestion = {}
+        for parameter in parameters:
+            parameter_id = parameter["parameter_id"]
+            good_values, bad_values = [
+                [
+                    trial_parameters[parameter_id]
+                    for trial_parameters, _ in group
+                    if parameter_id in trial_parameters
+                ]
+                for group in [good_observations, bad_observations]
+            ]
+            if not good_values:
+                # No good trial had this conditional parameter active yet.
+                value = self.sample_parameter(parameter)
+            elif search_space.get_value_type(parameter) in ["categorical", "discrete"]:
+                value = self.suggest_choice(parameter, good_values, bad_values)
+            else:
+                value = self.suggest_numeric(parameter, good_values, bad_values)
+            suggestion[parameter_id] = value
+            suggestion.update(
+                self.suggest_parameters(
+                    search_space.get_active_parameters(parameter, value),
+                    good_observations,
+                    bad_observations
+                )
+            )
+        return suggestion
+
+
+# Built-in searchers by name.
+searcher_classes = {
+    "random": RandomSearcher,
+    "grid": GridSearcher,
+    "tpe": TPESearcher
+}
+
+
+def create_searcher(name, parameters, goal_type, seed=None):
+    """Creates searcher by name or import path.
+
+    Args:
+        name: str, built-in searcher name, i.e. "tpe", or import path of a
+            custom searcher class, i.e. "my_package.searchers.MySearcher".
+        parameters: list, Vertex AI ParameterSpec dictionaries.
+        goal_type: str, either "minimize" or "maximize".
+        seed: int, random seed, None for a random one.
+
+    Returns:
+        Searcher instance.
+    """
+    if name in searcher_classes:
+        searcher_class = searcher_classes[name]
+    else:
+        assert "." in name, \
+        "Searcher must be one of {} or an import path.".format(
+            sorted(searcher_classes)
+        )
+        module_name, _, class_name = name.rpartition(".")
+        searcher_class = getattr(importlib.import_module(module_name), class_name)
+    return searcher_class(parameters, goal_type, seed)
@@ -0,0 +1,425 @@
+import atexit
+import bisect
+import time
+
+import gcs_utils
+import rate_limiter
+
+
+# Upper bounds of histogram buckets in seconds.
+rpc_buckets = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+phase_buckets = [1, 10, 30, 60, 300, 600, 1800, 3600, 7200, 14400, 28800, 86400]
+
+# Job phases observed by polling, keyed by the JobState they are spent in.
+observed_phase_states = {1: "queued", 2: "provisioning"}
+
+# Recorder of this process, set by `configure`. None is the no-op mode, in
+# which clients are not wrapped and recording returns right away.
+recorder = None
+
+
+def add_telemetry_arguments(parser):
+    """Adds telemetry command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--telemetry_exporter",
+        help="Where to export RPC spans and job phase latencies. none records nothing, prometheus writes a textfile at exit, and otlp sends OpenTelemetry traces.",
+        type=str,
+        choices=["none", "prometheus", "otlp"],
+        default="none"
+    )
+    parser.add_argument(
+        "--telemetry_output_path",
+        help="Local or GCS path of Prometheus textfile, i.e. in the node exporter textfile collector directory.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--telemetry_otlp_endpoint",
+        help="OTLP gRPC endpoint to send traces to. Empty uses the OTEL_EXPORTER_OTLP_ENDPOINT environment variable.",
+        type=str,
+        default=""
+    )
+
+
+def to_epoch_seconds(timestamp):
+    """Converts job timestamp to epoch seconds.
+
+    Args:
+        timestamp: datetime of job, i.e. `create_time`, or None if unset.
+
+    Returns:
+        Float epoch seconds or None if unset.
+    """
+    if not timestamp:
+        return None
+    return timestamp.timestamp()
+
+
+def format_labels(labels):
+    """Formats Prometheus labels.
+
+    Args:
+        labels: list, (name, value) tuples.
+
+    Returns:
+        Label string including braces.
+    """
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                name,
+                str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            )
+            for name, value in labels
+        )
+    )
+
+
+class Histogram(object):
+    """Prometheus style histogram with labeled series.
+
+    Args:
+        buckets: list, sorted upper bounds of buckets.
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Per series counts of each bucket, not cumulative, sum and count.
+        self.series = {}
+
+    def observe(self, labels, value):
+        """Records value.
+
+        Args:
+            labels: tuple, (name, value) tuples of series.
+            value: float, observed value.
+        """
+        series = self.series.setdefault(labels, [[0] * len(self.buckets), 0.0, 0])
+        index = bisect.bisect_left(self.buckets, value)
+        # Values past the last bucket are only counted in the +Inf bucket.
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def format(self, name, description, extra_labels=()):
+        """Formats histogram in the Prometheus text format.
+
+        Args:
+            name: str, name of metric.
+            description: str, help text of metric.
+            extra_labels: tuple, (name, value) tuples added to every series.
+
+        Returns:
+            List of lines.
+        """
+        lines = [
+            "# HELP {} {}".format(name, description),
+            "# TYPE {} histogram".format(name)
+        ]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            labels = extra_labels + labels
+            cumulative_count = 0
+            for bucket, bucket_count in zip(self.buckets, counts):
+                cumulative_count += bucket_count
+                lines.append(
+                    "{}_bucket{} {}".format(
+                        name,
+                        format_labels(labels + (("le", bucket),)),
+                        cumulative_count
+                    )
+                )
+            lines.append(
+                "{}_bucket{} {}".format(
+                    name, format_labels(labels + (("le", "+Inf"),)), count
+                )
+            )
+            lines.append("{}_sum{} {}".format(name, format_labels(labels), total))
+            lines.append("{}_count{} {}".format(name, format_labels(labels), count))
+        return lines
+
+
+class Recorder(object):
+    """Records RPC and job phase latencies of a component run.
+
+    Args:
+        component: str, name of component, i.e. vertex_train.
+        exporter: str, "prometheus" or "otlp".
+        output_path: str, local or GCS path of Prometheus textfile.
+        otlp_endpoint: str, OTLP gRPC endpoint, empty uses the environment.
+    """
+    def __init__(self, component, exporter, output_path, otlp_endpoint):
+        assert exporter == "otlp" or output_path, \
+        "Prometheus textfiles need a telemetry_output_path."
+        self.component = component
+        self.output_path = output_path
+        self.rpc_durations = Histogram(rpc_buckets)
+        self.phase_durations = Histogram(phase_buckets)
+        self.job_timestamps = {}
+        self.exported = False
+
+        self.trace = None
+        if exporter == "otlp":
+            # Imported here since only OpenTelemetry exports need the SDK.
+            from opentelemetry import trace
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+                OTLPSpanExporter
+            )
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+            self.trace = trace
+            self.tracer_provider = TracerProvider(
+                resource=Resource.create({"service.name": component})
+            )
+            self.tracer_provider.add_span_processor(
+                BatchSpanProcessor(
+                    OTLPSpanExporter(endpoint=otlp_endpoint)
+                    if otlp_endpoint else OTLPSpanExporter()
+                )
+            )
+            self.tracer = self.tracer_provider.get_tracer(__name__)
+            self.root_span = self.tracer.start_span(component)
+
+    def add_span(self, name, start_seconds, end_seconds, attributes, error=None):
+        """Adds finished span under the component's root span.
+
+        Args:
+            name: str, name of span.
+            start_seconds: float, epoch seconds span started at.
+            end_seconds: float, epoch seconds span ended at.
+            attributes: dict, attributes of span.
+            error: exception span failed with, if any.
+        """
+        if self.trace is None:
+            return
+        span = self.tracer.start_span(
+            name,
+            context=self.trace.set_span_in_context(self.root_span),
+            start_time=int(start_seconds * 1e9),
+            attributes=attributes
+        )
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(
+                self.trace.Status(self.trace.StatusCode.ERROR, str(error))
+            )
+        span.end(end_time=int(end_seconds * 1e9))
+
+    def record_rpc(self, method, start_seconds, end_seconds, error=None):
+        """Records RPC.
+
+        Args:
+            method: str, name of client method.
+            start_seconds: float, epoch seconds call started at.
+            end_seconds: float, epoch seconds call returned at.
+            error: exception call raised, if any.
+        """
+        self.rpc_durations.observe(
+            (("method", method), ("status", "error" if error else "ok")),
+            end_seconds - start_seconds
+        )
+        self.add_span(method, start_seconds, end_seconds, {"rpc.method": method}, error)
+
+    def record_job(self, job, timeline, detected_at):
+        """Records phases of finished job.
+
+        Queueing and provisioning are told apart by the states seen while
+        polling. Waiting and running come from the job's own timestamps, and
+        the detection lag is the time from the job ending until a poll saw it.
+
+        Args:
+            job: finished job with `create_time`, `start_time` and `end_time`.
+            timeline: list, state transitions recorded by `job_poller`.
+            detected_at: float, epoch seconds of the poll that saw it end.
+
+        Returns:
+            Dictionary of phase durations in seconds.
+        """
+        job_type = job.name.split("/")[-2]
+        phases = {}
+        for transition, next_transition in zip(timeline, timeline[1:]):
+            phase = observed_phase_states.get(transition["state_value"])
+            if phase:
+                phases[phase] = phases.get(phase, 0.0) + (
+                    next_transition["elapsed_seconds"] - transition["elapsed_seconds"]
+                )
+
+        timestamps = {
+            "create": to_epoch_seconds(job.create_time),
+            "start": to_epoch_seconds(job.start_time),
+            "end": to_epoch_seconds(job.end_time),
+            "detected": detected_at
+        }
+        spans = [
+            ("waiting", "create", "start"),
+            ("running", "start", "end"),
+            ("detection_lag", "end", "detected"),
+            ("total", "create", "detected")
+        ]
+        for phase, start, end in spans:
+            if timestamps[start] is not None and timestamps[end] is not None:
+                phases[phase] = max(timestamps[end] - timestamps[start], 0.0)
+                self.add_span(
+                    phase,
+                    timestamps[start],
+                    timestamps[end],
+                    {"vertex.job": job.name, "vertex.job_type": job_type}
+                )
+
+        for phase, seconds in phases.items():
+            self.phase_durations.observe(
+                (("job_type", job_type), ("phase", phase)), seconds
+            )
+        self.job_timestamps[job.name] = timestamps
+        print("Job {} phases = {}".format(job.name, phases))
+        return phases
+
+    def format_prometheus(self):
+        """Formats recorded metrics as a Prometheus textfile.
+
+        Returns:
+            Textfile contents.
+        """
+        component_label = (("component", self.component),)
+        lines = self.rpc_durations.format(
+            "vertex_rpc_duration_seconds",
+            "Duration of Vertex AI API calls.",
+            component_label
+        )
+        lines += self.phase_durations.format(
+            "vertex_job_phase_seconds",
+            "Time Vertex AI jobs spent queued, provisioning, waiting, running, and until their end was noticed.",
+            component_label
+        )
+        lines += [
+            "# HELP vertex_job_timestamp_seconds Epoch seconds of job creation, start, end, and when a poll saw it end.",
+            "# TYPE vertex_job_timestamp_seconds gauge"
+        ]
+        for job_name, timestamps in sorted(self.job_timestamps.items()):
+            for event, seconds in timestamps.items():
+                if seconds is not None:
+                    lines.append(
+                        "vertex_job_timestamp_seconds{} {}".format(
+                            format_labels(
+                                component_label
+                                + (("job", job_name), ("event", event))
+                            ),
+                            seconds
+                        )
+                    )
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Exports recorded metrics or traces, once."""
+        if self.exported:
+            return
+        self.exported = True
+        if self.trace is not None:
+            self.root_span.end()
+            self.tracer_provider.shutdown()
+        else:
+            gcs_utils.write_text(self.output_path, self.format_prometheus())
+
+
+class TracedClient(object):
+    """Wraps client so every RPC method is recorded.
+
+    Args:
+        client: gapic service client.
+        client_recorder: instance of `Recorder`.
+        use_async: bool, whether client is an asyncio client.
+    """
+    def __init__(self, client, client_recorder, use_async):
+        self._client = client
+        self._recorder = client_recorder
+        self._use_async = use_async
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute) or not name.startswith(rate_limiter.rpc_method_prefixes):
+            return attribute
+
+        if self._use_async:
+            async def call_async(*args, **kwargs):
+                start = time.time()
+                try:
+                    response = await attribute(*args, **kwargs)
+                except Exception as error:
+                    self._recorder.record_rpc(name, start, time.time(), error)
+                    raise
+                self._recorder.record_rpc(name, start, time.time())
+                return response
+
+            return call_async
+
+        def call(*args, **kwargs):
+            start = time.time()
+            try:
+                response = attribute(*args, **kwargs)
+            except Exception as error:
+                self._recorder.record_rpc(name, start, time.time(), error)
+                raise
+            self._recorder.record_rpc(name, start, time.time())
+            return response
+
+        return call
+
+
+def wrap_client(client, use_async=False):
+    """Wraps client to record its RPCs, unless telemetry is off.
+
+    Args:
+        client: gapic service client.
+        use_async: bool, whether client is an asyncio client.
+
+    Returns:
+        Traced client or client itself in no-op mode.
+    """
+    if recorder is None:
+        return client
+    return TracedClient(client, recorder, use_async)
+
+
+def record_job(job, timeline, detected_at):
+    """Records phases of finished job, unless telemetry is off.
+
+    Args:
+        job: finished job.
+        timeline: list, state transitions recorded by `job_poller`.
+        detected_at: float, epoch seconds of the poll that saw it end.
+    """
+    if recorder is None:
+        return
+    recorder.record_job(job, timeline, detected_at)
+
+
+def configure(arguments, component, export_at_exit=True):
+    """Sets up telemetry of this process from arguments.
+
+    Args:
+        arguments: dict, command line arguments.
+        component: str, name of component, i.e. vertex_train.
+        export_at_exit: bool, whether to export when process exits, even if
+            it failed.
+
+    Returns:
+        Instance of `Recorder` or None in no-op mode.
+    """
+    global recorder
+    recorder = None
+    exporter = arguments.get("telemetry_exporter", "none")
+    if exporter != "none":
+        recorder = Recorder(
+            component,
+            exporter,
+            arguments.get("telemetry_output_path", ""),
+            arguments.get("telemetry_otlp_endpoint", "")
+        )
+        if export_at_exit:
+            atexit.register(recorder.export)
+    return recorder
@@ -0,0 +1,338 @@
+import io
+import json
+import math
+import time
+
+import gcs_utils
+import search_space
+
+
+# Vertex AI Trial.State values of trials that won't change anymore.
+trial_state_names = {4: "SUCCEEDED", 5: "INFEASIBLE"}
+
+
+def add_trial_store_arguments(parser):
+    """Adds trial results store command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--trial_results_uri",
+        help="Local or GCS directory to stream finished trials and a best trial summary to. Empty disables.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--trial_results_format",
+        help="Columnar format of trial part files.",
+        type=str,
+        default="npz",
+        choices=["npz", "parquet"]
+    )
+
+
+def to_epoch_seconds(timestamp):
+    """Converts optional timestamp to epoch seconds.
+
+    Args:
+        timestamp: datetime or None.
+
+    Returns:
+        Float epoch seconds, NaN if there is no timestamp.
+    """
+    return timestamp.timestamp() if timestamp else math.nan
+
+
+def parse_trial(trial, metric_id):
+    """Parses finished trial into a row.
+
+    Args:
+        trial: trial of a hyperparameter tuning job.
+        metric_id: str, name of metric to read.
+
+    Returns:
+        Dictionary of trial ID, state, metric value, timing and parameters.
+    """
+    metric_values = [
+        metric.value for metric in trial.final_measurement.metrics
+        if metric.metric_id == metric_id
+    ] if trial.final_measurement else []
+    start_time = to_epoch_seconds(trial.start_time)
+    end_time = to_epoch_seconds(trial.end_time)
+    return {
+        "trial_id": trial.id,
+        "state": trial_state_names[trial.state],
+        "metric_value": metric_values[0] if metric_values else math.nan,
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration_seconds": end_time - start_time,
+        "parameters": {
+            parameter.parameter_id: parameter.value
+            for parameter in trial.parameters
+        }
+    }
+
+
+def encode_part(columns, results_format):
+    """Encodes columns as a columnar file.
+
+    Args:
+        columns: dict, lists of values keyed by column name.
+        results_format: str, either "npz" or "parquet".
+
+    Returns:
+        Bytes of file.
+    """
+    buffer = io.BytesIO()
+    if results_format == "parquet":
+        # Imported here since only Parquet stores need it.
+        import pyarrow
+        import pyarrow.parquet
+
+        pyarrow.parquet.write_table(pyarrow.table(columns), buffer)
+    else:
+        # Imported here since only stores need it.
+        import numpy as np
+
+        np.savez_compressed(
+            buffer, **{name: np.array(values) for name, values in columns.items()}
+        )
+    return buffer.getvalue()
+
+
+def decode_part(data, results_format):
+    """Decodes columnar file.
+
+    Args:
+        data: bytes, bytes of file.
+        results_format: str, either "npz" or "parquet".
+
+    Returns:
+        Dictionary of lists of values keyed by column name.
+    """
+    if results_format == "parquet":
+        import pyarrow.parquet
+
+        return pyarrow.parquet.read_table(io.BytesIO(data)).to_pydict()
+    import numpy as np
+
+    with np.load(io.BytesIO(data)) as part:
+        return {name: part[name].tolist() for name in part.files}
+
+
+class TrialStore(object):
+    """Streams finished trials of a study to columnar part files.
+
+    Each batch of trials that finished since the last poll becomes a part
+    file, so nothing is rewritten as the study grows. A JSON summary with
+    the best trial so far is rewritten with every part, so later steps can
+    read the best hyperparameters without listing the study.
+
+    Args:
+        uri: str, local or GCS directory of store.
+        results_format: str, either "npz" or "parquet".
+        metric_id: str, name of metric to optimize.
+        goal_type: str, either "minimize" or "maximize".
+        parameters: list, Vertex AI ParameterSpec dictionaries of study.
+    """
+    def __init__(self, uri, results_format, metric_id, goal_type, parameters):
+        self.uri = uri.rstrip("/")
+        self.results_format = results_format
+        self.metric_id = metric_id
+        self.goal_type = goal_type
+        # Categorical parameters are strings, the rest floats, so columns
+        # have the same type in every part even if a trial lacks them, i.e.
+        # inactive conditional parameters.
+        self.categorical_parameter_ids = set(
+            parameter["parameter_id"]
+            for parameter in search_space.iter_parameters(parameters)
+            if search_space.get_value_type(parameter) == "categorical"
+        )
+        self.parameter_ids = [
+            parameter["parameter_id"]
+            for parameter in search_space.iter_parameters(parameters)
+        ]
+        self.seen_trial_ids = set()
+        self.parts = []
+        self.state_counts = {}
+        self.best_trial = None
+
+    def is_better(self, trial):
+        """Checks whether trial beats the best one so far.
+
+        Args:
+            trial: dict, parsed trial.
+
+        Returns:
+            Whether trial has a metric value better than the best trial.
+        """
+        if math.isnan(trial["metric_value"]):
+            return False
+        if self.best_trial is None:
+            return True
+        if self.goal_type == "minimize":
+            return trial["metric_value"] < self.best_trial["metric_value"]
+        return trial["metric_value"] > self.best_trial["metric_value"]
+
+    def get_columns(self, trials):
+        """Lays trials out as columns.
+
+        Args:
+            trials: list, parsed trials.
+
+        Returns:
+            Dictionary of lists of values keyed by column name.
+        """
+        columns = {
+            name: [trial[name] for trial in trials]
+            for name in [
+                "trial_id",
+                "state",
+                "metric_value",
+                "start_time",
+                "end_time",
+                "duration_seconds"
+            ]
+        }
+        for parameter_id in self.parameter_ids:
+            categorical = parameter_id in self.categorical_parameter_ids
+            columns["param_{}".format(parameter_id)] = [
+                (
+                    str(trial["parameters"].get(parameter_id, ""))
+                    if categorical
+                    else float(trial["parameters"].get(parameter_id, math.nan))
+                )
+                for trial in trials
+            ]
+        return columns
+
+    def add_trials(self, job):
+        """Appends trials of job that finished since the last call.
+
+        Args:
+            job: polled hyperparameter tuning job.
+
+        Returns:
+            List of newly finished parsed trials.
+        """
+        trials = [
+            parse_trial(trial, self.metric_id)
+            for trial in sorted(
+                [
+                    trial for trial in job.trials
+                    if trial.state in trial_state_names
+                    and trial.id not in self.seen_trial_ids
+                ],
+                key=lambda trial: trial.end_time
+            )
+        ]
+        self.append_trials(trials, job.name, job.state)
+        return trials
+
+    def append_trials(self, trials, job_name, job_state):
+        """Appends parsed trials as a new part and updates the summary.
+
+        Args:
+            trials: list, parsed trials, i.e. from `parse_trial`.
+            job_name: str, name of study's job.
+            job_state: int, Vertex AI JobState value of study's job.
+        """
+        if not trials:
+            return
+
+        for trial in trials:
+            self.seen_trial_ids.add(trial["trial_id"])
+            self.state_counts[trial["state"]] = (
+                self.state_counts.get(trial["state"], 0) + 1
+            )
+            if self.is_better(trial):
+                self.best_trial = trial
+
+        part_name = "trials-{:05d}.{}".format(
+            len(self.parts), self.results_format
+        )
+        gcs_utils.write_bytes(
+            "{}/{}".format(self.uri, part_name),
+            encode_part(self.get_columns(trials), self.results_format)
+        )
+        self.parts.append(part_name)
+        self.write_summary(job_name, job_state)
+
+    def write_summary(self, job_name, job_state):
+        """Writes summary of study and its best trial so far.
+
+        Args:
+            job_name: str, name of study's job.
+            job_state: int, Vertex AI JobState value of study's job.
+        """
+        summary = {
+            "job_name": job_name,
+            "job_state": int(job_state),
+            "metric_id": self.metric_id,
+            "goal_type": self.goal_type,
+            "results_format": self.results_format,
+            "trial_count": len(self.seen_trial_ids),
+            "state_counts": self.state_counts,
+            "best_trial": self.best_trial,
+            "parts": self.parts,
+            "updated_at": time.time()
+        }
+        gcs_utils.write_text(
+            "{}/summary.json".format(self.uri),
+            json.dumps(summary, indent=2, sort_keys=True)
+        )
+
+
+def create_trial_store(arguments):
+    """Creates trial store from arguments.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Instance of `TrialStore` or None if it is disabled.
+    """
+    if not arguments.get("trial_results_uri"):
+        return None
+    return TrialStore(
+        arguments["trial_results_uri"],
+        arguments.get("trial_results_format", "npz"),
+        arguments["metric_id"],
+        arguments["goal_type"],
+        arguments["parameters"]
+    )
+
+
+def read_summary(uri):
+    """Reads summary of a trial store.
+
+    Args:
+        uri: str, local or GCS directory of store.
+
+    Returns:
+        Dictionary of summary, with the best trial and its parameters, or
+        None if the store has none yet.
+    """
+    return gcs_utils.read_json("{}/summary.json".format(uri.rstrip("/")))
+
+
+def read_trials(uri):
+    """Reads all trials of a trial store into columns.
+
+    Args:
+        uri: str, local or GCS directory of store.
+
+    Returns:
+        Dictionary of lists of values keyed by column name.
+    """
+    summary = read_summary(uri)
+    columns = {}
+    for part_name in summary["parts"] if summary else []:
+        part = decode_part(
+            gcs_utils.read_bytes("{}/{}".format(uri.rstrip("/"), part_name)),
+            summary["results_format"]
+        )
+        for name, values in part.items():
+            columns.setdefault(name, []).extend(values)
+    return columns
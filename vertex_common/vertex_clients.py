@@ -0,0 +1,273 @@
+import importlib
+import threading
+
+import rate_limiter
+import telemetry
+
+
+# Gapic services are imported on first use so each component only pays for
+# the modules it calls instead of the whole google.cloud.aiplatform SDK.
+gapic_package = "google.cloud.aiplatform_v1"
+
+service_client_names = {
+    "job_service": "JobService",
+    "model_service": "ModelService",
+    "endpoint_service": "EndpointService",
+    "prediction_service": "PredictionService"
+}
+
+# Options of pooled gRPC channels. Message sizes are unlimited like gapic
+# transports set them when they create their own channel, since large list
+# pages and batched predict responses exceed the 4 MB gRPC default.
+# Keepalive pings detect connections that silently died while a long poll
+# interval was idle. Pings are no more often than the 5 minute minimum gRPC
+# servers accept from idle clients by default.
+channel_options = [
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+    ("grpc.keepalive_time_ms", 300000),
+    ("grpc.keepalive_timeout_ms", 20000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0)
+]
+
+# Max number of calls in flight per pooled channel. Google front ends allow
+# 100 concurrent streams per HTTP/2 connection, calls past that queue here
+# rather than inside the connection where they count against deadlines.
+max_concurrent_streams = 100
+
+# Backend that clients and types come from instead of the gapic package when
+# set, i.e. the local fake backend used by benchmarks.
+backend = None
+
+# Clients with long-lived channels keyed by service, region and, for asyncio
+# clients, event loop, since asyncio channels are bound to the loop.
+client_pool = {}
+client_pool_lock = threading.Lock()
+
+
+def get_client_options(region):
+    """Gets client options of regional API endpoint.
+
+    The AI Platform services require regional API endpoints.
+
+    Args:
+        region: str, region of Vertex AI resources.
+
+    Returns:
+        Dictionary of client options.
+    """
+    return {"api_endpoint": "{}-aiplatform.googleapis.com".format(region)}
+
+
+def get_parent(arguments):
+    """Gets parent resource name of project and region.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Parent resource name.
+    """
+    return "projects/{}/locations/{}".format(
+        arguments["project"], arguments["region"]
+    )
+
+
+def use_backend(new_backend):
+    """Routes clients and types to a backend other than the Vertex AI API.
+
+    Args:
+        new_backend: object with `get_client(service, region, use_async)` and
+            `types`, or None to use the Vertex AI API again.
+    """
+    global backend
+    backend = new_backend
+
+
+def close_pooled_client(client, loop):
+    """Closes channel of pooled client.
+
+    Args:
+        client: gapic service client.
+        loop: event loop of asyncio client, None for other clients.
+    """
+    if loop is None:
+        client.transport.close()
+    elif loop.is_closed():
+        # Channels of finished event loops can't be closed anymore.
+        return
+    elif loop.is_running():
+        loop.call_soon_threadsafe(
+            lambda: loop.create_task(client.transport.close())
+        )
+    else:
+        loop.run_until_complete(client.transport.close())
+
+
+def clear_client_pool():
+    """Closes and drops pooled clients so the next ones open new channels."""
+    with client_pool_lock:
+        pooled_clients = list(client_pool.values())
+        client_pool.clear()
+    for client, loop in pooled_clients:
+        close_pooled_client(client, loop)
+
+
+def get_types():
+    """Gets gapic types module, i.e. for enums like `AcceleratorType`.
+
+    Returns:
+        Module of gapic types.
+    """
+    if backend is not None:
+        return backend.types
+    return importlib.import_module("{}.types".format(gapic_package))
+
+
+def create_stream_limit_interceptor(use_async):
+    """Creates interceptor capping number of calls in flight on a channel.
+
+    Args:
+        use_async: bool, whether channel is an asyncio channel.
+
+    Returns:
+        Unary-unary client interceptor.
+    """
+    import grpc
+
+    if use_async:
+        import asyncio
+        from grpc import aio
+
+        class AsyncStreamLimitInterceptor(aio.UnaryUnaryClientInterceptor):
+            def __init__(self):
+                self.semaphore = asyncio.Semaphore(max_concurrent_streams)
+
+            async def intercept_unary_unary(self, continuation, client_call_details, request):
+                async with self.semaphore:
+                    call = await continuation(client_call_details, request)
+                    try:
+                        await call
+                    except aio.AioRpcError:
+                        # Raised to the caller when it awaits the call.
+                        pass
+                    return call
+
+        return AsyncStreamLimitInterceptor()
+
+    class StreamLimitInterceptor(grpc.UnaryUnaryClientInterceptor):
+        def __init__(self):
+            self.semaphore = threading.BoundedSemaphore(max_concurrent_streams)
+
+        def intercept_unary_unary(self, continuation, client_call_details, request):
+            # Gapic clients make blocking calls, which are done by the time
+            # continuation returns.
+            with self.semaphore:
+                return continuation(client_call_details, request)
+
+    return StreamLimitInterceptor()
+
+
+def create_pooled_client(service, region, use_async):
+    """Creates client of service on a new long-lived channel.
+
+    Args:
+        service: str, name of service, i.e. job_service.
+        region: str, region of Vertex AI resources.
+        use_async: bool, whether to create an asyncio client.
+
+    Returns:
+        Instance of service client.
+    """
+    module = importlib.import_module(
+        "{}.services.{}".format(gapic_package, service)
+    )
+    client_class = getattr(
+        module,
+        "{}{}".format(
+            service_client_names[service],
+            "AsyncClient" if use_async else "Client"
+        )
+    )
+    transport_class = client_class.get_transport_class(
+        "grpc_asyncio" if use_async else "grpc"
+    )
+    host = "{}:443".format(get_client_options(region)["api_endpoint"])
+    interceptor = create_stream_limit_interceptor(use_async)
+    if use_async:
+        channel = transport_class.create_channel(
+            host, options=channel_options, interceptors=[interceptor]
+        )
+    else:
+        import grpc
+
+        channel = grpc.intercept_channel(
+            transport_class.create_channel(host, options=channel_options),
+            interceptor
+        )
+    return client_class(transport=transport_class(host=host, channel=channel))
+
+
+def wrap_client(client, use_async):
+    """Wraps client with telemetry and rate limiting of this process.
+
+    RPC spans are innermost so they time the call itself, not throttling.
+
+    Args:
+        client: gapic service client.
+        use_async: bool, whether client is an asyncio client.
+
+    Returns:
+        Wrapped client, or client itself if neither is configured.
+    """
+    return rate_limiter.wrap_client(
+        telemetry.wrap_client(client, use_async), use_async
+    )
+
+
+def get_client(service, region, use_async=False):
+    """Gets client of service from the pool, creating it on first use.
+
+    Clients of the same service and region share one long-lived channel, so
+    only the first call pays for the TLS handshake and channel setup. They
+    are traced and rate limited if the process is configured to.
+
+    Args:
+        service: str, name of service, i.e. job_service.
+        region: str, region of Vertex AI resources.
+        use_async: bool, whether to create an asyncio client. Must be called
+            from the event loop the client is used in.
+
+    Returns:
+        Instance of service client.
+    """
+    assert service in service_client_names, \
+    "Unknown service {}. Choices are {}.".format(
+        service, sorted(service_client_names)
+    )
+    if backend is not None:
+        return wrap_client(
+            backend.get_client(service, region, use_async), use_async
+        )
+
+    key = (service, region, use_async)
+    loop = None
+    if use_async:
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        key += (id(loop),)
+    with client_pool_lock:
+        # The loop is kept alongside so its ID can't be reused while pooled.
+        pooled = client_pool.get(key)
+        if pooled is None:
+            # Channels of finished event loops can't be used anymore.
+            for stale_key in [
+                pooled_key for pooled_key, (_, pooled_loop) in client_pool.items()
+                if pooled_loop is not None and pooled_loop.is_closed()
+            ]:
+                del client_pool[stale_key]
+            pooled = (create_pooled_client(service, region, use_async), loop)
+            client_pool[key] = pooled
+    return wrap_client(pooled[0], use_async)
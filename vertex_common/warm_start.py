@@ -0,0 +1,311 @@
+import math
+
+import gcs_utils
+import search_space
+
+
+# Vertex AI Trial.State value of trials that finished, even if stopped early.
+trial_state_succeeded = 4
+
+
+def add_warm_start_arguments(parser):
+    """Adds warm start command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--warm_start_job_name",
+        help="Resource name or ID of an earlier hyperparameter tuning job to warm start from.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--warm_start_results_path",
+        help="Local or GCS path of a JSON list of earlier trials to warm start from.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--warm_start_out_of_range",
+        help="Whether to clip earlier trial values outside the current parameter space or drop those trials.",
+        type=str,
+        default="clip",
+        choices=["clip", "drop"]
+    )
+    parser.add_argument(
+        "--warm_start_top_k",
+        help="Number of best earlier trials the narrowed search space is fit around.",
+        type=int,
+        default=5
+    )
+    parser.add_argument(
+        "--warm_start_margin",
+        help="Fraction of each parameter range to widen the narrowed range by on each side.",
+        type=float,
+        default=0.25
+    )
+
+
+def parse_job_trials(job, metric_id):
+    """Parses succeeded trials of a hyperparameter tuning job.
+
+    Args:
+        job: hyperparameter tuning job.
+        metric_id: str, name of metric to read.
+
+    Returns:
+        List of trial dictionaries with trial ID, parameters and metric value
+        in the order trials ended.
+    """
+    succeeded_trials = [
+        trial for trial in job.trials if trial.state == trial_state_succeeded
+    ]
+    trials = []
+    for trial in sorted(succeeded_trials, key=lambda trial: trial.end_time):
+        metric_values = [
+            metric.value for metric in trial.final_measurement.metrics
+            if metric.metric_id == metric_id
+        ]
+        if not metric_values:
+            continue
+        trials.append(
+            {
+                "trial_id": trial.id,
+                "parameters": {
+                    parameter.parameter_id: parameter.value
+                    for parameter in trial.parameters
+                },
+                "metric_value": metric_values[0]
+            }
+        )
+    return trials
+
+
+def load_trials(arguments, get_job):
+    """Loads earlier trials from a tuning job and a results file.
+
+    Args:
+        arguments: dict, command line arguments.
+        get_job: function, takes hyperparameter tuning job name and returns
+            job.
+
+    Returns:
+        List of trial dictionaries with trial ID, parameters and metric value.
+    """
+    trials = []
+    job_name = arguments["warm_start_job_name"]
+    if job_name:
+        if "/" not in job_name:
+            job_name = "projects/{}/locations/{}/hyperparameterTuningJobs/{}".format(
+                arguments["project"], arguments["region"], job_name
+            )
+        trials.extend(parse_job_trials(get_job(job_name), arguments["metric_id"]))
+    if arguments["warm_start_results_path"]:
+        trials.extend(
+            trial for trial in gcs_utils.read_json(
+                arguments["warm_start_results_path"], []
+            )
+            if trial.get("metric_value") is not None
+        )
+    return trials
+
+
+def fit_trials(parameters, trials, clip):
+    """Fits earlier trials onto the current parameter space.
+
+    Parameters that no longer exist are dropped from trials, parameters
+    trials didn't have are left out.
+
+    Args:
+        parameters: list, Vertex AI ParameterSpec dictionaries.
+        trials: list, trial dictionaries.
+        clip: bool, whether to clip values outside the space instead of
+            dropping their trials.
+
+    Returns:
+        List of trial dictionaries whose values fit the space.
+    """
+    parameters_by_id = {
+        parameter["parameter_id"]: parameter
+        for parameter in search_space.iter_parameters(parameters)
+    }
+    fitted_trials = []
+    for trial in trials:
+        fitted_parameters = {}
+        for parameter_id, value in trial["parameters"].items():
+            if parameter_id not in parameters_by_id:
+                continue
+            fitted_value = search_space.fit_value(
+                parameters_by_id[parameter_id], value, clip
+            )
+            if fitted_value is None:
+                break
+            fitted_parameters[parameter_id] = fitted_value
+        else:
+            fitted_trials.append(dict(trial, parameters=fitted_parameters))
+    return fitted_trials
+
+
+def get_top_trials(trials, goal_type, top_k):
+    """Gets best trials.
+
+    Args:
+        trials: list, trial dictionaries.
+        goal_type: str, either "minimize" or "maximize".
+        top_k: int, number of trials to get.
+
+    Returns:
+        List of up to `top_k` best trial dictionaries, best first.
+    """
+    return sorted(
+        trials,
+        key=lambda trial: trial["metric_value"],
+        reverse=goal_type == "maximize"
+    )[:top_k]
+
+
+def narrow_parameter(parameter, values, margin):
+    """Narrows numeric parameter to a range around good earlier values.
+
+    Args:
+        parameter: dict, Vertex AI ParameterSpec.
+        values: list, values of the best earlier trials.
+        margin: float, fraction of the range to widen by on each side.
+
+    Returns:
+        Narrowed copy of parameter.
+    """
+    value_type = search_space.get_value_type(parameter)
+    min_value, max_value = search_space.get_bounds(parameter)
+    scaled_min = search_space.to_scale(parameter, min_value)
+    scaled_max = search_space.to_scale(parameter, max_value)
+    width = (scaled_max - scaled_min) * margin
+    low = max(
+        min(search_space.to_scale(parameter, value) for value in values) - width,
+        scaled_min
+    )
+    high = min(
+        max(search_space.to_scale(parameter, value) for value in values) + width,
+        scaled_max
+    )
+
+    parameter = dict(parameter)
+    if value_type == "discrete":
+        parameter["discrete_value_spec"] = {
+            "values": [
+                value for value in parameter["discrete_value_spec"]["values"]
+                if low <= search_space.to_scale(parameter, value) <= high
+            ]
+        }
+        return parameter
+
+    new_min = max(search_space.from_scale(parameter, low), min_value)
+    new_max = min(search_space.from_scale(parameter, high), max_value)
+    if value_type == "integer":
+        new_min, new_max = math.floor(new_min), math.ceil(new_max)
+    if new_min < new_max:
+        parameter["{}_value_spec".format(value_type)] = {
+            "min_value": new_min, "max_value": new_max
+        }
+    return parameter
+
+
+def narrow_parameters(parameters, trials, goal_type, top_k, margin):
+    """Narrows numeric parameters to the region of the best earlier trials.
+
+    Vertex AI tuning jobs can't be seeded with evaluated trials, so instead
+    the search space shrinks to the bounding box of the best ones, widened
+    by a margin, on each parameter's scale. Categorical parameters, ones the
+    trials didn't have and parents of conditional parameters are left as
+    is, conditional parameters are narrowed like the others.
+
+    Args:
+        parameters: list, Vertex AI ParameterSpec dictionaries.
+        trials: list, trial dictionaries fit onto the parameter space.
+        goal_type: str, either "minimize" or "maximize".
+        top_k: int, number of best trials to fit the box around.
+        margin: float, fraction of each range to widen by on each side.
+
+    Returns:
+        List of narrowed ParameterSpec dictionaries.
+    """
+    top_trials = get_top_trials(trials, goal_type, top_k)
+    narrowed_parameters = []
+    for parameter in parameters:
+        values = [
+            trial["parameters"][parameter["parameter_id"]]
+            for trial in top_trials
+            if parameter["parameter_id"] in trial["parameters"]
+        ]
+        if parameter.get("conditional_parameter_specs"):
+            # Narrowing a parent could drop values its children depend on.
+            parameter = dict(
+                parameter,
+                conditional_parameter_specs=[
+                    dict(
+                        conditional_spec,
+                        parameter_spec=narrow_parameters(
+                            [conditional_spec["parameter_spec"]],
+                            top_trials,
+                            goal_type,
+                            top_k,
+                            margin
+                        )[0]
+                    )
+                    for conditional_spec in parameter["conditional_parameter_specs"]
+                ]
+            )
+        elif values and search_space.get_value_type(parameter) != "categorical":
+            parameter = narrow_parameter(parameter, values, margin)
+        narrowed_parameters.append(parameter)
+    return narrowed_parameters
+
+
+def apply_warm_start(arguments, get_job):
+    """Narrows the parameters of arguments using earlier trials, if any.
+
+    Args:
+        arguments: dict, command line arguments.
+        get_job: function, takes hyperparameter tuning job name and returns
+            job.
+
+    Returns:
+        List of earlier trial dictionaries fit onto the parameter space.
+    """
+    if not (arguments["warm_start_job_name"] or arguments["warm_start_results_path"]):
+        return []
+    assert arguments["warm_start_top_k"] > 0, \
+    "warm_start_top_k must be positive."
+    assert arguments["warm_start_margin"] >= 0, \
+    "warm_start_margin can't be negative."
+
+    trials = load_trials(arguments, get_job)
+    fitted_trials = fit_trials(
+        arguments["parameters"],
+        trials,
+        arguments["warm_start_out_of_range"] == "clip"
+    )
+    print(
+        "Warm starting from {} of {} earlier trials.".format(
+            len(fitted_trials), len(trials)
+        )
+    )
+    if not fitted_trials:
+        return []
+
+    arguments["parameters"] = narrow_parameters(
+        arguments["parameters"],
+        fitted_trials,
+        arguments["goal_type"],
+        arguments["warm_start_top_k"],
+        arguments["warm_start_margin"]
+    )
+    print(
+        "Best earlier {} = {}, narrowed parameters = {}".format(
+            arguments["metric_id"],
+            get_top_trials(fitted_trials, arguments["goal_type"], 1)[0]["metric_value"],
+            arguments["parameters"]
+        )
+    )
+    return fitted_trials
@@ -0,0 +1,202 @@
+import json
+
+import hardware_catalog
+
+
+# Worker pools in the order Vertex AI expects them in `worker_pool_specs`.
+pool_roles = ["chief", "worker", "parameter_server", "evaluator"]
+
+reduction_server_image_uri = (
+    "us-docker.pkg.dev/vertex-ai-restricted/training/reductionserver:latest"
+)
+
+
+def add_worker_pool_arguments(parser):
+    """Adds distributed training topology command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--worker_pools",
+        help="JSON dict of worker pool configs keyed by chief, worker, parameter_server and evaluator.",
+        type=json.loads,
+        default={}
+    )
+    parser.add_argument(
+        "--tpu_topology",
+        help="TPU pod slice topology, i.e. 2x2x1, for TPU_V4_POD and TPU_V5_LITEPOD.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--reduction_server_replica_count",
+        help="Number of Reduction Server replicas to use for all-reduce. 0 means none.",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--reduction_server_machine_type",
+        help="Machine type for the Reduction Server replicas.",
+        type=str,
+        default="n1-highcpu-16"
+    )
+    parser.add_argument(
+        "--reduction_server_image_uri",
+        help="URI to Reduction Server container image.",
+        type=str,
+        default=reduction_server_image_uri
+    )
+
+
+def get_worker_pools(arguments):
+    """Gets worker pool configs keyed by role.
+
+    Without `worker_pools`, the top level machine arguments make up a single
+    pool as before. With a Reduction Server, its replicas beyond the first
+    are split out into a worker pool since the chief pool holds one replica.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of worker pool configs keyed by role.
+    """
+    if arguments["worker_pools"]:
+        return arguments["worker_pools"]
+
+    pool = {
+        "machine_type": arguments["machine_type"],
+        "accelerator_type": arguments["accelerator_type"],
+        "accelerator_count": arguments["accelerator_count"],
+        "replica_count": arguments["replica_count"],
+        "tpu_topology": arguments["tpu_topology"]
+    }
+    if not arguments["reduction_server_replica_count"] or pool["replica_count"] == 1:
+        return {"chief": pool}
+    return {
+        "chief": dict(pool, replica_count=1),
+        "worker": dict(pool, replica_count=pool["replica_count"] - 1)
+    }
+
+
+def has_accelerators(pool):
+    """Checks whether worker pool uses accelerators.
+
+    Args:
+        pool: dict, worker pool config.
+
+    Returns:
+        Whether pool uses accelerators.
+    """
+    return (
+        pool.get("accelerator_count", 0) > 0
+        and pool.get("accelerator_type", "ACCELERATOR_TYPE_UNSPECIFIED")
+        != "ACCELERATOR_TYPE_UNSPECIFIED"
+    )
+
+
+def validate_worker_pools(pools, arguments):
+    """Validates topology of worker pools before submission.
+
+    Args:
+        pools: dict, worker pool configs keyed by role.
+        arguments: dict, command line arguments.
+    """
+    unknown_roles = set(pools) - set(pool_roles)
+    assert not unknown_roles, \
+    "Unknown worker pool roles {}. Choices are {}.".format(
+        sorted(unknown_roles), pool_roles
+    )
+    assert "chief" in pools, "Must have a chief worker pool."
+    if arguments["worker_pools"] or len(pools) > 1:
+        assert pools["chief"].get("replica_count", 1) == 1, \
+        "Chief worker pool must have exactly one replica."
+
+    for role, pool in pools.items():
+        assert pool.get("machine_type"), \
+        "Worker pool {} must have a machine_type.".format(role)
+        assert pool.get("replica_count", 1) >= 1, \
+        "Worker pool {} must have at least one replica.".format(role)
+        assert (pool.get("accelerator_count", 0) > 0) == has_accelerators(pool), \
+        "Worker pool {} must set both accelerator_type and accelerator_count.".format(role)
+
+    if "parameter_server" in pools:
+        assert arguments["ml_framework"] == "tensorflow", \
+        "Parameter servers are only supported for tensorflow."
+        assert "worker" in pools, \
+        "Parameter servers need a worker pool to serve."
+
+    if arguments["reduction_server_replica_count"]:
+        assert "parameter_server" not in pools, \
+        "Can't use both parameter servers and a Reduction Server."
+        assert "worker" in pools, \
+        "Reduction Server needs a worker pool to reduce across."
+        assert all(
+            has_accelerators(pools[role]) for role in ["chief", "worker"]
+        ), \
+        "Reduction Server needs GPUs on the chief and worker pools."
+
+
+def build_worker_pool_specs(arguments, python_package_spec, container_spec):
+    """Builds worker pool specs of distributed training topology.
+
+    Args:
+        arguments: dict, command line arguments.
+        python_package_spec: dict, python package spec shared by pools.
+        container_spec: dict, container spec shared by pools.
+
+    Returns:
+        List of worker pool specs.
+    """
+    pools = get_worker_pools(arguments)
+    validate_worker_pools(pools, arguments)
+
+    worker_pool_specs = []
+    for role in pool_roles:
+        if role == "parameter_server" and arguments["reduction_server_replica_count"]:
+            worker_pool_specs.append(
+                {
+                    "machine_spec": hardware_catalog.build_machine_spec(
+                        arguments,
+                        arguments["reduction_server_machine_type"],
+                        "ACCELERATOR_TYPE_UNSPECIFIED",
+                        0
+                    ),
+                    "replica_count": arguments["reduction_server_replica_count"],
+                    "container_spec": {
+                        "image_uri": arguments["reduction_server_image_uri"]
+                    }
+                }
+            )
+            continue
+
+        pool = pools.get(role)
+        if pool is None:
+            # Unused pools in between are left empty.
+            worker_pool_specs.append({})
+            continue
+
+        worker_pool_spec = {
+            "machine_spec": hardware_catalog.build_machine_spec(
+                arguments,
+                pool["machine_type"],
+                pool.get("accelerator_type", "ACCELERATOR_TYPE_UNSPECIFIED"),
+                pool.get("accelerator_count", 0),
+                pool.get("tpu_topology", "")
+            ),
+            "replica_count": pool.get("replica_count", 1)
+        }
+        if python_package_spec:
+            worker_pool_spec["python_package_spec"] = dict(python_package_spec)
+            if pool.get("image_uri"):
+                worker_pool_spec["python_package_spec"]["executor_image_uri"] = pool["image_uri"]
+        else:
+            worker_pool_spec["container_spec"] = dict(container_spec)
+            if pool.get("image_uri"):
+                worker_pool_spec["container_spec"]["image_uri"] = pool["image_uri"]
+        worker_pool_specs.append(worker_pool_spec)
+
+    while not worker_pool_specs[-1]:
+        worker_pool_specs.pop()
+    return worker_pool_specs
@@ -0,0 +1,109 @@
+from vertex_operators import (
+    VertexBatchPredictOperator,
+    VertexDeployOperator,
+    VertexExportModelOperator,
+    VertexHyperparameterTuningOperator,
+    VertexTrainOperator,
+    VertexUploadModelOperator
+)
+
+vertex_train_op = VertexTrainOperator(
+    arguments=[
+        '--ml_framework=tensorflow',
+        '--project=my-project',
+        '--region=us-central1',
+        '--job_display_name=test-experiment',
+        '--replica_count=1',
+        '--pre_built_training_container_uri=us-docker.pkg.dev/vertex-ai/training/tf-gpu.2-5:latest',
+        '--model_package_gcs_path=gs://my-bucket/model_code/test_model-0.1.tar.gz',
+        '--python_module=trainer.task',
+        '--machine_type=n1-standard-4',
+        '--accelerator_type=NVIDIA_TESLA_K80',
+        '--accelerator_count=1',
+        '--job_polling_frequency=15',
+        '--trainer_args={"train_file_pattern": "gs://my-bucket/data/train_data.csv*", "eval_file_pattern": "gs://my-bucket/data/eval_data.csv*", "train_dataset_length": 10000, "eval_dataset_length": 5000, "num_epochs": 1, "train_batch_size": 100, "eval_batch_size": 100, "num_columns": 5, "hidden_units": [32, 16, 8], "learning_rate": 0.01, "output_dir": "gs://my-bucket/trained_models/tensorflow"}',
+    ],
+    task_id="vertex_train_task",
+    dag=test_dag
+)
+
+vertex_hptuning_op = VertexHyperparameterTuningOperator(
+    arguments=[
+        '--ml_framework=tensorflow',
+        '--project=my-project',
+        '--region=us-central1',
+        '--job_display_name=hp-test-image',
+        '--replica_count=1',
+        '--pre_built_training_container_uri=us-docker.pkg.dev/vertex-ai/training/tf-gpu.2-5:latest',
+        '--model_package_gcs_path=gs://my-bucket/model_code/test_model-0.1.tar.gz',
+        '--python_module=trainer.task',
+        '--machine_type=n1-standard-4',
+        '--accelerator_type=NVIDIA_TESLA_K80',
+        '--accelerator_count=1',
+        '--job_polling_frequency=15',
+        '--trainer_args={"train_file_pattern": "gs://my-bucket/data/train_data.csv*", "eval_file_pattern": "gs://my-bucket/data/eval_data.csv*", "train_dataset_length": 10000, "eval_dataset_length": 5000, "num_epochs": 1, "train_batch_size": 100, "eval_batch_size": 100, "num_columns": 5, "hidden_units": [32, 16, 8], "learning_rate": 0.01, "output_dir": "gs://my-bucket/trained_models"}',
+        '--metric_id=val_root_mean_squared_error',
+        '--goal_type=minimize',
+        '--algorithm=bayesian',
+        '--parameters=[{"parameter_id": "learning_rate", "double_value_spec": {"min_value": 1e-07, "max_value": 1}, "scale_type": "UNIT_LINEAR_SCALE"}, {"parameter_id": "train_batch_size", "discrete_value_spec": {"values": [4, 8, 16, 32, 64, 128]}, "scale_type": "UNIT_LINEAR_SCALE"}]',
+        '--max_trial_count=20',
+        '--parallel_trial_count=4',
+    ],
+    task_id="vertex_hptuning_task",
+    dag=test_dag
+)
+
+vertex_upload_model_op = VertexUploadModelOperator(
+    arguments=[
+        '--ml_framework=tensorflow',
+        '--project=my-project',
+        '--region=us-central1',
+        '--model_display_name=uploaded_model',
+        '--serving_container_image_uri=us-docker.pkg.dev/vertex-ai/prediction/tf2-cpu.2-5:latest',
+        '--artifact_uri=gs://my-bucket/trained_models/autoencoder_trained',
+    ],
+    task_id="vertex_upload_model_task",
+    dag=test_dag
+)
+
+vertex_deploy_op = VertexDeployOperator(
+    arguments=[
+        '--project=my-project',
+        '--region=us-central1',
+        '--endpoint_display_name=docker_endpoint',
+        '--model_display_name=uploaded_model',
+        '--deployed_model_display_name=docker_deployed_model',
+        '--machine_type=n1-standard-4',
+    ],
+    task_id="vertex_deploy_task",
+    dag=test_dag
+)
+
+vertex_batch_predict_op = VertexBatchPredictOperator(
+    arguments=[
+        '--project=my-project',
+        '--region=us-central1',
+        '--model_display_name=uploaded_model',
+        '--job_display_name=vertex-batch-predict',
+        '--instances_format=csv',
+        '--predictions_format=jsonl',
+        '--gcs_source=gs://my-bucket/data/test_data.csv',
+        '--gcs_destination_prefix=gs://my-bucket/batch_predictions',
+        '--machine_type=n1-standard-4',
+    ],
+    task_id="vertex_batch_predict_task",
+    dag=test_dag
+)
+
+vertex_export_model_op = VertexExportModelOperator(
+    arguments=[
+        '--project=my-project',
+        '--region=us-central1',
+        '--model_display_name=uploaded_model',
+        '--export_format_id=custom-trained',
+        '--destination_type=gcs',
+        '--destination_path=gs://my-bucket/exported_models',
+    ],
+    task_id="vertex_export_model_task",
+    dag=test_dag
+)
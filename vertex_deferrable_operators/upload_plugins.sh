@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# The plugins folder is on the path of both Composer workers and the triggerer.
+ENVIRONMENT=my-composer-environment
+LOCATION=us-central1
+
+for source in ./vertex_operators.py ./vertex_triggers.py ../vertex_common/*.py ../vertex_*_docker/vertex_*.py; do
+    gcloud composer environments storage plugins import \
+        --environment=${ENVIRONMENT} \
+        --location=${LOCATION} \
+        --source=${source}
+done
@@ -0,0 +1,312 @@
+import argparse
+
+from airflow.exceptions import AirflowException
+from airflow.models import BaseOperator
+
+import hardware_catalog
+import job_poller
+import rate_limiter
+import resource_index
+import telemetry
+import vertex_batch_predict
+import vertex_clients
+import vertex_deploy
+import vertex_export_model
+import vertex_hptuning
+import vertex_train
+import vertex_upload_model
+import warm_start
+from vertex_triggers import VertexJobTrigger, VertexOperationTrigger
+
+
+def get_model_name(arguments, client):
+    """Gets model resource name from model ID or display name.
+
+    Args:
+        arguments: dict, command line arguments.
+        client: instance of `ModelServiceClient`.
+
+    Returns:
+        Model resource name.
+    """
+    parent = vertex_clients.get_parent(arguments)
+    model_id = resource_index.get_model_id(arguments, client, parent)
+    if not model_id:
+        raise AirflowException(
+            "Model with name {} does NOT exist!".format(
+                arguments["model_display_name"]
+            )
+        )
+    return "{}/models/{}".format(parent, model_id)
+
+
+class VertexDeferrableOperator(BaseOperator):
+    """Submits a Vertex AI job or operation, then defers while it runs.
+
+    Subclasses take the same `arguments` as the component's
+    `KubernetesPodOperator`, but only hold a worker slot while submitting.
+    Watching the job is handed off to a trigger in the triggerer.
+
+    Args:
+        arguments: list, command line arguments of the component.
+    """
+    template_fields = ("arguments",)
+    component = None
+
+    def __init__(self, arguments, **kwargs):
+        super().__init__(**kwargs)
+        self.arguments = arguments
+
+    def parse_component_arguments(self):
+        """Parses arguments with the component's parser.
+
+        Returns:
+            Dictionary containing command line arguments.
+        """
+        parser = argparse.ArgumentParser()
+        self.component.parse_arguments(parser)
+        return parser.parse_args(self.arguments).__dict__
+
+    def submit(self, arguments):
+        """Submits Vertex AI job or operation.
+
+        Args:
+            arguments: dict, command line arguments.
+
+        Returns:
+            Trigger that watches the submitted job or operation.
+        """
+        raise NotImplementedError
+
+    def execute(self, context):
+        arguments = self.parse_component_arguments()
+        self.log.info("arguments = %s", arguments)
+        limiter = rate_limiter.configure(arguments, report_at_exit=False)
+        recorder = telemetry.configure(
+            arguments, self.component.__name__, export_at_exit=False
+        )
+        trigger = self.submit(arguments)
+        if limiter is not None:
+            self.log.info("Rate limiter metrics = %s", limiter.get_metrics())
+        if recorder is not None:
+            recorder.export()
+        self.defer(trigger=trigger, method_name="execute_complete")
+
+    def execute_complete(self, context, event):
+        if event["status"] != "success":
+            raise AirflowException(
+                "{} did not complete successfully: {}".format(
+                    event["name"], event.get("message")
+                )
+            )
+        self.log.info("%s completed successfully.", event["name"])
+        return event
+
+
+class VertexTrainOperator(VertexDeferrableOperator):
+    """Deferrable version of the vertex_train component."""
+    component = vertex_train
+
+    def submit(self, arguments):
+        assert not arguments["job_configs_path"], \
+        "Deferrable training runs a single job, use the component to train many."
+        arguments["trainer_args"] = vertex_train.convert_trainer_args(
+            arguments["trainer_args"]
+        )
+        client = vertex_clients.get_client("job_service", arguments["region"])
+        # Task retries reattach to the job through the ledger, if enabled.
+        job_name = vertex_train.submit_custom_job(
+            arguments, client, vertex_train.build_custom_job(arguments)
+        )
+        self.log.info("Custom job %s", job_name)
+        return VertexJobTrigger(
+            job_type="custom_job",
+            job_name=job_name,
+            region=arguments["region"],
+            polling_config=job_poller.get_polling_config(arguments),
+            rate_limits=arguments["rate_limits"],
+            rate_limit_store=arguments["rate_limit_store"]
+        )
+
+
+class VertexHyperparameterTuningOperator(VertexDeferrableOperator):
+    """Deferrable version of the vertex_hptuning component."""
+    component = vertex_hptuning
+
+    def submit(self, arguments):
+        assert arguments["tuning_backend"] == "vertex", \
+        "Deferrable tuning runs trials on Vertex AI, use the component for local trials."
+        arguments["trainer_args"] = vertex_hptuning.convert_trainer_args(
+            arguments["trainer_args"]
+        )
+        client = vertex_clients.get_client("job_service", arguments["region"])
+        warm_start.apply_warm_start(
+            arguments,
+            get_job=lambda name: client.get_hyperparameter_tuning_job(name=name)
+        )
+        # Task retries reattach to the job through the ledger, if enabled.
+        job_name = vertex_hptuning.submit_hyperparameter_tuning_job(
+            arguments,
+            client,
+            vertex_hptuning.build_hyperparameter_tuning_job(arguments)
+        )
+        self.log.info("Hyperparameter tuning job %s", job_name)
+        return VertexJobTrigger(
+            job_type="hyperparameter_tuning_job",
+            job_name=job_name,
+            region=arguments["region"],
+            polling_config=job_poller.get_polling_config(arguments),
+            rate_limits=arguments["rate_limits"],
+            rate_limit_store=arguments["rate_limit_store"]
+        )
+
+
+class VertexBatchPredictOperator(VertexDeferrableOperator):
+    """Deferrable version of the vertex_batch_predict component."""
+    component = vertex_batch_predict
+
+    def submit(self, arguments):
+        assert arguments["shard_count"] <= 1 and not arguments["incremental_state_uri"] and not arguments["online_max_instances"] and arguments["prediction_backend"] == "vertex" and not arguments["compact_output_uri"], \
+        "Deferrable batch prediction runs a single job, use the component to shard, predict incrementally, online or locally, or compact predictions."
+        model_client = vertex_clients.get_client(
+            "model_service", arguments["region"]
+        )
+        batch_prediction_job = vertex_batch_predict.build_batch_prediction_job(
+            arguments, get_model_name(arguments, model_client)
+        )
+
+        job_client = vertex_clients.get_client(
+            "job_service", arguments["region"]
+        )
+        response = job_client.create_batch_prediction_job(
+            parent=vertex_clients.get_parent(arguments),
+            batch_prediction_job=batch_prediction_job
+        )
+        self.log.info("Created batch prediction job %s", response.name)
+        return VertexJobTrigger(
+            job_type="batch_prediction_job",
+            job_name=response.name,
+            region=arguments["region"],
+            polling_config=job_poller.get_polling_config(arguments),
+            rate_limits=arguments["rate_limits"],
+            rate_limit_store=arguments["rate_limit_store"]
+        )
+
+
+class VertexDeployOperator(VertexDeferrableOperator):
+    """Deferrable version of the vertex_deploy component.
+
+    Creating the endpoint is quick so it is waited on, deploying the model is
+    what gets deferred.
+    """
+    component = vertex_deploy
+
+    def submit(self, arguments):
+        endpoint_client = vertex_clients.get_client(
+            "endpoint_service", arguments["region"]
+        )
+        model_client = vertex_clients.get_client(
+            "model_service", arguments["region"]
+        )
+        parent = vertex_clients.get_parent(arguments)
+
+        # Validate machine spec and resolve model before creating anything,
+        # so a bad model leaves no endpoint behind.
+        hardware_catalog.build_machine_spec(
+            arguments,
+            arguments["machine_type"],
+            arguments["accelerator_type"],
+            arguments["accelerator_count"]
+        )
+        model_name = get_model_name(arguments, model_client)
+
+        # Then create endpoint.
+        if arguments["endpoint_id"]:
+            endpoint_name = "{}/endpoints/{}".format(
+                parent, arguments["endpoint_id"]
+            )
+        else:
+            endpoint_display_name = resource_index.get_new_display_name(
+                arguments,
+                "endpoints",
+                endpoint_client,
+                parent,
+                arguments["endpoint_display_name"]
+            )
+            endpoint_name = endpoint_client.create_endpoint(
+                parent=parent, endpoint={"display_name": endpoint_display_name}
+            ).result().name
+        self.log.info("Endpoint = %s", endpoint_name)
+
+        # Deploy model to endpoint, routing traffic like the component.
+        endpoint = endpoint_client.get_endpoint(name=endpoint_name)
+        operation = endpoint_client.deploy_model(
+            endpoint=endpoint_name,
+            deployed_model=vertex_deploy.build_deployed_model(
+                arguments, endpoint, model_name
+            ),
+            traffic_split=vertex_deploy.get_traffic_split(endpoint)
+        )
+        return VertexOperationTrigger(
+            operation_name=operation.operation.name,
+            region=arguments["region"],
+            response_type="deploy_model",
+            polling_config=job_poller.get_polling_config(arguments),
+            rate_limits=arguments["rate_limits"],
+            rate_limit_store=arguments["rate_limit_store"]
+        )
+
+
+class VertexUploadModelOperator(VertexDeferrableOperator):
+    """Deferrable version of the vertex_upload_model component."""
+    component = vertex_upload_model
+
+    def submit(self, arguments):
+        client = vertex_clients.get_client("model_service", arguments["region"])
+        parent = vertex_clients.get_parent(arguments)
+
+        operation = client.upload_model(
+            parent=parent,
+            model={
+                "display_name": resource_index.get_new_display_name(
+                    arguments,
+                    "models",
+                    client,
+                    parent,
+                    arguments["model_display_name"]
+                ),
+                "artifact_uri": arguments["artifact_uri"],
+                "container_spec": vertex_upload_model.build_container_spec(
+                    arguments
+                )
+            }
+        )
+        return VertexOperationTrigger(
+            operation_name=operation.operation.name,
+            region=arguments["region"],
+            response_type="upload_model",
+            polling_config=job_poller.get_polling_config(arguments),
+            rate_limits=arguments["rate_limits"],
+            rate_limit_store=arguments["rate_limit_store"]
+        )
+
+
+class VertexExportModelOperator(VertexDeferrableOperator):
+    """Deferrable version of the vertex_export_model component."""
+    component = vertex_export_model
+
+    def submit(self, arguments):
+        client = vertex_clients.get_client("model_service", arguments["region"])
+
+        operation = client.export_model(
+            name=get_model_name(arguments, client),
+            output_config=vertex_export_model.build_output_config(arguments)
+        )
+        return VertexOperationTrigger(
+            operation_name=operation.operation.name,
+            region=arguments["region"],
+            response_type="export_model",
+            polling_config=job_poller.get_polling_config(arguments),
+            rate_limits=arguments["rate_limits"],
+            rate_limit_store=arguments["rate_limit_store"]
+        )
@@ -0,0 +1,221 @@
+import asyncio
+
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+
+import job_poller
+import rate_limiter
+import vertex_clients
+
+
+def get_async_client(service, region, rate_limits, rate_limit_store):
+    """Creates asyncio client of service, rate limited if configured.
+
+    Triggers share the triggerer process, so each gets its own limiter
+    instead of the process one. A shared store coordinates them.
+
+    Args:
+        service: str, name of service, i.e. job_service.
+        region: str, region of Vertex AI resources.
+        rate_limits: dict, buckets keyed by method, verb or "default".
+        rate_limit_store: str, empty, local path, or redis:// URL.
+
+    Returns:
+        Instance of asyncio service client.
+    """
+    return rate_limiter.wrap_client(
+        vertex_clients.get_client(service, region, use_async=True),
+        use_async=True,
+        client_limiter=rate_limiter.create_limiter(rate_limits, rate_limit_store)
+    )
+
+
+class VertexJobTrigger(BaseTrigger):
+    """Watches the state of a Vertex AI job from the triggerer.
+
+    Args:
+        job_type: str, type of job. Choices are "custom_job",
+            "hyperparameter_tuning_job", and "batch_prediction_job".
+        job_name: str, resource name of job.
+        region: str, region of job.
+        polling_config: dict, polling config from `job_poller`.
+        rate_limits: dict, rate limits from `rate_limiter`, if any.
+        rate_limit_store: str, bucket store of rate limits.
+    """
+    def __init__(self, job_type, job_name, region, polling_config, rate_limits=None, rate_limit_store=""):
+        super().__init__()
+        self.job_type = job_type
+        self.job_name = job_name
+        self.region = region
+        self.polling_config = polling_config
+        self.rate_limits = rate_limits or {}
+        self.rate_limit_store = rate_limit_store
+
+    def serialize(self):
+        return (
+            "vertex_triggers.VertexJobTrigger",
+            {
+                "job_type": self.job_type,
+                "job_name": self.job_name,
+                "region": self.region,
+                "polling_config": self.polling_config,
+                "rate_limits": self.rate_limits,
+                "rate_limit_store": self.rate_limit_store
+            }
+        )
+
+    async def run(self):
+        client = get_async_client(
+            "job_service", self.region, self.rate_limits, self.rate_limit_store
+        )
+        get_job = getattr(client, "get_{}".format(self.job_type))
+        cancel_job = getattr(client, "cancel_{}".format(self.job_type))
+        try:
+            job, timeline = await job_poller.wait_for_job_async(
+                get_job=lambda name: get_job(name=name),
+                job_name=self.job_name,
+                polling_config=self.polling_config,
+                cancel_job=lambda name: cancel_job(name=name)
+            )
+        except TimeoutError as error:
+            yield TriggerEvent(
+                {"status": "timeout", "name": self.job_name, "message": str(error)}
+            )
+            return
+        except Exception as error:
+            yield TriggerEvent(
+                {"status": "error", "name": self.job_name, "message": str(error)}
+            )
+            return
+
+        yield TriggerEvent(
+            {
+                "status": (
+                    "success" if job.state == job_poller.completed_state
+                    else "failed"
+                ),
+                "name": self.job_name,
+                "state": job_poller.get_state_name(job.state),
+                "message": job.error.message,
+                "timeline": timeline
+            }
+        )
+
+
+class VertexOperationTrigger(BaseTrigger):
+    """Watches a Vertex AI long-running operation from the triggerer.
+
+    Args:
+        operation_name: str, resource name of operation.
+        region: str, region of operation.
+        response_type: str, type of operation response. Choices are
+            "upload_model", "deploy_model", and "export_model".
+        polling_config: dict, polling config from `job_poller`.
+        rate_limits: dict, rate limits from `rate_limiter`, if any.
+        rate_limit_store: str, bucket store of rate limits.
+    """
+    def __init__(self, operation_name, region, response_type, polling_config, rate_limits=None, rate_limit_store=""):
+        super().__init__()
+        self.operation_name = operation_name
+        self.region = region
+        self.response_type = response_type
+        self.polling_config = polling_config
+        self.rate_limits = rate_limits or {}
+        self.rate_limit_store = rate_limit_store
+
+    def serialize(self):
+        return (
+            "vertex_triggers.VertexOperationTrigger",
+            {
+                "operation_name": self.operation_name,
+                "region": self.region,
+                "response_type": self.response_type,
+                "polling_config": self.polling_config,
+                "rate_limits": self.rate_limits,
+                "rate_limit_store": self.rate_limit_store
+            }
+        )
+
+    def parse_response(self, operation):
+        """Parses the IDs later tasks need out of a finished operation.
+
+        Args:
+            operation: instance of `operations_pb2.Operation`.
+
+        Returns:
+            Dictionary of operation results.
+        """
+        if self.response_type == "upload_model":
+            response = vertex_clients.get_types().UploadModelResponse.deserialize(
+                operation.response.value
+            )
+            return {"model_id": response.model.split("/")[-1]}
+        if self.response_type == "deploy_model":
+            response = vertex_clients.get_types().DeployModelResponse.deserialize(
+                operation.response.value
+            )
+            return {"deployed_model_id": response.deployed_model.id}
+        return {}
+
+    async def run(self):
+        # Operations of all services are served by the same regional endpoint.
+        client = get_async_client(
+            "model_service", self.region, self.rate_limits, self.rate_limit_store
+        )
+        status = job_poller.create_poll_status(self.operation_name)
+        while True:
+            try:
+                job_poller.check_timeout(status, self.polling_config)
+                operation = await client.get_operation(
+                    request={"name": self.operation_name}
+                )
+            except TimeoutError as error:
+                yield TriggerEvent(
+                    {
+                        "status": "timeout",
+                        "name": self.operation_name,
+                        "message": str(error)
+                    }
+                )
+                return
+            except Exception as error:
+                try:
+                    interval = job_poller.record_error(
+                        status, error, self.polling_config
+                    )
+                except Exception:
+                    yield TriggerEvent(
+                        {
+                            "status": "error",
+                            "name": self.operation_name,
+                            "message": str(error)
+                        }
+                    )
+                    return
+                await asyncio.sleep(interval)
+                continue
+
+            if operation.done:
+                break
+            status["streak"] += 1
+            await asyncio.sleep(
+                job_poller.compute_poll_interval(
+                    job_poller.JOB_STATE_RUNNING,
+                    status["streak"],
+                    0.0,
+                    self.polling_config
+                )
+            )
+
+        if operation.HasField("error"):
+            yield TriggerEvent(
+                {
+                    "status": "failed",
+                    "name": self.operation_name,
+                    "message": operation.error.message
+                }
+            )
+            return
+
+        event = {"status": "success", "name": self.operation_name}
+        event.update(self.parse_response(operation))
+        yield TriggerEvent(event)
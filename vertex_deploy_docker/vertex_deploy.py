@@ -1,6 +1,10 @@
 import argparse
 
-from google.cloud import aiplatform
+import hardware_catalog
+import rate_limiter
+import resource_index
+import telemetry
+import vertex_clients
 
 
 def parse_arguments(parser):
@@ -69,6 +73,10 @@ def parse_arguments(parser):
         type=int,
         default=0
     )
+    hardware_catalog.add_hardware_arguments(parser)
+    resource_index.add_index_arguments(parser)
+    rate_limiter.add_rate_limit_arguments(parser)
+    telemetry.add_telemetry_arguments(parser)
 
 
 def parse_command_line_arguments():
@@ -89,73 +97,19 @@ def parse_command_line_arguments():
     return arguments
 
 
-def deploy_model(arguments):
-    # Get accelerator_type.
-    accelerator_map = {
-        "NVIDIA_TESLA_K80": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_K80,
-        "NVIDIA_TESLA_P100": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_P100,
-        "NVIDIA_TESLA_V100": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_V100,
-        "NVIDIA_TESLA_P4": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_P4,
-        "NVIDIA_TESLA_T4": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_T4
-    }
-    accelerator_type = accelerator_map.get(arguments["accelerator_type"])
-    if accelerator_type is None:
-        accelerator_type = aiplatform.gapic.AcceleratorType.ACCELERATOR_TYPE_UNSPECIFIED
-
-    # Initialize.
-    aiplatform.init(
-        project=arguments["project"], location=arguments["region"]
-    )
-
-    # First create endpoint.
-    endpoint_id = arguments["endpoint_id"]
-    if not endpoint_id:
-        endpoint_display_name = arguments["endpoint_display_name"]
-        endpoint_name_match = aiplatform.Endpoint.list(
-            filter="display_name={}".format(endpoint_display_name)
-        )
-        if endpoint_name_match:
-            print(
-                "Endpoint with name {} already exists!".format(
-                    endpoint_display_name
-                )
-            )
-            endpoint_display_name = "{}_0".format(endpoint_display_name)
-
-        endpoint = aiplatform.Endpoint.create(
-            display_name=endpoint_display_name
-        )
-        endpoint_id = endpoint.resource_name.split("/")[-1]
-    else:
-        # Fetch Endpoint object.
-        endpoint = aiplatform.Endpoint(endpoint_name=model_id)
-    print("Endpoint ID = {}".format(endpoint_id))
-
-    # Get model ID.
-    model_id = arguments["model_id"]
-    if not model_id:
-        model_display_name = arguments["model_display_name"]
-        model_name_match = aiplatform.Model.list(
-            filter="display_name={}".format(model_display_name)
-        )
-        if not model_name_match:
-            print(
-                "Model with name {} does NOT exist!".format(
-                    model_display_name
-                )
-            )
-            return
-        else:
-            model_id = model_name_match[0].name.split("/")[-1]
-    print("Model ID = {}".format(model_id))
+def build_deployed_model(arguments, endpoint, model_name):
+    """Builds deployed model resource for endpoint.
 
-    # Fetch Model object.
-    model = aiplatform.Model(model_name=model_id)
+    Args:
+        arguments: dict, command line arguments.
+        endpoint: instance of `Endpoint` to deploy to.
+        model_name: str, resource name of model.
 
-    # Deploy model to endpoint.
+    Returns:
+        Dictionary of deployed model.
+    """
     deployed_model_display_name = arguments["deployed_model_display_name"]
-    deployed_model_list = endpoint.list_models()
-    for deployed_model in deployed_model_list:
+    for deployed_model in endpoint.deployed_models:
         if deployed_model.display_name == deployed_model_display_name:
             print(
                 "Deployed model with name {} already exists!".format(
@@ -165,19 +119,129 @@ def deploy_model(arguments):
             deployed_model_display_name = "{}_0".format(
                 deployed_model_display_name
             )
-        break
-    response = model.deploy(
-        endpoint=endpoint,
-        deployed_model_display_name=deployed_model_display_name,
-        machine_type=arguments["machine_type"],
-        accelerator_type=accelerator_type,
-        accelerator_count=arguments["accelerator_count"],
-        sync=True
+            break
+
+    return {
+        "model": model_name,
+        "display_name": deployed_model_display_name,
+        "dedicated_resources": {
+            "machine_spec": hardware_catalog.build_machine_spec(
+                arguments,
+                arguments["machine_type"],
+                arguments["accelerator_type"],
+                arguments["accelerator_count"]
+            ),
+            "min_replica_count": 1,
+            "max_replica_count": 1
+        }
+    }
+
+
+def get_traffic_split(endpoint):
+    """Gets traffic split of endpoint once the new model is deployed.
+
+    Only routes traffic to the model if it is the first one on the endpoint.
+
+    Args:
+        endpoint: instance of `Endpoint` to deploy to.
+
+    Returns:
+        Dictionary mapping deployed model IDs to percent of traffic, "0"
+        being the new model.
+    """
+    if not endpoint.deployed_models:
+        return {"0": 100}
+    traffic_split = dict(endpoint.traffic_split)
+    traffic_split["0"] = 0
+    return traffic_split
+
+
+def deploy_model(arguments, endpoint_client=None, model_client=None):
+    """Deploys model to new or existing endpoint.
+
+    Args:
+        arguments: dict, command line arguments.
+        endpoint_client: instance of `EndpointServiceClient` to reuse, if any.
+        model_client: instance of `ModelServiceClient` to reuse, if any.
+
+    Returns:
+        Dictionary of endpoint resource name and deployed model ID or None if
+        model does not exist.
+    """
+    # Validate machine spec before creating anything.
+    hardware_catalog.build_machine_spec(
+        arguments,
+        arguments["machine_type"],
+        arguments["accelerator_type"],
+        arguments["accelerator_count"]
     )
-    deployed_model_id = response.name.split("/")[-1]
+
+    # Initialize.
+    if endpoint_client is None:
+        endpoint_client = vertex_clients.get_client(
+            "endpoint_service", arguments["region"]
+        )
+    if model_client is None:
+        model_client = vertex_clients.get_client(
+            "model_service", arguments["region"]
+        )
+    parent = vertex_clients.get_parent(arguments)
+
+    # Resolve model before creating endpoint so a bad one leaves no orphan.
+    model_id = resource_index.get_model_id(arguments, model_client, parent)
+    if not model_id:
+        return
+
+    # Then create endpoint.
+    endpoint_id = arguments["endpoint_id"]
+    if not endpoint_id:
+        endpoint_display_name = resource_index.get_new_display_name(
+            arguments,
+            "endpoints",
+            endpoint_client,
+            parent,
+            arguments["endpoint_display_name"]
+        )
+        endpoint = endpoint_client.create_endpoint(
+            parent=parent, endpoint={"display_name": endpoint_display_name}
+        ).result()
+        endpoint_id = endpoint.name.split("/")[-1]
+        resource_index.record_resource(arguments, "endpoints", parent, endpoint)
+    else:
+        # Fetch Endpoint object.
+        endpoint = endpoint_client.get_endpoint(
+            name="{}/endpoints/{}".format(parent, endpoint_id)
+        )
+    print("Endpoint ID = {}".format(endpoint_id))
+
+    # Deploy model to endpoint.
+    response = endpoint_client.deploy_model(
+        endpoint=endpoint.name,
+        deployed_model=build_deployed_model(
+            arguments, endpoint, "{}/models/{}".format(parent, model_id)
+        ),
+        traffic_split=get_traffic_split(endpoint)
+    ).result()
+    deployed_model_id = response.deployed_model.id
     print("Deployed model ID = {}".format(deployed_model_id))
 
+    return {
+        "endpoint_name": endpoint.name,
+        "deployed_model_id": deployed_model_id
+    }
+
+
+def run(arguments):
+    """Deploys model to endpoint.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    rate_limiter.configure(arguments)
+    telemetry.configure(arguments, "vertex_deploy")
+    deploy_model(arguments)
+
 
 if __name__ == "__main__":
     arguments = parse_command_line_arguments()
-    deploy_model(arguments)
+    run(arguments)
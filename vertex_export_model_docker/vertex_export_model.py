@@ -1,6 +1,9 @@
 import argparse
 
-from google.cloud import aiplatform
+import rate_limiter
+import resource_index
+import telemetry
+import vertex_clients
 
 
 def parse_arguments(parser):
@@ -60,6 +63,9 @@ def parse_arguments(parser):
         type=str,
         required=True
     )
+    resource_index.add_index_arguments(parser)
+    rate_limiter.add_rate_limit_arguments(parser)
+    telemetry.add_telemetry_arguments(parser)
 
 
 def parse_command_line_arguments():
@@ -80,47 +86,68 @@ def parse_command_line_arguments():
     return arguments
 
 
-def export_model(arguments):
+def build_output_config(arguments):
+    """Builds output config of model export.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of output config.
+    """
+    output_config = {"export_format_id": arguments["export_format_id"]}
+    if arguments["destination_type"] == "gcs":
+        output_config["artifact_destination"] = {
+            "output_uri_prefix": arguments["destination_path"]
+        }
+    else:
+        output_config["image_destination"] = {
+            "output_uri": arguments["destination_path"]
+        }
+    return output_config
+
+
+def export_model(arguments, client=None):
+    """Exports model from Vertex AI.
+
+    Args:
+        arguments: dict, command line arguments.
+        client: instance of `ModelServiceClient` to reuse, if any.
+
+    Returns:
+        Export model response or None if model does not exist.
+    """
     # Initialize.
-    aiplatform.init(
-        project=arguments["project"], location=arguments["region"]
-    )
+    if client is None:
+        client = vertex_clients.get_client("model_service", arguments["region"])
+    parent = vertex_clients.get_parent(arguments)
 
     # Get model ID.
-    model_id = arguments["model_id"]
+    model_id = resource_index.get_model_id(arguments, client, parent)
     if not model_id:
-        model_display_name = arguments["model_display_name"]
-        model_name_match = aiplatform.Model.list(
-            filter="display_name={}".format(model_display_name)
-        )
-        if not model_name_match:
-            print(
-                "Model with name {} does NOT exist!".format(
-                    model_display_name
-                )
-            )
-            return
-        else:
-            model_id = model_name_match[0].name.split("/")[-1]
-    print("Model ID = {}".format(model_id))
-
-    # Fetch Model object.
-    model = aiplatform.Model(model_name=model_id)
+        return
 
     # Finally export model.
-    if arguments["destination_type"] == "gcs":
-        response = model.export_model(
-            export_format_id=arguments["export_format_id"],
-            artifact_destination=arguments["destination_path"]
-        )
-    else:
-        response = model.export_model(
-            export_format_id=arguments["export_format_id"],
-            image_destination=arguments["destination_path"]
-        )
+    response = client.export_model(
+        name="{}/models/{}".format(parent, model_id),
+        output_config=build_output_config(arguments)
+    ).result()
     print("Model export response = {}".format(response))
 
+    return response
+
+
+def run(arguments):
+    """Exports model.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    rate_limiter.configure(arguments)
+    telemetry.configure(arguments, "vertex_export_model")
+    export_model(arguments)
+
 
 if __name__ == "__main__":
     arguments = parse_command_line_arguments()
-    export_model(arguments)
+    run(arguments)
@@ -1,9 +1,18 @@
 import argparse
 from datetime import datetime
 import json
-import time
 
-from google.cloud import aiplatform
+import hardware_catalog
+import job_ledger
+import job_poller
+import local_trials
+import rate_limiter
+import search_space
+import telemetry
+import trial_store
+import vertex_clients
+import warm_start
+import worker_pools
 
 
 def convert_trainer_args(trainer_args):
@@ -96,12 +105,6 @@ def parse_arguments(parser):
         type=int,
         default=0
     )
-    parser.add_argument(
-        "--job_polling_frequency",
-        help="Number of seconds to wait between job status polls.",
-        type=int,
-        default=15
-    )
     parser.add_argument(
         "--trainer_args",
         help="Args used by the trainer application",
@@ -130,7 +133,7 @@ def parse_arguments(parser):
     )
     parser.add_argument(
         "--parameters",
-        help="List of hyperparameter configs to tune.",
+        help="List of hyperparameter configs to tune, optionally with conditional_parameter_specs.",
         type=json.loads,
         default=[]
     )
@@ -146,6 +149,66 @@ def parse_arguments(parser):
         type=int,
         default=0
     )
+    parser.add_argument(
+        "--grid_sizing",
+        help="Whether grid searches only warn when trial counts don't match the grid size, or set them to it.",
+        type=str,
+        default="warn",
+        choices=["warn", "auto"]
+    )
+    parser.add_argument(
+        "--max_failed_trial_count",
+        help="Number of failed trials after which the study fails. 0 lets Vertex AI decide.",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--automated_stopping",
+        help="Rule Vertex AI uses to stop unpromising trials early.",
+        type=str,
+        default="none",
+        choices=["none", "median", "decay_curve"]
+    )
+    parser.add_argument(
+        "--automated_stopping_use_elapsed_duration",
+        help="Whether automated stopping compares trials by elapsed time instead of steps.",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--measurement_selection_type",
+        help="Which measurement of each trial is its final metric. Empty lets Vertex AI decide.",
+        type=str,
+        default="",
+        choices=["", "last", "best"]
+    )
+    parser.add_argument(
+        "--convergence_patience",
+        help="Number of completed trials without improvement after which the study is cancelled. 0 disables.",
+        type=int,
+        default=0
+    )
+    parser.add_argument(
+        "--convergence_min_delta",
+        help="Smallest change of the best metric that counts as an improvement.",
+        type=float,
+        default=0.0
+    )
+    parser.add_argument(
+        "--convergence_min_trials",
+        help="Number of completed trials before the study may be cancelled for converging.",
+        type=int,
+        default=0
+    )
+    worker_pools.add_worker_pool_arguments(parser)
+    hardware_catalog.add_hardware_arguments(parser)
+    job_poller.add_polling_arguments(parser)
+    job_ledger.add_ledger_arguments(parser)
+    rate_limiter.add_rate_limit_arguments(parser)
+    warm_start.add_warm_start_arguments(parser)
+    trial_store.add_trial_store_arguments(parser)
+    local_trials.add_local_trial_arguments(parser)
+    telemetry.add_telemetry_arguments(parser)
+
 
 def parse_command_line_arguments():
     """Parses command line arguments and returns dictionary.
@@ -165,7 +228,87 @@ def parse_command_line_arguments():
     return arguments
 
 
-def create_hyperparameter_tuning_job(arguments):
+def validate_study_arguments(arguments):
+    """Validates study arguments shared by all tuning backends.
+
+    Conditional parameters are translated into Vertex AI's
+    conditional_parameter_specs in place.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    arguments["parameters"] = search_space.normalize_parameters(
+        arguments["parameters"]
+    )
+    assert arguments["max_failed_trial_count"] >= 0, \
+    "max_failed_trial_count can't be negative."
+    assert not arguments["max_trial_count"] or arguments["max_failed_trial_count"] <= arguments["max_trial_count"], \
+    "max_failed_trial_count can't exceed max_trial_count."
+    assert arguments["automated_stopping"] != "none" or not arguments["automated_stopping_use_elapsed_duration"], \
+    "automated_stopping_use_elapsed_duration needs automated_stopping."
+    assert arguments["convergence_patience"] >= 0, \
+    "convergence_patience can't be negative."
+    assert arguments["convergence_min_delta"] >= 0, \
+    "convergence_min_delta can't be negative."
+
+
+def size_grid_search(arguments):
+    """Dedupes grid parameters and checks trial counts against grid size.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    if arguments["algorithm"] != "grid":
+        return
+    arguments["parameters"] = [
+        search_space.dedupe_grid_parameter(parameter)
+        for parameter in arguments["parameters"]
+    ]
+    grid_size = search_space.GridSpace(arguments["parameters"]).size
+    print("Grid has {} distinct points.".format(grid_size))
+
+    max_trial_count = arguments["max_trial_count"]
+    if max_trial_count != grid_size:
+        if arguments["grid_sizing"] == "auto" or not max_trial_count:
+            print(
+                "Setting max_trial_count from {} to {}.".format(
+                    max_trial_count, grid_size
+                )
+            )
+            arguments["max_trial_count"] = grid_size
+        elif max_trial_count > grid_size:
+            print(
+                "Warning: max_trial_count {} exceeds the {} grid points, extra trials repeat points.".format(
+                    max_trial_count, grid_size
+                )
+            )
+        else:
+            print(
+                "Warning: max_trial_count {} only covers {:.1%} of the {} grid points.".format(
+                    max_trial_count, max_trial_count / grid_size, grid_size
+                )
+            )
+
+    if arguments["parallel_trial_count"] > arguments["max_trial_count"]:
+        if arguments["grid_sizing"] == "auto":
+            arguments["parallel_trial_count"] = arguments["max_trial_count"]
+        else:
+            print(
+                "Warning: parallel_trial_count {} exceeds max_trial_count {}.".format(
+                    arguments["parallel_trial_count"], arguments["max_trial_count"]
+                )
+            )
+
+
+def build_hyperparameter_tuning_job(arguments):
+    """Builds hyperparameter tuning job resource from arguments.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of hyperparameter tuning job resource.
+    """
     assert arguments["pre_built_training_container_uri"] or arguments["custom_training_container_uri"], \
     "Must use either a pre-built or custom training image."
     assert not (arguments["pre_built_training_container_uri"] and arguments["custom_training_container_uri"]), \
@@ -178,69 +321,71 @@ def create_hyperparameter_tuning_job(arguments):
         assert arguments["custom_training_container_uri"], \
         "Must use custom training container if using non-native Vertex AI ML framework."
 
-    # Get accelerator_type.
-    accelerator_map = {
-        "NVIDIA_TESLA_K80": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_K80,
-        "NVIDIA_TESLA_P100": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_P100,
-        "NVIDIA_TESLA_V100": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_V100,
-        "NVIDIA_TESLA_P4": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_P4,
-        "NVIDIA_TESLA_T4": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_T4
-    }
-    accelerator_type = accelerator_map.get(arguments["accelerator_type"])
-    if accelerator_type is None:
-        accelerator_type = aiplatform.gapic.AcceleratorType.ACCELERATOR_TYPE_UNSPECIFIED
+    validate_study_arguments(arguments)
+    size_grid_search(arguments)
+
+    study_spec_types = vertex_clients.get_types().StudySpec
 
     # Get search type.
     algorithm_map = {
-        "bayesian": aiplatform.gapic.StudySpec.Algorithm.ALGORITHM_UNSPECIFIED,
-        "random": aiplatform.gapic.StudySpec.Algorithm.RANDOM_SEARCH,
-        "grid": aiplatform.gapic.StudySpec.Algorithm.GRID_SEARCH
+        "bayesian": study_spec_types.Algorithm.ALGORITHM_UNSPECIFIED,
+        "random": study_spec_types.Algorithm.RANDOM_SEARCH,
+        "grid": study_spec_types.Algorithm.GRID_SEARCH
     }
     algorithm = algorithm_map.get(arguments["algorithm"])
     if algorithm is None:
-        algorithm = aiplatform.gapic.StudySpec.Algorithm.ALGORITHM_UNSPECIFIED
-
-    # The AI Platform services require regional API endpoints.
-    client_options = {
-        "api_endpoint": "{}-aiplatform.googleapis.com".format(
-            arguments["region"]
-        )
-    }
-    # Initialize client that will be used to create and send requests.
-    # This client only needs to be created once, and can be reused for multiple requests.
-    client = aiplatform.gapic.JobServiceClient(client_options=client_options)
+        algorithm = study_spec_types.Algorithm.ALGORITHM_UNSPECIFIED
 
     # study_spec
     metric = {
         "metric_id": arguments["metric_id"],
         "goal": (
-            aiplatform.gapic.StudySpec.MetricSpec.GoalType.MINIMIZE
+            study_spec_types.MetricSpec.GoalType.MINIMIZE
             if arguments["goal_type"] == "minimize"
-            else aiplatform.gapic.StudySpec.MetricSpec.GoalType.MAXIMIZE
+            else study_spec_types.MetricSpec.GoalType.MAXIMIZE
         )
     }
 
-    for param in arguments["parameters"]:
+    for param in search_space.iter_parameters(arguments["parameters"]):
         scale_type = param.get("scale_type")
         if not scale_type:
-            param["scale_type"] = aiplatform.gapic.StudySpec.ParameterSpec.ScaleType.SCALE_TYPE_UNSPECIFIED
+            param["scale_type"] = study_spec_types.ParameterSpec.ScaleType.SCALE_TYPE_UNSPECIFIED
             continue
         if param["scale_type"] == "SCALE_TYPE_UNSPECIFIED":
-            param["scale_type"] = aiplatform.gapic.StudySpec.ParameterSpec.ScaleType.SCALE_TYPE_UNSPECIFIED
+            param["scale_type"] = study_spec_types.ParameterSpec.ScaleType.SCALE_TYPE_UNSPECIFIED
         elif param["scale_type"] == "UNIT_LINEAR_SCALE":
-            param["scale_type"] = aiplatform.gapic.StudySpec.ParameterSpec.ScaleType.UNIT_LINEAR_SCALE
+            param["scale_type"] = study_spec_types.ParameterSpec.ScaleType.UNIT_LINEAR_SCALE
         elif param["scale_type"] == "UNIT_LOG_SCALE":
-            param["scale_type"] = aiplatform.gapic.StudySpec.ParameterSpec.ScaleType.UNIT_LOG_SCALE
+            param["scale_type"] = study_spec_types.ParameterSpec.ScaleType.UNIT_LOG_SCALE
         elif param["scale_type"] == "UNIT_REVERSE_LOG_SCALE":
-            param["scale_type"] = aiplatform.gapic.StudySpec.ParameterSpec.ScaleType.UNIT_REVERSE_LOG_SCALE
+            param["scale_type"] = study_spec_types.ParameterSpec.ScaleType.UNIT_REVERSE_LOG_SCALE
 
-    # trial_job_spec
-    machine_spec = {
-        "machine_type": arguments["machine_type"],
-        "accelerator_type": accelerator_type,
-        "accelerator_count": arguments["accelerator_count"],
+    study_spec = {
+        "metrics": [metric],
+        "parameters": arguments["parameters"],
+        "algorithm": algorithm,
     }
 
+    # Stop unpromising trials early instead of running them to completion.
+    if arguments["automated_stopping"] != "none":
+        study_spec["{}_stopping_spec".format(
+            "median_automated"
+            if arguments["automated_stopping"] == "median"
+            else "decay_curve"
+        )] = {
+            "use_elapsed_duration": (
+                arguments["automated_stopping_use_elapsed_duration"]
+            )
+        }
+
+    if arguments["measurement_selection_type"]:
+        study_spec["measurement_selection_type"] = (
+            study_spec_types.MeasurementSelectionType.LAST_MEASUREMENT
+            if arguments["measurement_selection_type"] == "last"
+            else study_spec_types.MeasurementSelectionType.BEST_MEASUREMENT
+        )
+
+    # trial_job_spec
     python_package_spec = {}
     if arguments["pre_built_training_container_uri"]:
         python_package_spec.update(
@@ -263,56 +408,310 @@ def create_hyperparameter_tuning_job(arguments):
             }
         )
 
-    worker_pool_specs = [
-        {
-            "machine_spec": machine_spec,
-            "replica_count": arguments["replica_count"],
-            "python_package_spec": python_package_spec
-        }
-    ]
-
-    for worker_pool_spec in worker_pool_specs:
-        if python_package_spec:
-            worker_pool_spec["python_package_spec"] = python_package_spec
-        else:
-            worker_pool_spec["container_spec"] = container_spec
+    worker_pool_specs = worker_pools.build_worker_pool_specs(
+        arguments, python_package_spec, container_spec
+    )
 
     # hyperparameter_tuning_job
     hyperparameter_tuning_job = {
         "display_name": arguments["job_display_name"],
         "max_trial_count": arguments["max_trial_count"],
         "parallel_trial_count": arguments["parallel_trial_count"],
-        "study_spec": {
-            "metrics": [metric],
-            "parameters": arguments["parameters"],
-            "algorithm": algorithm,
-        },
+        "study_spec": study_spec,
         "trial_job_spec": {"worker_pool_specs": worker_pool_specs},
     }
-    parent = "projects/{}/locations/{}".format(
-        arguments["project"], arguments["region"]
+    if arguments["max_failed_trial_count"]:
+        hyperparameter_tuning_job["max_failed_trial_count"] = (
+            arguments["max_failed_trial_count"]
+        )
+
+    return hyperparameter_tuning_job
+
+
+def get_completed_trial_metrics(job, metric_id):
+    """Gets final metric of succeeded trials in the order they ended.
+
+    Args:
+        job: polled hyperparameter tuning job.
+        metric_id: str, name of metric to optimize.
+
+    Returns:
+        List of trial ID and metric value tuples.
+    """
+    return [
+        (trial["trial_id"], trial["metric_value"])
+        for trial in warm_start.parse_job_trials(job, metric_id)
+    ]
+
+
+def get_best_trial(trial_metrics, goal_type):
+    """Gets trial with the best metric.
+
+    Args:
+        trial_metrics: list, trial ID and metric value tuples.
+        goal_type: str, either "minimize" or "maximize".
+
+    Returns:
+        Trial ID and metric value tuple, or None if there are no trials.
+    """
+    if not trial_metrics:
+        return None
+    choose = min if goal_type == "minimize" else max
+    return choose(trial_metrics, key=lambda trial_metric: trial_metric[1])
+
+
+def has_converged(values, goal_type, patience, min_delta, min_trials):
+    """Checks whether the best metric has plateaued.
+
+    Args:
+        values: list, metric values of completed trials in order.
+        goal_type: str, either "minimize" or "maximize".
+        patience: int, number of trials without improvement that plateau.
+        min_delta: float, smallest change of the best metric that counts
+            as an improvement.
+        min_trials: int, number of trials needed before converging.
+
+    Returns:
+        Whether the last `patience` trials did not improve the best metric.
+    """
+    if not patience or len(values) < max(min_trials, patience + 1):
+        return False
+    sign = 1.0 if goal_type == "minimize" else -1.0
+    best = sign * values[0]
+    trials_since_improvement = 0
+    for value in values[1:]:
+        if sign * value < best - min_delta:
+            best = sign * value
+            trials_since_improvement = 0
+        else:
+            trials_since_improvement += 1
+    return trials_since_improvement >= patience
+
+
+def create_convergence_monitor(arguments, cancel_job):
+    """Creates poll callback that cancels the study once it converges.
+
+    Args:
+        arguments: dict, command line arguments.
+        cancel_job: function, takes job name and cancels job.
+
+    Returns:
+        Poll callback taking job and dictionary of whether it cancelled the
+        study and the trials it last saw.
+    """
+    monitor = {"converged": False, "trial_metrics": []}
+
+    def on_poll(job):
+        monitor["trial_metrics"] = get_completed_trial_metrics(
+            job, arguments["metric_id"]
+        )
+        if monitor["converged"] or job.state not in job_poller.running_states:
+            return
+        if has_converged(
+            [value for _, value in monitor["trial_metrics"]],
+            arguments["goal_type"],
+            arguments["convergence_patience"],
+            arguments["convergence_min_delta"],
+            arguments["convergence_min_trials"]
+        ):
+            print(
+                "Best {} did not improve for {} trials, cancelling {}.".format(
+                    arguments["metric_id"],
+                    arguments["convergence_patience"],
+                    job.name
+                )
+            )
+            cancel_job(job.name)
+            monitor["converged"] = True
+
+    return on_poll, monitor
+
+
+def run_local_hyperparameter_tuning(arguments, seed_trials):
+    """Runs study with trials as local subprocesses instead of on Vertex AI.
+
+    Args:
+        arguments: dict, command line arguments.
+        seed_trials: list, earlier trial dictionaries to warm start the
+            searcher with.
+
+    Returns:
+        Dictionary of study results like the ones of Vertex AI studies.
+    """
+    validate_study_arguments(arguments)
+    size_grid_search(arguments)
+    trials_dir = local_trials.create_trials_dir(arguments)
+    store = trial_store.create_trial_store(arguments)
+    trial_metrics = []
+
+    def on_trial(trial):
+        if store is not None:
+            store.append_trials([trial], trials_dir, job_poller.JOB_STATE_RUNNING)
+        if trial["state"] == "SUCCEEDED":
+            trial_metrics.append((trial["trial_id"], trial["metric_value"]))
+        converged = has_converged(
+            [value for _, value in trial_metrics],
+            arguments["goal_type"],
+            arguments["convergence_patience"],
+            arguments["convergence_min_delta"],
+            arguments["convergence_min_trials"]
+        )
+        if converged:
+            print(
+                "Best {} did not improve for {} trials, stopping.".format(
+                    arguments["metric_id"], arguments["convergence_patience"]
+                )
+            )
+        return converged
+
+    study = local_trials.run_local_study(
+        arguments, trials_dir, seed_trials, on_trial
+    )
+    state = (
+        job_poller.JOB_STATE_CANCELLED if study["stopped"]
+        else job_poller.JOB_STATE_SUCCEEDED
+    )
+    if store is not None:
+        store.write_summary(trials_dir, state)
+
+    best_trial = get_best_trial(trial_metrics, arguments["goal_type"])
+    assert best_trial, \
+    "No local trial succeeded, see logs in {}.".format(trials_dir)
+    return {
+        "job_name": trials_dir,
+        "state": job_poller.get_state_name(state),
+        "timeline": [],
+        "converged": study["stopped"],
+        "completed_trial_count": len(trial_metrics),
+        "best_trial": {"trial_id": best_trial[0], "metric_value": best_trial[1]}
+    }
+
+
+def submit_hyperparameter_tuning_job(arguments, client, hyperparameter_tuning_job):
+    """Submits tuning job, or reattaches to an earlier attempt's if any.
+
+    Args:
+        arguments: dict, command line arguments.
+        client: instance of `JobServiceClient`.
+        hyperparameter_tuning_job: dict, hyperparameter tuning job resource.
+
+    Returns:
+        Resource name of job.
+    """
+    parent = vertex_clients.get_parent(arguments)
+
+    def create_job():
+        response = client.create_hyperparameter_tuning_job(
+            parent=parent, hyperparameter_tuning_job=hyperparameter_tuning_job
+        )
+        print("response:", response)
+        return response.name
+
+    if not arguments["job_ledger_uri"]:
+        return create_job()
+
+    # Reattach to job submitted by an earlier attempt of this task.
+    job_key = job_ledger.compute_job_key(
+        {
+            k: v for k, v in hyperparameter_tuning_job.items()
+            if k != "display_name"
+        },
+        arguments["dag_run_id"]
     )
-    response = client.create_hyperparameter_tuning_job(
-        parent=parent, hyperparameter_tuning_job=hyperparameter_tuning_job
+    hyperparameter_tuning_job["labels"] = {job_ledger.job_key_label: job_key}
+    return job_ledger.resume_or_create_job(
+        arguments,
+        job_key,
+        create_job,
+        get_job=lambda name: client.get_hyperparameter_tuning_job(name=name),
+        list_jobs=lambda job_filter: client.list_hyperparameter_tuning_jobs(
+            request={"parent": parent, "filter": job_filter}
+        )
     )
-    print("response:", response)
 
-    # Wait for job to terminate.
-    running_states = set([1, 2, 3, 8])
-    completed_state = 4
-    while True:
-        state = client.get_hyperparameter_tuning_job(name=response.name).state
-        if state not in running_states:
-            break
-        time.sleep(arguments["job_polling_frequency"])
-    assert state == completed_state, "Job did not complete successfully."
 
+def create_hyperparameter_tuning_job(arguments):
+    # Local studies only need a client to warm start from an earlier job.
+    seed_trials = warm_start.apply_warm_start(
+        arguments,
+        get_job=lambda name: vertex_clients.get_client(
+            "job_service", arguments["region"]
+        ).get_hyperparameter_tuning_job(name=name)
+    )
+    if arguments["tuning_backend"] == "local":
+        return run_local_hyperparameter_tuning(arguments, seed_trials)
 
-if __name__ == "__main__":
-    arguments = parse_command_line_arguments()
+    # Initialize client that will be used to create and send requests.
+    # This client only needs to be created once, and can be reused for multiple requests.
+    client = vertex_clients.get_client("job_service", arguments["region"])
+    job_name = submit_hyperparameter_tuning_job(
+        arguments, client, build_hyperparameter_tuning_job(arguments)
+    )
+
+    # Wait for job to terminate, cancelling it early if it converges.
+    def cancel_job(name):
+        client.cancel_hyperparameter_tuning_job(name=name)
+
+    check_convergence, monitor = create_convergence_monitor(arguments, cancel_job)
+    store = trial_store.create_trial_store(arguments)
+
+    def on_poll(job):
+        if store is not None:
+            store.add_trials(job)
+        check_convergence(job)
+
+    job, timeline = job_poller.wait_for_job(
+        get_job=lambda name: client.get_hyperparameter_tuning_job(name=name),
+        job_name=job_name,
+        polling_config=job_poller.get_polling_config(arguments),
+        cancel_job=cancel_job,
+        on_poll=on_poll
+    )
+    assert job.state == job_poller.completed_state or (monitor["converged"] and job.state == job_poller.JOB_STATE_CANCELLED), \
+    "Job did not complete successfully."
+
+    if store is not None:
+        # Record the final job state even if no trials finished last poll.
+        store.write_summary(job.name, job.state)
+
+    best_trial = get_best_trial(monitor["trial_metrics"], arguments["goal_type"])
+    return {
+        "job_name": job_name,
+        "state": job_poller.get_state_name(job.state),
+        "timeline": timeline,
+        "converged": monitor["converged"],
+        "completed_trial_count": len(monitor["trial_metrics"]),
+        "best_trial": (
+            {"trial_id": best_trial[0], "metric_value": best_trial[1]}
+            if best_trial else None
+        )
+    }
+
+
+def run(arguments):
+    """Runs hyperparameter tuning job.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    rate_limiter.configure(arguments)
+    telemetry.configure(arguments, "vertex_hptuning")
     arguments["trainer_args"] = convert_trainer_args(
         arguments["trainer_args"]
     )
     print("arguments = {}".format(arguments))
 
-    create_hyperparameter_tuning_job(arguments)
+    result = create_hyperparameter_tuning_job(arguments)
+    print("Job timeline = {}".format(result["timeline"]))
+    print(
+        "Best trial of {} completed = {}{}".format(
+            result["completed_trial_count"],
+            result["best_trial"],
+            ", stopped early after converging" if result["converged"] else ""
+        )
+    )
+
+
+if __name__ == "__main__":
+    arguments = parse_command_line_arguments()
+    run(arguments)
@@ -0,0 +1,4 @@
+#!/bin/bash
+
+# Build from the repo root so shared modules in vertex_common can be copied.
+gcloud builds submit --config=cloudbuild.json ..
\ No newline at end of file
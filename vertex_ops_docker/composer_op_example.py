@@ -0,0 +1,38 @@
+vertex_ops_export_model_op = (
+    kubernetes_pod_operator.KubernetesPodOperator(
+        image="gcr.io/my-project/vertex_ops_image:latest",
+        name="vertex_ops_export_model_pod",
+        arguments=[
+            'export',
+            '--project=my-project',
+            '--region=us-central1',
+            '--model_display_name=docker_model',
+            '--export_format_id=custom-trained',
+            '--destination_type=gcs',
+            '--destination_path=gs://my-bucket/exported_models',
+        ],
+        namespace="default",
+        task_id="vertex_ops_export_model_task",
+        dag=test_dag
+    )
+)
+
+vertex_ops_pipeline_op = (
+    kubernetes_pod_operator.KubernetesPodOperator(
+        image="gcr.io/my-project/vertex_ops_image:latest",
+        name="vertex_ops_pipeline_pod",
+        arguments=[
+            'pipeline',
+            '--project=my-project',
+            '--region=us-central1',
+            '--stages=train,upload,deploy',
+            '--checkpoint_uri=gs://my-bucket/pipeline_checkpoints/{{ run_id }}.json',
+            '--train_args=\'{"ml_framework": "tensorflow", "job_display_name": "test-experiment", "pre_built_training_container_uri": "us-docker.pkg.dev/vertex-ai/training/tf-cpu.2-5:latest", "model_package_gcs_path": "gs://my-bucket/model_code/test_model-0.1.tar.gz", "python_module": "trainer.task", "trainer_args": {"train_file_pattern": "gs://my-bucket/data/train_data.csv*", "eval_file_pattern": "gs://my-bucket/data/eval_data.csv*", "output_dir": "gs://my-bucket/trained_models/tensorflow"}}\'',
+            '--upload_args=\'{"model_display_name": "docker_model"}\'',
+            '--deploy_args=\'{"endpoint_display_name": "docker_endpoint", "deployed_model_display_name": "docker_deployed_model"}\'',
+        ],
+        namespace="default",
+        task_id="vertex_ops_pipeline_task",
+        dag=test_dag
+    )
+)
@@ -0,0 +1,228 @@
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Services each subcommand talks to and a cheap list call to time the first
+# RPC, which includes channel setup and auth token fetching.
+subcommand_rpcs = {
+    "train": [("job_service", "list_custom_jobs")],
+    "hptune": [("job_service", "list_hyperparameter_tuning_jobs")],
+    "upload": [("model_service", "list_models")],
+    "deploy": [
+        ("endpoint_service", "list_endpoints"),
+        ("model_service", "list_models")
+    ],
+    "batch_predict": [
+        ("model_service", "list_models"),
+        ("job_service", "list_batch_prediction_jobs")
+    ],
+    "export": [("model_service", "list_models")]
+}
+
+# Runs in a fresh interpreter so nothing is already imported.
+child_code = """
+import json
+import time
+
+start = time.perf_counter()
+import vertex_ops
+import vertex_clients
+vertex_ops.load_subcommand({subcommand!r})
+cli_imported = time.perf_counter()
+
+clients = [
+    (vertex_clients.get_client(service, {region!r}), method)
+    for service, method in {rpcs!r}
+]
+clients_created = time.perf_counter()
+
+rpcs_done = clients_created
+if {project!r}:
+    parent = "projects/{{}}/locations/{{}}".format({project!r}, {region!r})
+    for client, method in clients:
+        next(iter(getattr(client, method)(
+            request={{"parent": parent, "page_size": 1}}
+        )), None)
+    rpcs_done = time.perf_counter()
+
+print(json.dumps({{
+    "cli_import_seconds": cli_imported - start,
+    "client_import_seconds": clients_created - cli_imported,
+    "first_rpc_seconds": rpcs_done - clients_created
+}}))
+"""
+
+# What every component paid at startup before imports were made lazy.
+sdk_child_code = """
+import json
+import time
+
+start = time.perf_counter()
+from google.cloud import aiplatform
+print(json.dumps({"sdk_import_seconds": time.perf_counter() - start}))
+"""
+
+
+def parse_command_line_arguments():
+    """Parses command line arguments and returns dictionary.
+
+    Returns:
+        Dictionary containing command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--subcommands",
+        help="Comma separated subcommands to benchmark.",
+        type=str,
+        default=",".join(subcommand_rpcs)
+    )
+    parser.add_argument(
+        "--repeats",
+        help="Number of fresh interpreters to time per subcommand.",
+        type=int,
+        default=5
+    )
+    parser.add_argument(
+        "--project",
+        help="GCP project to send first RPCs to. Empty skips RPCs.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--region",
+        help="Region of Vertex AI API endpoint.",
+        type=str,
+        default="us-central1"
+    )
+    parser.add_argument(
+        "--skip_sdk_baseline",
+        help="Whether to skip timing a full google.cloud.aiplatform import.",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--output_path",
+        help="Local or GCS path to write JSON results to.",
+        type=str,
+        default=""
+    )
+    return parser.parse_args().__dict__
+
+
+def get_python_path():
+    """Gets module search path of vertex_ops and its components.
+
+    In the image everything sits next to this file, in the repo the
+    components live in sibling directories.
+
+    Returns:
+        Module search path.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    repo_dirs = [
+        path
+        for path in sorted(glob.glob(os.path.join(os.path.dirname(here), "vertex_*")))
+        if os.path.isdir(path)
+    ]
+    return os.pathsep.join([here] + repo_dirs)
+
+
+def time_child(code):
+    """Times a fresh interpreter running code.
+
+    Args:
+        code: str, python code that prints JSON timings.
+
+    Returns:
+        Dictionary of timings including the whole process.
+    """
+    python_path = [get_python_path()]
+    if os.environ.get("PYTHONPATH"):
+        python_path.append(os.environ["PYTHONPATH"])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(python_path))
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["process_seconds"] = time.perf_counter() - start
+    return timings
+
+
+def summarize(samples):
+    """Summarizes timing samples per metric.
+
+    Args:
+        samples: list, dictionaries of timings.
+
+    Returns:
+        Dictionary of median and max per metric.
+    """
+    return {
+        metric: {
+            "median": statistics.median(sample[metric] for sample in samples),
+            "max": max(sample[metric] for sample in samples)
+        }
+        for metric in samples[0]
+    }
+
+
+def run_benchmark(arguments):
+    """Times startup of each subcommand in fresh interpreters.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of timing summaries keyed by subcommand.
+    """
+    results = {}
+    if not arguments["skip_sdk_baseline"]:
+        results["sdk_baseline"] = summarize(
+            [time_child(sdk_child_code) for _ in range(arguments["repeats"])]
+        )
+
+    for subcommand in arguments["subcommands"].split(","):
+        code = child_code.format(
+            subcommand=subcommand,
+            region=arguments["region"],
+            rpcs=subcommand_rpcs[subcommand],
+            project=arguments["project"]
+        )
+        results[subcommand] = summarize(
+            [time_child(code) for _ in range(arguments["repeats"])]
+        )
+    return results
+
+
+if __name__ == "__main__":
+    arguments = parse_command_line_arguments()
+    results = run_benchmark(arguments)
+    for name, summary in results.items():
+        print(
+            "{}: {}".format(
+                name,
+                ", ".join(
+                    "{} = {:.3f}s".format(metric, values["median"])
+                    for metric, values in summary.items()
+                )
+            )
+        )
+    if arguments["output_path"]:
+        # Imported here since, in the repo, shared modules are only on the
+        # path of child processes until now.
+        sys.path[:0] = get_python_path().split(os.pathsep)
+        import gcs_utils
+
+        gcs_utils.write_text(
+            arguments["output_path"], json.dumps(results, indent=2)
+        )
@@ -0,0 +1,69 @@
+import argparse
+import importlib
+import sys
+
+
+# Component module of each subcommand. Only the chosen one is imported, and
+# components import their gapic services lazily, so a short task like
+# export does not pay for loading the training code paths.
+subcommand_modules = {
+    "train": "vertex_train",
+    "hptune": "vertex_hptuning",
+    "upload": "vertex_upload_model",
+    "deploy": "vertex_deploy",
+    "batch_predict": "vertex_batch_predict",
+    "export": "vertex_export_model",
+    "pipeline": "vertex_pipeline"
+}
+
+
+def load_subcommand(subcommand):
+    """Imports component module of subcommand.
+
+    Args:
+        subcommand: str, name of subcommand.
+
+    Returns:
+        Component module.
+    """
+    return importlib.import_module(subcommand_modules[subcommand])
+
+
+def parse_command_line_arguments(argv):
+    """Parses subcommand and its command line arguments.
+
+    Args:
+        argv: list, command line arguments after the program name.
+
+    Returns:
+        Component module and dictionary containing command line arguments.
+    """
+    # Only parse the subcommand here, building every component's parser
+    # would import all of them.
+    parser = argparse.ArgumentParser(
+        usage="vertex_ops.py {{{}}} [arguments]".format(
+            ",".join(subcommand_modules)
+        )
+    )
+    parser.add_argument(
+        "subcommand",
+        help="Vertex AI operation to run.",
+        type=str,
+        choices=list(subcommand_modules)
+    )
+    args, component_argv = parser.parse_known_args(argv[:1])
+    component_argv += argv[1:]
+
+    module = load_subcommand(args.subcommand)
+    component_parser = argparse.ArgumentParser(
+        prog="vertex_ops.py {}".format(args.subcommand)
+    )
+    module.parse_arguments(component_parser)
+    arguments = component_parser.parse_args(component_argv).__dict__
+
+    return module, arguments
+
+
+if __name__ == "__main__":
+    module, arguments = parse_command_line_arguments(sys.argv[1:])
+    module.run(arguments)
@@ -0,0 +1,369 @@
+import argparse
+from datetime import datetime
+import hashlib
+import importlib
+import json
+
+import gcs_utils
+import rate_limiter
+import telemetry
+import vertex_clients
+
+
+# Stages in the order they run. Each takes the ID the previous one produced
+# in memory instead of looking it up by display name.
+pipeline_stages = ["train", "upload", "deploy", "batch_predict", "export"]
+
+stage_modules = {
+    "train": "vertex_train",
+    "upload": "vertex_upload_model",
+    "deploy": "vertex_deploy",
+    "batch_predict": "vertex_batch_predict",
+    "export": "vertex_export_model"
+}
+
+
+def load_stage(stage):
+    """Imports component module of stage.
+
+    Args:
+        stage: str, name of stage.
+
+    Returns:
+        Component module.
+    """
+    return importlib.import_module(stage_modules[stage])
+
+
+def parse_arguments(parser):
+    """Parses command line arguments.
+
+    Args:
+        parser: instance of `argparse.ArgumentParser`.
+    """
+    parser.add_argument(
+        "--project",
+        help="GCP project of all stages.",
+        type=str,
+        required=True
+    )
+    parser.add_argument(
+        "--region",
+        help="Region of all stages.",
+        type=str,
+        default="us-central1"
+    )
+    parser.add_argument(
+        "--stages",
+        help="Comma separated stages to run, in order, out of train, upload, deploy, batch_predict, and export.",
+        type=str,
+        default="train,upload,deploy"
+    )
+    parser.add_argument(
+        "--checkpoint_uri",
+        help="Local or GCS path of JSON checkpoint of stage outputs, i.e. per DAG run, to resume failed pipelines from.",
+        type=str,
+        default=""
+    )
+    for stage in pipeline_stages:
+        parser.add_argument(
+            "--{}_args".format(stage),
+            help="JSON dict of {} component arguments, without leading dashes.".format(
+                stage_modules[stage]
+            ),
+            type=json.loads,
+            default={}
+        )
+    rate_limiter.add_rate_limit_arguments(parser)
+    telemetry.add_telemetry_arguments(parser)
+
+
+def parse_command_line_arguments():
+    """Parses command line arguments and returns dictionary.
+
+    Returns:
+        Dictionary containing command line arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    # Add arguments to parser.
+    parse_arguments(parser)
+
+    # Parse all arguments.
+    args = parser.parse_args()
+    arguments = args.__dict__
+
+    return arguments
+
+
+def build_stage_arguments(module, stage_args):
+    """Builds stage arguments with the component's own parser.
+
+    This fills in the same defaults and runs the same validation as running
+    the component on its own.
+
+    Args:
+        module: component module of stage.
+        stage_args: dict, component arguments without leading dashes.
+
+    Returns:
+        Dictionary of stage arguments.
+    """
+    argv = []
+    for key, value in stage_args.items():
+        if value is True:
+            argv.append("--{}".format(key))
+        elif value is False:
+            continue
+        elif isinstance(value, (dict, list)):
+            argv.append("--{}={}".format(key, json.dumps(value)))
+        else:
+            argv.append("--{}={}".format(key, value))
+
+    parser = argparse.ArgumentParser(prog=module.__name__)
+    module.parse_arguments(parser)
+    return parser.parse_args(argv).__dict__
+
+
+def compute_stage_fingerprint(stage_args, upstream_outputs):
+    """Computes fingerprint of stage inputs for checkpoint invalidation.
+
+    Args:
+        stage_args: dict, component arguments of stage.
+        upstream_outputs: dict, outputs of earlier stages.
+
+    Returns:
+        Hex digest of stage inputs.
+    """
+    canonical_inputs = json.dumps(
+        {"stage_args": stage_args, "upstream_outputs": upstream_outputs},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(canonical_inputs.encode("utf-8")).hexdigest()
+
+
+def read_checkpoint(checkpoint_uri):
+    """Reads stage checkpoints.
+
+    Args:
+        checkpoint_uri: str, local or GCS path of checkpoint.
+
+    Returns:
+        Dictionary of checkpointed stages keyed by stage.
+    """
+    if not checkpoint_uri:
+        return {}
+    return gcs_utils.read_json(checkpoint_uri, default={})
+
+
+def write_checkpoint(checkpoint_uri, stage, fingerprint, outputs):
+    """Records outputs of completed stage.
+
+    Args:
+        checkpoint_uri: str, local or GCS path of checkpoint.
+        stage: str, name of stage.
+        fingerprint: str, fingerprint of stage inputs.
+        outputs: dict, outputs of stage.
+    """
+    if not checkpoint_uri:
+        return
+
+    def update(checkpoint):
+        checkpoint[stage] = {
+            "fingerprint": fingerprint,
+            "outputs": outputs,
+            "completed_at": datetime.utcnow().isoformat() + "Z"
+        }
+
+    gcs_utils.update_json(checkpoint_uri, update)
+
+
+class PipelineContext(object):
+    """Holds stage outputs passed between stages in memory.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    def __init__(self, arguments):
+        self.arguments = arguments
+        self.outputs = {}
+
+    def get_client(self, service):
+        """Gets pooled client of service, shared by all stages.
+
+        Args:
+            service: str, name of service, i.e. job_service.
+
+        Returns:
+            Instance of service client.
+        """
+        return vertex_clients.get_client(service, self.arguments["region"])
+
+    def get_model_id(self):
+        """Gets ID of model uploaded earlier in pipeline, if any.
+
+        Returns:
+            Model ID or empty string.
+        """
+        if "upload" not in self.outputs:
+            return ""
+        return self.outputs["upload"]["model_name"].split("/")[-1]
+
+
+def fill_stage_args(stage, stage_args, context):
+    """Fills in stage arguments known from earlier stages.
+
+    Arguments set explicitly are left as is.
+
+    Args:
+        stage: str, name of stage.
+        stage_args: dict, component arguments of stage.
+        context: instance of `PipelineContext`.
+
+    Returns:
+        Dictionary of filled in component arguments.
+    """
+    stage_args = dict(stage_args)
+    stage_args.setdefault("project", context.arguments["project"])
+    stage_args.setdefault("region", context.arguments["region"])
+
+    if stage == "upload":
+        train_args = context.arguments["train_args"]
+        if "ml_framework" in train_args:
+            stage_args.setdefault("ml_framework", train_args["ml_framework"])
+        if "train" in context.outputs and context.outputs["train"]["output_dir"]:
+            stage_args.setdefault(
+                "artifact_uri", context.outputs["train"]["output_dir"]
+            )
+    elif stage in ["deploy", "batch_predict", "export"]:
+        model_id = context.get_model_id()
+        if model_id and not stage_args.get("model_display_name"):
+            stage_args.setdefault("model_id", model_id)
+    return stage_args
+
+
+def run_stage(stage, module, stage_arguments, context):
+    """Runs stage in process with clients of the pipeline.
+
+    Args:
+        stage: str, name of stage.
+        module: component module of stage.
+        stage_arguments: dict, parsed component arguments of stage.
+        context: instance of `PipelineContext`.
+
+    Returns:
+        Dictionary of JSON serializable stage outputs.
+    """
+    if stage == "train":
+        assert not stage_arguments["job_configs_path"], \
+        "Pipelines train a single model, job_configs_path is not supported."
+        stage_arguments["trainer_args"] = module.convert_trainer_args(
+            stage_arguments["trainer_args"]
+        )
+        result = module.train_model(
+            stage_arguments, client=context.get_client("job_service")
+        )
+        return {
+            "job_name": result["job_name"],
+            "state": result["state"],
+            "output_dir": result["output_dir"],
+            "cache_hit": result["cache_hit"]
+        }
+    if stage == "upload":
+        model_name = module.upload_model(
+            stage_arguments, client=context.get_client("model_service")
+        )
+        return {"model_name": model_name}
+    if stage == "deploy":
+        result = module.deploy_model(
+            stage_arguments,
+            endpoint_client=context.get_client("endpoint_service"),
+            model_client=context.get_client("model_service")
+        )
+        assert result, "Model to deploy does NOT exist."
+        return result
+    if stage == "batch_predict":
+        result = module.batch_predict_from_deployed_model(
+            stage_arguments,
+            model_client=context.get_client("model_service"),
+            job_client=context.get_client("job_service")
+        )
+        assert result, "Model to batch predict with does NOT exist."
+        if stage_arguments["compact_output_uri"]:
+            result["compacted_uris"] = module.compact_predictions(
+                stage_arguments, result
+            )
+        return result
+    response = module.export_model(
+        stage_arguments, client=context.get_client("model_service")
+    )
+    assert response is not None, "Model to export does NOT exist."
+    return {"export_response": str(response)}
+
+
+def run_pipeline(arguments):
+    """Runs stages in order, resuming from the checkpoint if there is one.
+
+    A checkpointed stage is skipped if its inputs, including outputs of
+    earlier stages, are unchanged. Otherwise it and every later stage rerun.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of stage outputs keyed by stage.
+    """
+    stages = arguments["stages"].split(",")
+    unknown_stages = [stage for stage in stages if stage not in pipeline_stages]
+    assert not unknown_stages, \
+    "Unknown stages {}. Choices are {}.".format(unknown_stages, pipeline_stages)
+    stages = [stage for stage in pipeline_stages if stage in stages]
+
+    context = PipelineContext(arguments)
+    checkpoint = read_checkpoint(arguments["checkpoint_uri"])
+    resuming = True
+    for stage in stages:
+        stage_args = fill_stage_args(
+            stage, arguments["{}_args".format(stage)], context
+        )
+        fingerprint = compute_stage_fingerprint(stage_args, context.outputs)
+        checkpointed = checkpoint.get(stage)
+        if resuming and checkpointed and checkpointed["fingerprint"] == fingerprint:
+            print(
+                "Skipping stage {} completed at {}.".format(
+                    stage, checkpointed["completed_at"]
+                )
+            )
+            context.outputs[stage] = checkpointed["outputs"]
+            continue
+        resuming = False
+
+        print("Running stage {}.".format(stage))
+        module = load_stage(stage)
+        outputs = run_stage(
+            stage, module, build_stage_arguments(module, stage_args), context
+        )
+        print("Stage {} outputs = {}".format(stage, outputs))
+        write_checkpoint(arguments["checkpoint_uri"], stage, fingerprint, outputs)
+        context.outputs[stage] = outputs
+    return context.outputs
+
+
+def run(arguments):
+    """Runs pipeline.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    rate_limiter.configure(arguments)
+    telemetry.configure(arguments, "vertex_pipeline")
+    print("arguments = {}".format(arguments))
+    outputs = run_pipeline(arguments)
+    print("Pipeline outputs = {}".format(outputs))
+
+
+if __name__ == "__main__":
+    arguments = parse_command_line_arguments()
+    run(arguments)
@@ -1,9 +1,16 @@
 import argparse
 from datetime import datetime
 import json
-import time
 
-from google.cloud import aiplatform
+import gcs_utils
+import hardware_catalog
+import job_ledger
+import job_poller
+import rate_limiter
+import result_cache
+import telemetry
+import vertex_clients
+import worker_pools
 
 
 def convert_trainer_args(trainer_args):
@@ -96,18 +103,32 @@ def parse_arguments(parser):
         type=int,
         default=0
     )
-    parser.add_argument(
-        "--job_polling_frequency",
-        help="Number of seconds to wait between job status polls.",
-        type=int,
-        default=15
-    )
     parser.add_argument(
         "--trainer_args",
         help="Args used by the trainer application",
         type=json.loads,
         default=""
     )
+    parser.add_argument(
+        "--job_configs_path",
+        help="Local or GCS path of JSONL file of per job argument overrides.",
+        type=str,
+        default=""
+    )
+    parser.add_argument(
+        "--max_concurrent_submissions",
+        help="Max number of jobs to submit or poll at once.",
+        type=int,
+        default=10
+    )
+    worker_pools.add_worker_pool_arguments(parser)
+    hardware_catalog.add_hardware_arguments(parser)
+    job_poller.add_polling_arguments(parser)
+    job_ledger.add_ledger_arguments(parser)
+    result_cache.add_cache_arguments(parser)
+    rate_limiter.add_rate_limit_arguments(parser)
+    telemetry.add_telemetry_arguments(parser)
+
 
 def parse_command_line_arguments():
     """Parses command line arguments and returns dictionary.
@@ -127,7 +148,15 @@ def parse_command_line_arguments():
     return arguments
 
 
-def train_model(arguments):
+def build_custom_job(arguments):
+    """Builds custom job resource from arguments.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of custom job resource.
+    """
     assert arguments["pre_built_training_container_uri"] or arguments["custom_training_container_uri"], \
     "Must use either a pre-built or custom training image."
     assert not (arguments["pre_built_training_container_uri"] and arguments["custom_training_container_uri"]), \
@@ -140,35 +169,6 @@ def train_model(arguments):
         assert arguments["custom_training_container_uri"], \
         "Must use custom training container if using non-native Vertex AI ML framework."
 
-    # Get accelerator_type.
-    accelerator_map = {
-        "NVIDIA_TESLA_K80": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_K80,
-        "NVIDIA_TESLA_P100": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_P100,
-        "NVIDIA_TESLA_V100": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_V100,
-        "NVIDIA_TESLA_P4": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_P4,
-        "NVIDIA_TESLA_T4": aiplatform.gapic.AcceleratorType.NVIDIA_TESLA_T4
-    }
-    accelerator_type = accelerator_map.get(arguments["accelerator_type"])
-    if accelerator_type is None:
-        accelerator_type = aiplatform.gapic.AcceleratorType.ACCELERATOR_TYPE_UNSPECIFIED
-
-    # The AI Platform services require regional API endpoints.
-    client_options = {
-        "api_endpoint": "{}-aiplatform.googleapis.com".format(
-            arguments["region"]
-        )
-    }
-
-    # Initialize client that will be used to create and send requests.
-    # This client only needs to be created once, and can be reused for multiple requests.
-    client = aiplatform.gapic.JobServiceClient(client_options=client_options)
-
-    machine_spec = {
-        "machine_type": arguments["machine_type"],
-        "accelerator_type": accelerator_type,
-        "accelerator_count": arguments["accelerator_count"],
-    }
-
     python_package_spec = {}
     if arguments["pre_built_training_container_uri"]:
         python_package_spec.update(
@@ -191,18 +191,9 @@ def train_model(arguments):
             }
         )
 
-    worker_pool_specs = [
-        {
-            "machine_spec": machine_spec,
-            "replica_count": arguments["replica_count"]
-        }
-    ]
-
-    for worker_pool_spec in worker_pool_specs:
-        if python_package_spec:
-            worker_pool_spec["python_package_spec"] = python_package_spec
-        else:
-            worker_pool_spec["container_spec"] = container_spec
+    worker_pool_specs = worker_pools.build_worker_pool_specs(
+        arguments, python_package_spec, container_spec
+    )
 
     custom_job = {
         "display_name": arguments["job_display_name"],
@@ -211,30 +202,335 @@ def train_model(arguments):
         }
     }
 
-    parent = "projects/{}/locations/{}".format(
-        arguments["project"], arguments["region"]
+    return custom_job
+
+
+def submit_custom_job(arguments, client, custom_job):
+    """Submits custom job, or reattaches to an earlier attempt's if any.
+
+    Args:
+        arguments: dict, command line arguments.
+        client: instance of `JobServiceClient`.
+        custom_job: dict, custom job resource.
+
+    Returns:
+        Resource name of job.
+    """
+    parent = vertex_clients.get_parent(arguments)
+
+    def create_job():
+        response = client.create_custom_job(parent=parent, custom_job=custom_job)
+        print("Response:", response)
+        return response.name
+
+    if not arguments["job_ledger_uri"]:
+        return create_job()
+
+    # Reattach to job submitted by an earlier attempt of this task.
+    job_key = job_ledger.compute_job_key(
+        custom_job["job_spec"],
+        arguments["dag_run_id"]
+    )
+    custom_job["labels"] = {job_ledger.job_key_label: job_key}
+    return job_ledger.resume_or_create_job(
+        arguments,
+        job_key,
+        create_job,
+        get_job=lambda name: client.get_custom_job(name=name),
+        list_jobs=lambda job_filter: client.list_custom_jobs(
+            request={"parent": parent, "filter": job_filter}
+        )
     )
-    response = client.create_custom_job(parent=parent, custom_job=custom_job)
-    print("Response:", response)
+
+
+def train_model(arguments, client=None):
+    """Trains model with a custom job and waits for it.
+
+    Args:
+        arguments: dict, command line arguments with converted trainer args.
+        client: instance of `JobServiceClient` to reuse, if any.
+
+    Returns:
+        Dictionary of job name, final state, timeline, output directory and
+        whether the result came from the cache.
+    """
+    custom_job = build_custom_job(arguments)
+    output_dir = result_cache.get_trainer_arg(
+        arguments["trainer_args"] or [], arguments["cache_output_arg"]
+    )
+
+    # Skip training if an identical job already succeeded on the same data.
+    cache_key = None
+    if arguments["result_cache_uri"]:
+        cache_key = result_cache.compute_cache_key(
+            custom_job["job_spec"]["worker_pool_specs"],
+            result_cache.get_input_uris(arguments)
+        )
+        cached_result = (
+            None if arguments["force_retrain"]
+            else result_cache.lookup_result(arguments, cache_key)
+        )
+        if cached_result:
+            print(
+                "Reusing output {} of job {}.".format(
+                    cached_result["output_dir"], cached_result["job_name"]
+                )
+            )
+            return {
+                "job_name": cached_result["job_name"],
+                "state": job_poller.get_state_name(job_poller.completed_state),
+                "timeline": [],
+                "output_dir": cached_result["output_dir"],
+                "cache_hit": True
+            }
+
+    # Initialize client that will be used to create and send requests.
+    # This client only needs to be created once, and can be reused for multiple requests.
+    if client is None:
+        client = vertex_clients.get_client("job_service", arguments["region"])
+
+    job_name = submit_custom_job(arguments, client, custom_job)
 
     # Wait for job to terminate.
-    running_states = set([1, 2, 3, 8])
-    completed_state = 4
-    while True:
-        state = client.get_custom_job(name=response.name).state
-        if state not in running_states:
-            break
-        time.sleep(arguments["job_polling_frequency"])
-    assert state == completed_state, "Job did not complete successfully."
+    job, timeline = job_poller.wait_for_job(
+        get_job=lambda name: client.get_custom_job(name=name),
+        job_name=job_name,
+        polling_config=job_poller.get_polling_config(arguments),
+        cancel_job=lambda name: client.cancel_custom_job(name=name)
+    )
+    assert job.state == job_poller.completed_state, \
+    "Job did not complete successfully."
+
+    if cache_key:
+        result_cache.store_result(arguments, cache_key, job_name, output_dir)
+
+    return {
+        "job_name": job_name,
+        "state": job_poller.get_state_name(job.state),
+        "timeline": timeline,
+        "output_dir": output_dir,
+        "cache_hit": False
+    }
+
+
+def read_job_configs(job_configs_path):
+    """Reads per job argument overrides.
+
+    Args:
+        job_configs_path: str, local or GCS path of JSONL file.
+
+    Returns:
+        List of dictionaries of argument overrides.
+    """
+    return [
+        json.loads(line)
+        for line in gcs_utils.read_text(job_configs_path).splitlines()
+        if line.strip()
+    ]
+
+
+def build_job_arguments(arguments, job_config, index):
+    """Builds arguments of one job from base arguments and overrides.
+
+    Args:
+        arguments: dict, command line arguments.
+        job_config: dict, argument overrides of job. `trainer_args` are
+            merged into the base trainer args rather than replacing them.
+        index: int, index of job.
+
+    Returns:
+        Dictionary of job arguments.
+    """
+    job_arguments = dict(arguments)
+    job_arguments["job_display_name"] = "{}-{}".format(
+        arguments["job_display_name"], index
+    )
+    job_arguments.update(
+        {k: v for k, v in job_config.items() if k != "trainer_args"}
+    )
+    trainer_args = dict(arguments["trainer_args"] or {})
+    trainer_args.update(job_config.get("trainer_args", {}))
+    job_arguments["trainer_args"] = convert_trainer_args(trainer_args)
+    return job_arguments
+
+
+async def submit_and_wait_for_jobs(arguments, job_arguments_list):
+    """Submits jobs concurrently then waits on all of them from one loop.
+
+    Args:
+        arguments: dict, command line arguments.
+        job_arguments_list: list, dictionaries of job arguments.
+
+    Returns:
+        List of dictionaries of per job results.
+    """
+    # Imported here since asyncio is slow to import and single jobs skip it.
+    import asyncio
+
+    # Job configs can override region, jobs must be created and polled there.
+    clients = {
+        region: vertex_clients.get_client("job_service", region, use_async=True)
+        for region in set(
+            job_arguments["region"] for job_arguments in job_arguments_list
+        )
+    }
+    semaphore = asyncio.Semaphore(arguments["max_concurrent_submissions"])
+
+    def get_client(job_name):
+        # Job names look like projects/p/locations/region/customJobs/id.
+        return clients[job_name.split("/")[3]]
+
+    async def submit(job_arguments, index):
+        client = clients[job_arguments["region"]]
+        parent = vertex_clients.get_parent(job_arguments)
+        custom_job = build_custom_job(job_arguments)
+
+        async def create_job():
+            response = await client.create_custom_job(
+                parent=parent, custom_job=custom_job
+            )
+            print("Created job {}".format(response.name))
+            return response.name
+
+        async def list_jobs(job_filter):
+            pager = await client.list_custom_jobs(
+                request={"parent": parent, "filter": job_filter}
+            )
+            return [job async for job in pager]
+
+        async with semaphore:
+            if not job_arguments["job_ledger_uri"]:
+                return await create_job()
+            # Reattach to job submitted by an earlier attempt of this task.
+            # Identical job configs are still separate jobs.
+            job_key = job_ledger.compute_job_key(
+                {"job_spec": custom_job["job_spec"], "job_index": index},
+                job_arguments["dag_run_id"]
+            )
+            custom_job["labels"] = {job_ledger.job_key_label: job_key}
+            return await job_ledger.resume_or_create_job_async(
+                job_arguments,
+                job_key,
+                create_job,
+                get_job=lambda name: client.get_custom_job(name=name),
+                list_jobs=list_jobs
+            )
+
+    submissions = await asyncio.gather(
+        *[
+            submit(job_arguments, index)
+            for index, job_arguments in enumerate(job_arguments_list)
+        ],
+        return_exceptions=True
+    )
+    job_names = [
+        job_name for job_name in submissions if isinstance(job_name, str)
+    ]
+    watch_results = await job_poller.wait_for_jobs_async(
+        get_job=lambda name: get_client(name).get_custom_job(name=name),
+        job_names=job_names,
+        polling_config=job_poller.get_polling_config(arguments),
+        cancel_job=lambda name: get_client(name).cancel_custom_job(name=name),
+        max_concurrent_polls=arguments["max_concurrent_submissions"]
+    )
+
+    results = []
+    for job_arguments, submission in zip(job_arguments_list, submissions):
+        result = {"job_display_name": job_arguments["job_display_name"]}
+        if not isinstance(submission, str):
+            result.update(
+                {
+                    "job_name": None,
+                    "state": None,
+                    "timeline": [],
+                    "error": str(submission)
+                }
+            )
+        else:
+            watch_result = watch_results[submission]
+            job = watch_result["job"]
+            result.update(
+                {
+                    "job_name": submission,
+                    "state": (
+                        job_poller.get_state_name(job.state) if job else None
+                    ),
+                    "timeline": watch_result["timeline"],
+                    "error": (
+                        str(watch_result["error"]) if watch_result["error"]
+                        else job.error.message or None
+                    )
+                }
+            )
+        results.append(result)
+    return results
+
+
+def train_models(arguments):
+    """Trains one model per job config concurrently.
+
+    Args:
+        arguments: dict, command line arguments with unconverted trainer args.
+
+    Returns:
+        List of dictionaries of per job results.
+    """
+    if arguments["job_ledger_uri"]:
+        # Fail before submitting rather than once per job.
+        job_ledger.check_dag_run_id(arguments["dag_run_id"])
+    job_arguments_list = [
+        build_job_arguments(arguments, job_config, index)
+        for index, job_config in enumerate(
+            read_job_configs(arguments["job_configs_path"])
+        )
+    ]
+    import asyncio
+
+    results = asyncio.run(
+        submit_and_wait_for_jobs(arguments, job_arguments_list)
+    )
+    for result in results:
+        print(
+            "Job {} ({}) state = {}".format(
+                result["job_display_name"], result["job_name"], result["state"]
+            )
+        )
+
+    failed_results = [
+        result for result in results
+        if result["state"] != job_poller.get_state_name(job_poller.completed_state)
+    ]
+    assert not failed_results, \
+    "{} of {} jobs did not complete successfully.".format(
+        len(failed_results), len(results)
+    )
+    return results
+
+
+def run(arguments):
+    """Trains one model, or many concurrently if given job configs.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    rate_limiter.configure(arguments)
+    telemetry.configure(arguments, "vertex_train")
+    # Train many models concurrently if given job configs.
+    if arguments["job_configs_path"]:
+        print("arguments = {}".format(arguments))
+        train_models(arguments)
+    else:
+        arguments["trainer_args"] = convert_trainer_args(
+            arguments["trainer_args"]
+        )
+        print("arguments = {}".format(arguments))
+
+        # Train model with configs.
+        result = train_model(arguments)
+        print("Job timeline = {}".format(result["timeline"]))
 
 
 if __name__ == "__main__":
     # Parse command line arguments.
     arguments = parse_command_line_arguments()
-    arguments["trainer_args"] = convert_trainer_args(
-        arguments["trainer_args"]
-    )
-    print("arguments = {}".format(arguments))
-
-    # Train model with configs.
-    train_model(arguments)
+    run(arguments)
@@ -1,6 +1,15 @@
 import argparse
 
-from google.cloud import aiplatform
+import rate_limiter
+import resource_index
+import telemetry
+import vertex_clients
+
+
+# ML frameworks Vertex AI has pre-built serving containers for.
+vertex_native_ml_frameworks = set(
+    ["tensorflow", "pytorch", "xgboost", "sklearn"]
+)
 
 
 def parse_arguments(parser):
@@ -58,6 +67,9 @@ def parse_arguments(parser):
         type=str,
         default="/predict"
     )
+    resource_index.add_index_arguments(parser)
+    rate_limiter.add_rate_limit_arguments(parser)
+    telemetry.add_telemetry_arguments(parser)
 
 
 def parse_command_line_arguments():
@@ -78,10 +90,36 @@ def parse_command_line_arguments():
     return arguments
 
 
-def upload_model(arguments):
-    vertex_native_ml_frameworks = set(
-        ["tensorflow", "pytorch", "xgboost", "sklearn"]
-    )
+def build_container_spec(arguments):
+    """Builds serving container spec of model.
+
+    Args:
+        arguments: dict, command line arguments.
+
+    Returns:
+        Dictionary of container spec.
+    """
+    container_spec = {"image_uri": arguments["serving_container_image_uri"]}
+    if arguments["ml_framework"] not in vertex_native_ml_frameworks:
+        container_spec.update(
+            {
+                "predict_route": arguments["custom_serving_container_predict_route"],
+                "health_route": arguments["custom_serving_container_health_route"]
+            }
+        )
+    return container_spec
+
+
+def upload_model(arguments, client=None):
+    """Uploads model to Vertex AI.
+
+    Args:
+        arguments: dict, command line arguments.
+        client: instance of `ModelServiceClient` to reuse, if any.
+
+    Returns:
+        Resource name of uploaded model.
+    """
     if arguments["ml_framework"] not in vertex_native_ml_frameworks:
         prebuilt_prefixes = set(
             [
@@ -98,41 +136,47 @@ def upload_model(arguments):
         "Must use custom prediction container if using non-native Vertex AI ML framework."
 
     # Initialize.
-    aiplatform.init(
-        project=arguments["project"], location=arguments["region"]
-    )
+    if client is None:
+        client = vertex_clients.get_client("model_service", arguments["region"])
+    parent = vertex_clients.get_parent(arguments)
 
     # Next upload model.
-    model_display_name = arguments["model_display_name"]
-    model_name_match = aiplatform.Model.list(
-        filter="display_name={}".format(model_display_name)
-    )
-    if model_name_match:
-        print(
-            "Model with name {} already exists!".format(
-                model_display_name
-            )
-        )
-        model_display_name = "{}_0".format(model_display_name)
+    response = client.upload_model(
+        parent=parent,
+        model={
+            "display_name": resource_index.get_new_display_name(
+                arguments,
+                "models",
+                client,
+                parent,
+                arguments["model_display_name"]
+            ),
+            "artifact_uri": arguments["artifact_uri"],
+            "container_spec": build_container_spec(arguments)
+        }
+    ).result()
+    model_id = response.model.split("/")[-1]
+    print("Model ID = {}".format(model_id))
 
-    if arguments["ml_framework"] in vertex_native_ml_frameworks:
-        response = aiplatform.Model.upload(
-            display_name=model_display_name,
-            serving_container_image_uri=arguments["serving_container_image_uri"],
-            artifact_uri=arguments["artifact_uri"]
-        )
-    else:
-        response = aiplatform.Model.upload(
-            display_name=model_display_name,
-            serving_container_image_uri=arguments["serving_container_image_uri"],
-            serving_container_predict_route=arguments["custom_serving_container_predict_route"],
-            serving_container_health_route=arguments["custom_serving_container_health_route"],
-            artifact_uri=arguments["artifact_uri"]
+    if arguments["resource_index_uri"]:
+        resource_index.record_resource(
+            arguments, "models", parent, client.get_model(name=response.model)
         )
-    model_id = response.name.split("/")[-1]
-    print("Model ID = {}".format(model_id))
+
+    return response.model
+
+
+def run(arguments):
+    """Uploads model.
+
+    Args:
+        arguments: dict, command line arguments.
+    """
+    rate_limiter.configure(arguments)
+    telemetry.configure(arguments, "vertex_upload_model")
+    upload_model(arguments)
 
 
 if __name__ == "__main__":
     arguments = parse_command_line_arguments()
-    upload_model(arguments)
+    run(arguments)